@@ -4,17 +4,34 @@ import time
 import sys
 import readline
 import argparse
-import numexpr
 import traceback
 from scarelib import *
+from scaretrace import scaretrace
+from scareprofile import scareprofile
+from scarebreak import scarebreak, breakAddr
 
 parser = argparse.ArgumentParser(description="")
 parser.add_argument('-a', dest='arch', help='Target architecture')
 parser.add_argument('-c', dest='cpu', help='Target cpu')
 parser.add_argument('-f', dest='inFile', help='File to read')
+parser.add_argument('-e', dest='binFile', help='ELF or raw binary to load and run, the arch comes from the ELF if -a is not given')
 parser.add_argument('--base', type=lambda x: parseInt(x), dest='baseaddr', help='Base Address (default: 0x400000)')
 parser.add_argument('--stack', type=lambda x: parseInt(x), dest='stackaddr', help='Stack Address (default: 0x401000)')
-parser.add_argument('--memsize', dest='memsize', help='Emulator Memory Size (default: 0x800000 [8MB])')
+parser.add_argument('--memsize', type=lambda x: parseInt(x), dest='memsize', help='Emulator Memory Size (default: 0x800000 [8MB])')
+parser.add_argument('--batch', dest='batch', nargs='+', metavar='PATH', help='Run .asm files or directories without the REPL, one JSON record per file')
+parser.add_argument('--fuzz', dest='fuzz', metavar='FILE', help='Run the .asm FILE once for every --in value without the REPL, JSON records of failed runs are written')
+parser.add_argument('--in', dest='fuzzIn', action='append', default=[], metavar='NAME=VALUE', help='Fuzz input, NAME is a register or ADDR:SIZE, VALUE is N, LO-HI (every value), rand or rand:LO-HI (repeatable)')
+parser.add_argument('--out', dest='fuzzOut', action='append', default=[], metavar='NAME', help='Fuzz output to collect, a register or ADDR:SIZE (repeatable)')
+parser.add_argument('--check', dest='check', metavar='EXPR', help='Fuzz check, a Python expression of the outputs and inp[NAME] that a run must make true')
+parser.add_argument('--entry', dest='entry', type=int, metavar='LINE', help='Fuzz runs start at this line of the file (default: 1)')
+parser.add_argument('-n', dest='runs', type=int, help='Fuzz runs (default: every combination of the LO-HI inputs, 10000 with rand inputs)')
+parser.add_argument('--seed', dest='seed', type=int, default=0, help='Fuzz random seed (default: 0)')
+parser.add_argument('--matrix', dest='matrix', metavar='FILE', help='Run the .asm FILE on every cpu model of the arch and show what differs, without the REPL')
+parser.add_argument('--cpus', dest='cpus', metavar='CPU,...', help='Cpu models for --matrix (default: all of them)')
+parser.add_argument('--serve', dest='serve', metavar='SOCKET', help='Serve emulator sessions over a Unix socket with a JSON line protocol instead of the REPL')
+parser.add_argument('-o', dest='outFile', help='Batch, fuzz or matrix (JSON records) output file (default: stdout)')
+parser.add_argument('-j', dest='jobs', type=int, help='Batch, fuzz, matrix or serve worker processes (default: number of cores)')
+parser.add_argument('--mem', dest='memRanges', action='append', default=[], metavar='ADDR:SIZE', help='Batch memory range to dump, ADDR can be $register (repeatable)')
 
 ## Commands
 cmdQuit = ["/exit", "/x", "/quit", "/q"]
@@ -22,8 +39,23 @@ cmdHelp = ["/", "/help", "/?", "/h"]
 cmdConf = ["/config", "/c"]
 cmdPList= ["/list", "/l"]
 
-def parseInt(x):
-    return int(numexpr.evaluate(x).item())
+# parseMemRange - Parse ADDR:SIZE for --mem, ADDR stays a string if it's a $register
+def parseMemRange(x):
+    addr, size = x.rsplit(":", 1)
+    return (addr if addr.startswith("$") else parseInt(addr)), parseInt(size)
+
+# loadBin - Load a binary into smu and run it, printing the registers and stats like a line does
+def loadBin(smu, fname):
+    try:
+        entry = smu.loadBin(fname)
+    except (OSError, ValueError, UcError) as e:
+        print(f"Couldn't load {fname}: {e}")
+        return
+    print(f"Loaded {fname}, entry point {entry:#x}")
+    pc, runStatus = smu.runBin(entry)
+    if runStatus != 1:
+        smu.printRegs()
+    smu.printRunStats()
 
 # parseCmd
 # Commands must start with / to be parsed
@@ -31,6 +63,8 @@ def parseInt(x):
 # If 1 is returned, then the main command loop should try to assemble the input
 # If 2 is returned, the main command loop should not append the current command and just assemble and run
 # If 3 is returned, reinitialize the scaremu
+# If 4 is returned, the main command loop should assemble and run the whole program from a clean state
+# If 5 is returned, switch to the scaremu a snapshot was loaded into, see /snapshot
 def parseCmd(cmd, smu):
     shouldAssemble = 1
     if len(cmd) > 0:
@@ -54,7 +88,6 @@ def parseCmd(cmd, smu):
                     if cfgOptName in sConfig.keys():
                         third = ("/"+cfgOptExtra) if cfgOptExtra != "" else ""
                         print(f"{cfgOptName}->{cfgOptVal}{third}")
-                        # TODO: Keep better track of config option types
                         if cfgOptName == "emu/arch":
                             okArch = cfgOptVal in archez.keys()
                             if okArch:
@@ -63,11 +96,19 @@ def parseCmd(cmd, smu):
                                     sConfig[cfgOptName] = cfgOptVal
                                     sConfig["emu/cpu"] = cfgOptExtra
                                 else:
-                                    print(f"Invalid cpu! Supported cpus: {arch["cpus"].keys()}")
+                                    print(f"Invalid cpu! Supported cpus: {arch['cpus'].keys()}")
                             else:
                                 print(f"Invalid arch! Supported arches: {archez.keys()}")
                         else:
-                            sConfig[cfgOptName] = parseInt(cfgOptVal)
+                            oldVal = sConfig[cfgOptName]
+                            try:
+                                sConfig[cfgOptName] = configParse(cfgOptName, cfgOptVal)
+                                if smu and sConfig[cfgOptName] != oldVal and smu.setConfig(cfgOptName):
+                                    print(f"Rebuilt the emulator for {cfgOptName}, running the program again")
+                                    shouldAssemble = 4
+                            except (ValueError, UcError) as e:
+                                sConfig[cfgOptName] = oldVal
+                                print(f"Couldn't set {cfgOptName}: {e}")
                     else:
                         print("Invalid config opt name!")
                 except Exception as e:
@@ -112,71 +153,221 @@ def parseCmd(cmd, smu):
             else:
                 print("Please specify a filename!")
 
+        if cmdList[0] == "/loadelf":
+            if cmdListLen > 1:
+                loadBin(smu, cmdList[1])
+            else:
+                print("Please specify a filename!")
+
         if cmdList[0] == "/save":
             if cmdListLen > 1:
                 saveAsm(smu.asm_code, cmdList[1])
             else:
                 print("Please specify a filename!")
 
+        if cmdList[0] == "/snapshot":
+            if cmdListLen == 3 and cmdList[1] == "save":
+                if smu:
+                    try:
+                        saved = snapshotSave(smu, cmdList[2])
+                        print(f"Saved {saved} pages to {cmdList[2]}")
+                    except (OSError, UcError) as e:
+                        print(f"Couldn't save {cmdList[2]}: {e}")
+                else:
+                    print("No emulator running!")
+            elif cmdListLen == 3 and cmdList[1] == "load":
+                try:
+                    snapshotLoad(cmdList[2])
+                    shouldAssemble = 5
+                except (OSError, ValueError, KeyError, EOFError, UcError) as e:
+                    print(f"Couldn't load {cmdList[2]}: {e}")
+            else:
+                print("Usage: /snapshot save|load FILE")
+
+        if cmdList[0] == "/stdin":
+            if smu:
+                if cmdListLen > 1:
+                    smu.sys.stdin += cmd.split(None, 1)[1].encode() + b"\n"
+                print(f"{len(smu.sys.stdin)} bytes queued for fd 0: {bytes(smu.sys.stdin)!r}")
+            else:
+                print("No emulator running!")
+
         if cmdList[0] == "/run":
-            shouldAssemble = 2 # Reassemble and run
+            shouldAssemble = 4 # Reassemble and run from the start
 
         if cmdList[0] == "/reset":
             shouldAssemble = 3 # Reinitialize 
 
+        if cmdList[0] == "/stepback" and not sConfig["undo/size"]:
+            print("The undo log is off, turn it on with /c undo/size 0x1000000 and run the code again")
+        elif cmdList[0] == "/stepback":
+            try:
+                n = parseInt(cmdList[1]) if cmdListLen > 1 else 1
+                done = smu.stepBack(n)
+                if done:
+                    smu.printRegs()
+                print(f"Stepped back {done} instructions" + ("" if done == n else " (start of the undo log)"))
+            except Exception as e:
+                print(e)
+                print("Usage: /stepback [N]")
+
+        if cmdList[0] == "/break":
+            try:
+                if smu.breaks is None:
+                    smu.breaks = scarebreak()
+                if cmdListLen == 1:
+                    smu.breaks.info()
+                elif cmdListLen == 2 or (cmdListLen > 3 and cmdList[2] == "if"):
+                    addr = breakAddr(smu, cmdList[1])
+                    expr = cmd.split(None, 3)[3] if cmdListLen > 3 else None
+                    print(f"Breakpoint {smu.breaks.addBreak(smu, addr, expr)} at {addr:#x}")
+                else:
+                    print("Usage: /break [{0xaddress|$register|label} [if EXPR]]")
+            except Exception as e:
+                print(e)
+                print("Usage: /break [{0xaddress|$register|label} [if EXPR]]")
+
+        if cmdList[0] == "/watch":
+            try:
+                if smu.breaks is None:
+                    smu.breaks = scarebreak()
+                if cmdListLen == 3 or cmdListLen == 4:
+                    addr = breakAddr(smu, cmdList[1])
+                    num = smu.breaks.addWatch(smu, addr, parseInt(cmdList[2]), cmdList[3] if cmdListLen == 4 else "w")
+                    print(f"Watchpoint {num} at {addr:#x}")
+                else:
+                    print("Usage: /watch {0xaddress|$register|label} LEN [r|w|rw]")
+            except Exception as e:
+                print(e)
+                print("Usage: /watch {0xaddress|$register|label} LEN [r|w|rw]")
+
+        if cmdList[0] == "/delete":
+            try:
+                n = smu.breaks.delete(parseInt(cmdList[1]) if cmdListLen > 1 else None) if smu.breaks else 0
+                print(f"Deleted {n} breakpoints and watchpoints")
+            except Exception as e:
+                print(f"No breakpoint or watchpoint {e}")
+
+        if cmdList[0] == "/continue":
+            res = smu.cont() if smu else None
+            if res is None:
+                print("Nothing to continue, the last run didn't stop at a breakpoint or watchpoint")
+            else:
+                pc, runStatus = res
+                if runStatus != 1:
+                    smu.printRegs(changed=sConfig["regs/changed"])
+                smu.printRunStats()
+
+        if cmdList[0] == "/matrix":
+            try:
+                if len(smu.machine_code) > 0:
+                    import scarematrix # Pulls in multiprocessing, so only load it when it's used
+                    cpus = scarematrix.matrixCpus(smu.arch_name, cmdList[1:])
+                    scarematrix.matrixReport(smu.arch_name, scarematrix.matrixRun(smu.arch_name, smu.machine_code, cpus))
+                else:
+                    print("No machine code to run!")
+            except Exception as e:
+                print(e)
+                print("Usage: /matrix [cpu...]")
+
+        if cmdList[0] == "/profile":
+            try:
+                smu.profile = scareprofile(smu, parseInt(cmdList[1]) if cmdListLen > 1 else 20)
+                shouldAssemble = 4 # Reassemble and run from the start, see the main loop for the report
+            except Exception as e:
+                print(e)
+                print("Usage: /profile [N]")
+
+        if cmdList[0] == "/trace":
+            try:
+                traceCmd = cmdList[1] if cmdListLen > 1 else "info"
+                if traceCmd == "on":
+                    traceMode = "regs" if "regs" in cmdList[2:] else "pc"
+                    traceFile = [a for a in cmdList[2:] if a != "regs"]
+                    if smu.trace is not None:
+                        smu.trace.close()
+                    smu.trace = scaretrace(smu, traceMode, traceFile[0] if traceFile else None)
+                    print(f"Tracing {traceMode}" + (f" to {traceFile[0]}" if traceFile else ""))
+                elif smu.trace is None:
+                    print("No trace! Start one with /trace on")
+                elif traceCmd == "off":
+                    smu.trace.close()
+                    print("Tracing stopped")
+                elif traceCmd == "clear":
+                    smu.trace.close()
+                    smu.trace = None
+                elif traceCmd == "info":
+                    smu.trace.info()
+                else:
+                    lineAt = {smu.base_addr + offs: l for l, offs, asmBytes in listingMap(smu, smu.asm_code) or []}
+                    if traceCmd == "last":
+                        n = parseInt(cmdList[2]) if cmdListLen > 2 else 20
+                        out = [smu.trace.fmtInsn(step, addr, changed, lineAt) for step, addr, changed in smu.trace.last(n)]
+                        sys.stdout.write("".join(l + "\n" for l in out))
+                    elif traceCmd == "first" and cmdListLen == 3:
+                        addr = parseInt(cmdList[2])
+                        hit = smu.trace.firstHit(addr)
+                        print(smu.trace.fmtInsn(hit[0], addr, hit[1], lineAt) if hit else f"{addr:#x} was never hit")
+                    elif traceCmd == "reg" and cmdListLen == 4:
+                        hits = smu.trace.regHits(cmdList[2], parseInt(cmdList[3]))
+                        if hits is None:
+                            print("Register values are only recorded with /trace on regs")
+                        elif not hits:
+                            print(f"{cmdList[2]} was never set to {cmdList[3]}")
+                        for step, addr in hits or []:
+                            print(smu.trace.fmtInsn(step, addr, None, lineAt))
+                    else:
+                        print("Usage: /trace {on [regs] [FILE]|off|clear|info|last [N]|first ADDR|reg REG VALUE}")
+            except Exception as e:
+                print(e)
+
         if cmdList[0] in cmdPList:
-            printListing(smu, smu.asm_code, plan9=("plan9" in cmdList))
+            listFile = [a for a in cmdList[1:] if a != "plan9"]
+            printListing(smu, smu.asm_code, plan9=("plan9" in cmdList), outFile=listFile[0] if listFile else None)
 
         if cmdList[0] == "/read":
-            if cmdListLen >= 3 and cmdListLen <= 4:
+            if cmdListLen >= 3 and cmdListLen <= 5:
                 try:
-                    memout = 0
-                    baseAddr = 0
+                    baseAddr = None
                     if cmdList[1][0] == "$":
                         regTarget = cmdList[1].split("$")[1]
-                        regValue = smu.readReg(regTarget)
-                        if regValue is not None:
-                            memout = smu.mu_ctx.mem_read(regValue, parseInt(cmdList[2]))
-                            baseAddr = regValue
+                        baseAddr = smu.readReg(regTarget)
                     else:
                         baseAddr = parseInt(cmdList[1])
-                        memout = smu.mu_ctx.mem_read(baseAddr, parseInt(cmdList[2]))
-                    if memout:
+                    size = parseInt(cmdList[2])
+                    if baseAddr is not None and size > 0:
                         if cmdListLen > 3:
-                            with open(cmdList[3], "wb") as f:
-                                f.truncate()
-                                f.write(memout)
+                            smu.memReadFile(baseAddr, size, cmdList[3], parseInt(cmdList[4]) if cmdListLen > 4 else None)
                         else:
-                            dHex(memout, baseAddr)
+                            dHex(smu.mu_ctx.mem_read(baseAddr, size), baseAddr)
                     else:
-                        print("Usage: /read {0xaddress|$register} size")
+                        print("Usage: /read {0xaddress|$register} size [file [offset]]")
                 except Exception as e:
                     print(e)
-                    print("Usage: /read {0xaddress|$register} size")
+                    print("Usage: /read {0xaddress|$register} size [file [offset]]")
             else:
-                print("Usage: /read {0xaddress|$register} size")
+                print("Usage: /read {0xaddress|$register} size [file [offset]]")
 
         if cmdList[0] == "/write":
-            if cmdListLen == 3:
+            if cmdListLen == 3 or (cmdListLen <= 5 and cmdListLen > 3 and cmdList[2][0] == '.'):
                 try:
-                    if cmdList[2][0] == '.':
-                        with open(cmdList[2], "rb") as f:
-                            data = f.read(-1)
-                            print(f"{cmdList[2]}: {len(data)} bytes")
-                    else:
-                        data = bytes.fromhex(cmdList[2])
                     if cmdList[1][0] == "$":
                         regTarget = cmdList[1].split("$")[1]
-                        regValue = smu.readReg(regTarget)
-                        if regValue is not None:
-                            smu.mu_ctx.mem_write(regValue, data)
+                        addr = smu.readReg(regTarget)
                     else:
-                        memout = smu.mu_ctx.mem_write(parseInt(cmdList[1]), data)
+                        addr = parseInt(cmdList[1])
+                    if addr is not None:
+                        if cmdList[2][0] == '.':
+                            offset = parseInt(cmdList[3]) if cmdListLen > 3 else 0
+                            length = parseInt(cmdList[4]) if cmdListLen > 4 else None
+                            print(f"{cmdList[2]}: {smu.memWriteFile(addr, cmdList[2], offset, length)} bytes")
+                        else:
+                            smu.memWrite(addr, bytes.fromhex(cmdList[2]))
                 except Exception as e:
                     print(e)
-                    print("Usage: /write {0xaddress|$register} hexdata")
+                    print("Usage: /write {0xaddress|$register} {hexdata|./file [offset [length]]}")
             else:
-                print("Usage: /write {0xaddress|$register} hexdata")
+                print("Usage: /write {0xaddress|$register} {hexdata|./file [offset [length]]}")
 
         if cmdList[0] == "/set":
             if cmdListLen == 3:
@@ -204,23 +395,22 @@ def parseCmd(cmd, smu):
 
         if cmdList[0] == "/dis":
             try:
-                if cmdListLen == 3:
+                if cmdListLen == 3 or cmdListLen == 4:
+                    outFile = cmdList[3] if cmdListLen == 4 else None
                     if cmdList[1][0:2] == "0x":
-                        instructions4dis = smu.dis(parseInt(cmdList[1]), parseInt(cmdList[2]))
-                        printListing(smu, instructions4dis)
+                        printDis(smu, parseInt(cmdList[1]), parseInt(cmdList[2]), outFile)
                     elif cmdList[1][0] == "$":
                         regTarget = cmdList[1].split("$")[1]
                         regValue = smu.readReg(regTarget)
                         if regValue is not None:
-                            instructions4dis = smu.dis(regValue, parseInt(cmdList[2]))
-                            printListing(smu, instructions4dis)
+                            printDis(smu, regValue, parseInt(cmdList[2]), outFile)
                     else:
-                        print("Usage: /dis {0xaddress|$register} size")
+                        print("Usage: /dis {0xaddress|$register} size [file]")
                 else:
-                    print("Usage: /dis {0xaddress|$register} size")
+                    print("Usage: /dis {0xaddress|$register} size [file]")
             except Exception as e:
                 print(e)
-                print("Usage: /dis {0xaddress|$register} size")
+                print("Usage: /dis {0xaddress|$register} size [file]")
 
         if cmdList[0] == "/export":
             try:
@@ -253,16 +443,44 @@ def parseCmd(cmd, smu):
 
 if __name__ == '__main__':
     args = parser.parse_args()
-    print("Type / for help\n")
     inFile = args.inFile if args.inFile else ""
     currentArch = args.arch.lower() if args.arch else "NoArch"
     currentCpu = args.cpu.lower() if args.cpu else ""
+    if args.binFile and currentArch == "NoArch":
+        try:
+            elf = elfParse(args.binFile)
+        except (OSError, ValueError) as e:
+            elf = None
+        if elf is not None and elf["arch"]:
+            currentArch = elf["arch"]
     if args.stackaddr:
         sConfig["emu/stackaddr"] = args.stackaddr
     if args.baseaddr:
         sConfig["emu/baseaddr"] = args.baseaddr
     if args.memsize:
         sConfig["emu/memsize"] = args.memsize   
+    if args.serve:
+        if currentArch != "NoArch":
+            sConfig["emu/arch"] = currentArch # The default for new sessions
+            sConfig["emu/cpu"] = currentCpu
+        import scareserve # Pulls in asyncio and multiprocessing
+        sys.exit(scareserve.serveRun(args.serve, args.jobs))
+    if args.batch or args.fuzz or args.matrix:
+        if currentArch == "NoArch":
+            print(f"Batch mode needs an architecture! Use -a ARCH.\nSupported arches: {archez.keys()}")
+            sys.exit(1)
+        sConfig["emu/arch"] = currentArch
+        sConfig["emu/cpu"] = currentCpu
+        if args.matrix:
+            import scarematrix # Pulls in multiprocessing too
+            sys.exit(0 if scarematrix.matrixFile(args.matrix, args.cpus.split(",") if args.cpus else None, args.outFile, args.jobs) == 1 else 1)
+        if args.fuzz:
+            import scarefuzz # Pulls in multiprocessing too
+            sys.exit(1 if scarefuzz.fuzzRun(args.fuzz, args.fuzzIn, args.fuzzOut, args.check, args.runs, args.outFile, args.jobs, args.seed, args.entry) else 0)
+        memRanges = [parseMemRange(m) for m in args.memRanges]
+        import scarebatch # Pulls in multiprocessing, so only load it for batch runs
+        sys.exit(1 if scarebatch.batchRun(args.batch, memRanges, args.outFile, args.jobs) else 0)
+    print("Type / for help\n")
     if currentArch == "NoArch":
         print(f"Please select an architecture! Use `/c emu/arch ARCH`.\nSupported arches: {archez.keys()}")
         smu = False
@@ -275,6 +493,11 @@ if __name__ == '__main__':
         if inFile:
             smu.asm_code = loadAsm(inFile, lambda c: parseCmd(c, smu))
     printSplash()
+    if args.binFile:
+        if smu:
+            loadBin(smu, args.binFile)
+        else:
+            print(f"Couldn't tell the arch of {args.binFile}, use -a ARCH")
     while True:
         try:
             cmd = input(f"[{cArchP}{currentArch}]{cIP}{currentAddr:02x}{cEnd}> ")
@@ -282,27 +505,46 @@ if __name__ == '__main__':
                 shouldAsm = parseCmd(cmd, smu)
             except:
                 continue
+            if shouldAsm == 5:
+                currentArch = sConfig["emu/arch"]
+                currentCpu = sConfig["emu/cpu"]
+                smu = emuCache[(currentArch, currentCpu)]
+                currentAddr = smu.mu_ctx.reg_read(smu.ip_reg)
+                smu.printRegs()
+                shouldAsm = 0
             if    (((smu == False) and (sConfig["emu/arch"] != "NoArch")) or
                    sConfig["emu/arch"] != currentArch or
+                   sConfig["emu/cpu"] != currentCpu or
                    shouldAsm == 3):
-                currentArch = sConfig["emu/arch"]
-                currentCpu = sConfig["emu/cpu"]
-                currentAddr = sConfig["emu/baseaddr"]
-                smu = scaremu(currentArch, currentCpu)
+                newSmu = getEmu(sConfig["emu/arch"], sConfig["emu/cpu"])
+                if hasattr(newSmu, "mu_ctx"):
+                    currentArch = sConfig["emu/arch"]
+                    currentCpu = sConfig["emu/cpu"]
+                    currentAddr = sConfig["emu/baseaddr"]
+                    smu = newSmu
+                else:
+                    # Keep the emulator there was, with the options it runs with
+                    sConfig["emu/arch"] = currentArch
+                    sConfig["emu/cpu"] = currentCpu
+                    shouldAsm = 0
             if smu != False and shouldAsm:
                 if shouldAsm == 1:
                     smu.asm_code.append(cmd)
                 if len(smu.asm_code) > 0:
                     asmStatus = smu.asm(smu.asm_code)
                     if asmStatus == 0:
-                        currentAddr, runStatus = smu.run()
-                        if runStatus == 0:
-                            smu.printRegs()
+                        currentAddr, runStatus = smu.run(full=(shouldAsm == 4))
+                        if runStatus == 0 or runStatus == 2:
+                            smu.printRegs(changed=sConfig["regs/changed"])
                         else:
                             print("run() returned a non-zero value")
+                        smu.printRunStats()
+                        if smu.profile is not None:
+                            smu.profile.report(smu)
                     else:
                         smu.asm_code.pop() # Gets rid of the last line of assembly
                 else:
                     currentAddr = sConfig["emu/baseaddr"]
+                smu.profile = None # Only profile the one run
         except EOFError:
             break
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# scarebatch - Run many .asm files without the REPL
+# Every file is assembled and run in a fresh scaremu inside a worker process,
+# and one JSON record per file is written out.
+from __future__ import print_function
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from scarelib import *
+
+# batchFiles - Expand files and directories into a sorted list of .asm files
+def batchFiles(paths):
+    out = []
+    for p in paths:
+        if os.path.isdir(p):
+            found = []
+            for root, dirs, files in os.walk(p):
+                found += [os.path.join(root, f) for f in files if f.endswith(".asm")]
+            out += sorted(found)
+        else:
+            out.append(p)
+    return out
+
+# batchCmd - Handle /commands inside a batch file
+# Only /c /config NAME VALUE is supported, everything else is skipped
+def batchCmd(cmd, skipped):
+    cmdList = cmd.split()
+    if cmdList[0] in ["/c", "/config"] and len(cmdList) >= 3 and cmdList[1] in sConfig:
+        if cmdList[1] == "emu/arch":
+            sConfig["emu/arch"] = cmdList[2]
+            sConfig["emu/cpu"] = cmdList[3] if len(cmdList) > 3 else ""
+        else:
+            sConfig[cmdList[1]] = configParse(cmdList[1], cmdList[2])
+    else:
+        skipped.append(cmd)
+
+# batchRegs - Read the registers of the current arch into a dict of hex strings
+def batchRegs(smu):
+    names = list(rNames[smu.arch_name].keys())
+    if smu.arch_name in ["x86", "x64", "amd64"] and sConfig["x86/xmm"]:
+        names += list(rNames["xmm"].keys())
+    if smu.arch_name == "arm64" and sConfig["arm64/neon"]:
+        names += list(rNames["neon"].keys())
+    return {n: hex(smu.readReg(n)) for n in names}
+
+# batchMem - Read the requested memory ranges
+# memRanges = list of (address or "$register", size)
+def batchMem(smu, memRanges):
+    out = {}
+    for addr, size in memRanges:
+        key = f"{addr}:{size:#x}" if isinstance(addr, str) else f"{addr:#x}:{size:#x}"
+        if isinstance(addr, str):
+            addr = smu.readReg(addr.lstrip("$"))
+        try:
+            out[key] = bytes(smu.mu_ctx.mem_read(addr, size)).hex()
+        except Exception as e:
+            out[key] = None
+    return out
+
+def batchInit(config):
+    sConfig.update(config)
+    sConfig["undo/size"] = 0 # Nothing steps back in a batch run, so skip the per instruction hook
+
+# batchFile - Assemble and run one file, returns its JSON record as a dict
+def batchFile(job):
+    fname, memRanges = job
+    config = dict(sConfig)
+    rec = {"file": fname}
+    tStart = time.perf_counter()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            skipped = []
+            asmCode = loadAsm(fname, lambda c: batchCmd(c, skipped))
+            rec["arch"] = sConfig["emu/arch"]
+            rec["cpu"] = sConfig["emu/cpu"]
+            if skipped:
+                rec["skipped"] = skipped
+            smu = getEmu(sConfig["emu/arch"], sConfig["emu/cpu"])
+            tAsm = time.perf_counter()
+            asmStatus = smu.asm(asmCode)
+            rec["asm_time"] = time.perf_counter() - tAsm
+            if asmStatus != 0:
+                rec["status"] = "asm_error"
+            else:
+                rec["code_size"] = len(smu.machine_code)
+                tRun = time.perf_counter()
+                pc, runStatus = smu.run(full=True)
+                rec["run_time"] = time.perf_counter() - tRun
+                rec["status"] = ["ok", "error", "budget"][runStatus]
+                rec["exit_reason"] = smu.run_stats["reason"]
+                if "exit" in smu.run_stats:
+                    rec["exit_code"] = smu.run_stats["exit"]
+                rec["pc"] = hex(pc)
+                rec["insns"] = smu.run_stats["insns"]
+                rec["emu_time"] = smu.run_stats["time"]
+                rec["regs"] = batchRegs(smu)
+                rec["mem"] = batchMem(smu, memRanges)
+    except Exception as e:
+        rec["status"] = "error"
+        rec["error"] = f"{e}"
+    finally:
+        sConfig.clear()
+        sConfig.update(config) # Don't let /c lines leak into the next file
+    rec["output"] = output.getvalue()
+    rec["total_time"] = time.perf_counter() - tStart
+    return rec
+
+# batchRun - Run every file in a worker pool and write JSON lines to outFile
+# Returns the number of files that didn't finish with status ok
+def batchRun(paths, memRanges=[], outFile=None, jobs=None):
+    files = batchFiles(paths)
+    jobs = jobs or os.cpu_count() or 1
+    chunk = max(1, len(files) // (jobs * 4))
+    nBad = 0
+    out = open(outFile, "w") if outFile else sys.stdout
+    try:
+        with multiprocessing.Pool(jobs, initializer=batchInit, initargs=(dict(sConfig),)) as pool:
+            for rec in pool.imap(batchFile, [(f, memRanges) for f in files], chunksize=chunk):
+                if rec["status"] != "ok":
+                    nBad += 1
+                out.write(json.dumps(rec) + "\n")
+    finally:
+        if outFile:
+            out.close()
+    return nBad
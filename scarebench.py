@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# scarebench - Micro-benchmarks for scarelib
+from __future__ import print_function
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from scarelib import *
+
+startupTarget = 0.20 # Median seconds from launch to exit for "scare.py -a ARCH" with /x (was ~0.32 with eager imports)
+
+# One line of straight line code for each arch, for programs of any length
+benchLine = {
+    "x86":   "add eax, 1",
+    "x64":   "add rax, 1",
+    "arm32": "add r0, r0, #1",
+    "arm64": "add x0, x0, #1",
+}
+
+# A two instruction loop that runs 0xf0000 times for each arch
+benchLoopIters = 0xf0000
+benchLoop = {
+    "x86":   ["mov ecx, 0xf0000", "l:", "dec ecx", "jnz l"],
+    "x64":   ["mov rcx, 0xf0000", "l:", "dec rcx", "jnz l"],
+    "arm32": ["mov r0, #0xf0000", "l:", "subs r0, r0, #1", "bne l"],
+    "arm64": ["movz x0, #0xf, lsl #16", "l:", "subs x0, x0, #1", "b.ne l"],
+}
+
+# timeIt - Average seconds per call of f over n calls
+def timeIt(f, n):
+    tStart = time.perf_counter()
+    for i in range(n):
+        f()
+    return (time.perf_counter() - tStart) / n
+
+# benchEngines - Cost of making keystone/capstone handles vs using the cache
+def benchEngines(arch="x64", n=2000):
+    ksArgs = (archez[arch]["asm"]["keystone"]["arch"], archez[arch]["asm"]["keystone"]["mode"])
+    csArgs = (archez[arch]["dis"]["capstone"]["arch"], archez[arch]["dis"]["capstone"]["mode"])
+    engineOwner(arch, "")
+    keystone = importlib.import_module("keystone")
+    capstone = importlib.import_module("capstone")
+    ksConsts = (getattr(keystone, ksArgs[0]), getattr(keystone, ksArgs[1]))
+    csConsts = (getattr(capstone, csArgs[0]), getattr(capstone, csArgs[1]))
+    line = "xor eax, eax" if arch in ["x86", "x64", "amd64"] else "nop"
+    code = bytes(getKs(*ksArgs).asm(line)[0]) * 16
+    results = {
+        "ks_new":    timeIt(lambda: keystone.Ks(*ksConsts).asm(line), n),
+        "ks_cached": timeIt(lambda: getKs(*ksArgs).asm(line), n),
+        "cs_new":    timeIt(lambda: list(capstone.Cs(*csConsts).disasm_lite(code, 0)), n),
+        "cs_cached": timeIt(lambda: list(getCs(*csArgs).disasm_lite(code, 0)), n),
+    }
+    print(f"[[: engines {arch} :]] (us per call, {n} calls)")
+    for name in ["ks", "cs"]:
+        new, cached = results[f"{name}_new"], results[f"{name}_cached"]
+        print(f"{name}: new {new*1e6:8.2f}  cached {cached*1e6:8.2f}  saved {(new-cached)*1e6:8.2f}")
+    return results
+
+# benchStartup - Time a REPL that starts up and quits right away
+# Runs in a fresh interpreter each time, so import costs are included
+def benchStartup(arch="x64", n=10):
+    scarePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scare.py")
+    times = []
+    for i in range(n):
+        tStart = time.perf_counter()
+        subprocess.run([sys.executable, scarePath, "-a", arch], input=b"/x\n", stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - tStart)
+    times.sort()
+    best, median = times[0], times[len(times)//2]
+    print(f"[[: startup {arch} :]] ({n} runs)")
+    print(f"best {best*1e3:8.2f} ms  median {median*1e3:8.2f} ms  target {startupTarget*1e3:8.2f} ms  {'ok' if median <= startupTarget else 'SLOW'}")
+    return {"best": best, "median": median}
+
+# benchRepl - Seconds to add one line to a program of each length
+# A line is what the REPL does for it: asm, run and printRegs
+def benchRepl(arch="x64", n=200, sizes=(10, 100, 1000)):
+    results = {}
+    print(f"[[: repl {arch} :]] (ms per line, {n} lines)")
+    for size in sizes:
+        smu = getEmu(arch, "")
+        code = [benchLine[arch]] * size
+        with contextlib.redirect_stdout(io.StringIO()):
+            smu.asm(code)
+            smu.run()
+            tStart = time.perf_counter()
+            for i in range(n):
+                code.append(benchLine[arch])
+                smu.asm(code)
+                smu.run()
+                smu.printRegs()
+            results[f"line_{size}"] = (time.perf_counter() - tStart) / n
+        print(f"{size:>6} lines  {results[f'line_{size}']*1e3:8.3f}")
+    return results
+
+# benchListing - Seconds to print the listing of programs of each length
+def benchListing(arch="x64", n=20, sizes=(100, 1000, 10000)):
+    results = {}
+    print(f"[[: listing {arch} :]] (ms per listing, {n} listings)")
+    for size in sizes:
+        smu = getEmu(arch, "")
+        code = [benchLine[arch]] * size
+        smu.asm(code)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            results[f"listing_{size}"] = timeIt(lambda: (printListing(smu, code), out.seek(0), out.truncate()), n)
+        print(f"{size:>6} lines  {results[f'listing_{size}']*1e3:8.3f}")
+    return results
+
+# benchDis - Seconds to disassemble 64KB of code with scaremu.dis, and again while it's cached
+def benchDis(arch="x64", n=5):
+    smu = getEmu(arch, "")
+    code = [benchLine[arch]] * 0x4000
+    smu.asm(code)
+    smu.run()
+    size = min(len(smu.machine_code), 0x10000)
+    def cold():
+        smu.dis_cache.clear()
+        smu.dis_cached = 0
+        smu.dis(smu.base_addr, size)
+    results = {
+        "dis_64k":        timeIt(cold, n),
+        "dis_64k_cached": timeIt(lambda: smu.dis(smu.base_addr, size), n),
+    }
+    print(f"[[: dis {arch} :]] ({n} calls)")
+    print(f"64KB         {results['dis_64k']*1e3:8.3f} ms  {size/results['dis_64k']/1e6:8.2f} MB/s")
+    print(f"64KB cached  {results['dis_64k_cached']*1e3:8.3f} ms  {size/results['dis_64k_cached']/1e6:8.2f} MB/s")
+    return results
+
+# benchHex - Seconds to format a 1MB hex dump, with and without hex/squeeze
+def benchHex(n=3):
+    data = os.urandom(0x80000) + bytes(0x80000)
+    results = {
+        "hex_1m":         timeIt(lambda: sum(1 for l in dHexLines(data, 0x400000)), n),
+        "hex_1m_squeeze": timeIt(lambda: sum(1 for l in dHexLines(data, 0x400000, True)), n),
+    }
+    print(f"[[: hex :]] (ms per 1MB dump, {n} calls)")
+    for name, t in results.items():
+        print(f"{name:<15} {t*1e3:8.3f}")
+    return results
+
+# benchEmu - Seconds per emulated instruction for each arch, without any hooks
+def benchEmu(arches=None, n=3):
+    results = {}
+    config = dict(sConfig)
+    sConfig["emu/stats"] = False
+    sConfig["undo/size"] = 0
+    print(f"[[: emu :]] (ns per instruction, best of {n})")
+    try:
+        for arch in arches or benchLoop.keys():
+            smu = getEmu(arch, "")
+            smu.asm(benchLoop[arch])
+            times = []
+            for i in range(n):
+                smu.run(full=True)
+                times.append(smu.run_stats["time"])
+            results[f"emu_{arch}"] = min(times) / (benchLoopIters * 2 + 1)
+            print(f"{arch:<6} {results[f'emu_{arch}']*1e9:8.3f}  {1/results[f'emu_{arch}']/1e6:8.2f} M insns/s")
+    finally:
+        sConfig.clear()
+        sConfig.update(config)
+    return results
+
+# benchCompare - Compare results with an older JSON file from -o
+# Every result is seconds, so one that went up by more than threshold is a
+# regression. Returns the number of regressions
+def benchCompare(results, baseFile, threshold=0.10):
+    with open(baseFile) as f:
+        base = json.load(f)["results"]
+    nBad = 0
+    print(f"[[: compare {baseFile} :]] (regression = more than {threshold*100:.0f}% slower)")
+    for bench, metrics in results.items():
+        for name, new in metrics.items():
+            old = base.get(bench, {}).get(name)
+            if old is None:
+                continue
+            change = new / old - 1 if old else 0.0
+            flag = "REGRESSION" if change > threshold else "faster" if change < -threshold else ""
+            nBad += flag == "REGRESSION"
+            print(f"{bench+'/'+name:<28} {old*1e6:12.4f} us {new*1e6:12.4f} us {change*100:+7.1f}%  {flag}")
+    return nBad
+
+benches = ["engines", "startup", "repl", "listing", "dis", "hex", "emu"]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="scare micro-benchmarks")
+    parser.add_argument('bench', nargs='*', default=['engines'], choices=benches + ['all'], metavar='BENCH', help=f"Benchmarks to run: {', '.join(benches)} or all")
+    parser.add_argument('-a', dest='arch', default='x64', help='Target architecture')
+    parser.add_argument('-n', dest='n', type=int, help='Calls per measurement')
+    parser.add_argument('-o', dest='outFile', help='Write the results to a JSON file')
+    parser.add_argument('--compare', dest='baseFile', help='JSON file from -o to compare with, exits 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Slowdown that counts as a regression (default: 0.10)')
+    args = parser.parse_args()
+    names = benches if 'all' in args.bench else list(dict.fromkeys(args.bench))
+    n = args.n
+    results = {}
+    for name in names:
+        if name == 'engines':
+            results[name] = benchEngines(args.arch, n or 2000)
+        elif name == 'startup':
+            results[name] = benchStartup(args.arch, min(n or 10, 50))
+        elif name == 'repl':
+            results[name] = benchRepl(args.arch, n or 200)
+        elif name == 'listing':
+            results[name] = benchListing(args.arch, n or 20)
+        elif name == 'dis':
+            results[name] = benchDis(args.arch, n or 5)
+        elif name == 'hex':
+            results[name] = benchHex(n or 3)
+        elif name == 'emu':
+            results[name] = benchEmu(None, n or 3)
+    if args.outFile:
+        with open(args.outFile, "w") as f:
+            json.dump({"arch": args.arch, "python": platform.python_version(), "machine": platform.machine(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=1)
+        print(f"Wrote results to {args.outFile}")
+    nBad = benchCompare(results, args.baseFile, args.threshold) if args.baseFile else 0
+    if names == ['startup'] and results['startup']["median"] > startupTarget:
+        nBad += 1
+    sys.exit(1 if nBad else 0)
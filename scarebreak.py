@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# scarebreak - Breakpoints and watchpoints for scaremu
+# Every address with breakpoints and every watched range gets a unicorn hook
+# limited to it, so only those instructions and accesses call into Python and
+# runs without any keep their hook free path. Conditions are compiled once
+# when they're set, a hit reads just the registers they use in one call.
+from __future__ import print_function
+import re
+from scarelib import *
+
+breakReach = 32 # Bytes before a watched range an access can start and still reach into it
+
+# breakAddr - An address for /break and /watch, a number, $register or a label of the program
+# Labels are looked up in the listing, so they point where the code is now
+def breakAddr(smu, text):
+    if text.startswith("$"):
+        value = smu.readReg(text[1:])
+        if value is None:
+            raise ValueError(f"{text[1:]} isn't a register")
+        return value
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    for line, offs, asmBytes in listingMap(smu, smu.asm_code) or []:
+        if text in asmLineInfo(line)[0]:
+            return smu.base_addr + offs
+    raise ValueError(f"{text} isn't a number or a label of the program")
+
+# breakCond - Compile a condition like "rax == 0x10 && [rsp] > 3"
+# && || ! work like and or not, [ADDR] is the pointer sized word at ADDR and
+# any other name is a register.
+# Returns (code, regreader for the registers it uses, their names)
+def breakCond(smu, expr):
+    src = re.sub(r"!(?!=)", " not ", expr.replace("&&", " and ").replace("||", " or "))
+    code = compile(src.replace("[", "mem(").replace("]", ")"), "condition", "eval")
+    names = tuple(n for n in code.co_names if n != "mem")
+    mainRegs = rNames[smu.arch_name]
+    ids = []
+    for name in names:
+        try:
+            ids.append(smu.getReg(name))
+        except KeyError:
+            raise ValueError(f"{name} isn't a {smu.arch_name} register")
+    return code, regreader(tuple(ids), [8 if n in mainRegs else 32 for n in names]), names
+
+# scarebreak - The breakpoints and watchpoints of a scaremu, see /break and /watch
+class scarebreak:
+    def __init__(self):
+        self.points = {}   # Number -> breakpoint or watchpoint
+        self.at = {}       # Address -> breakpoints there, one hook checks them all
+        self.next_num = 1
+        self.hit = None    # What stopped the last run, None if nothing did
+        self.skip = None   # Address of an instruction to pass once in the next run, see scaremu.cont
+        self.pass_addr = None # The skip of the current run
+        self.restore = None   # (address, bytes) a stopped write already changed, see hookWatch
+    # addBreak - Stop before the instruction at addr runs, if expr is true there
+    def addBreak(self, smu, addr, expr=None):
+        point = {"num": self.next_num, "kind": "break", "addr": addr, "expr": expr, "hits": 0, "cond": None}
+        if expr:
+            point["cond"] = breakCond(smu, expr)
+        self.next_num += 1
+        self.points[point["num"]] = point
+        self.at.setdefault(addr, []).append(point)
+        return point["num"]
+    # addWatch - Stop before an instruction that reads or writes any of size bytes at addr
+    # access = "r", "w" or "rw"
+    def addWatch(self, smu, addr, size, access="w"):
+        if size <= 0 or not access or set(access) - {"r", "w"}:
+            raise ValueError("a watch needs a size and r, w or rw")
+        point = {"num": self.next_num, "kind": "watch", "addr": addr, "size": size, "access": access, "hits": 0}
+        self.next_num += 1
+        self.points[point["num"]] = point
+        return point["num"]
+    # delete - Remove a point, or every point if num is None
+    def delete(self, num=None):
+        nums = list(self.points) if num is None else [num]
+        for n in nums:
+            point = self.points.pop(n)
+            if point["kind"] == "break":
+                self.at[point["addr"]].remove(point)
+                if not self.at[point["addr"]]:
+                    del self.at[point["addr"]]
+        return len(nums)
+    # Hooks ####################################################################
+    def start(self, smu):
+        self.hit = None
+        self.restore = None
+        self.pass_addr, self.skip = self.skip, None
+        if not self.points:
+            return []
+        uc = smu.mu_ctx
+        self.ip_reg = smu.ip_reg
+        self.passing = False
+        self.pass_first = True
+        ptrSize = regLayouts[archez[smu.arch_name]["funcs"]["reg_sets"](sConfig)[0]]["size"] // 8
+        self.mem = lambda addr: int.from_bytes(uc.mem_read(addr, ptrSize), "little")
+        hooks = [uc.hook_add(UC_HOOK_CODE, self.hookBreak, points, addr, addr) for addr, points in self.at.items()]
+        if self.pass_addr is not None and self.pass_addr not in self.at:
+            hooks.append(uc.hook_add(UC_HOOK_CODE, self.hookPass, None, self.pass_addr, self.pass_addr))
+        for point in self.points.values():
+            if point["kind"] == "watch":
+                htype = (UC_HOOK_MEM_READ if "r" in point["access"] else 0) | (UC_HOOK_MEM_WRITE if "w" in point["access"] else 0)
+                lo = max(0, point["addr"] - breakReach)
+                hooks.append(uc.hook_add(htype, self.hookWatch, point, lo, point["addr"] + point["size"] - 1))
+        return hooks
+    # stop - Undo the part of a watched instruction that already ran, so the
+    # run stops right before it like it does at a breakpoint
+    def stop(self, smu):
+        if self.restore is not None:
+            smu.mu_ctx.mem_write(*self.restore)
+            self.restore = None
+    # hookPass - Marks the first time the run goes through pass_addr, the
+    # points there don't stop it then
+    def hookPass(self, uc, address, size, user_data):
+        self.passing = self.pass_first
+        self.pass_first = False
+    def hookBreak(self, uc, address, size, points):
+        if address == self.pass_addr:
+            self.hookPass(uc, address, size, None)
+            if self.passing:
+                return
+        for point in points:
+            why = ""
+            if point["cond"] is not None:
+                code, reader, names = point["cond"]
+                try:
+                    env = dict(zip(names, reader.read(uc)))
+                    env["mem"] = self.mem
+                    if not eval(code, {"__builtins__": {}}, env):
+                        continue
+                except Exception as e:
+                    why = f", the condition failed: {e}"
+            point["hits"] += 1
+            self.hit = f"break {point['num']} at {address:#x}{why}"
+            uc.emu_stop()
+            return
+    def hookWatch(self, uc, access, address, size, value, point):
+        if address + size <= point["addr"] or address >= point["addr"] + point["size"]:
+            return # Only near the range
+        if self.hit is not None:
+            return # Already stopping, ex: a write to a page that's still protected comes here twice
+        if self.passing and uc.reg_read(self.ip_reg) == self.pass_addr:
+            return
+        point["hits"] += 1
+        # Stopping here leaves the pc at the instruction with this write
+        # already done, it's put back so running it again doesn't repeat it
+        if access == UC_MEM_WRITE:
+            self.restore = (address, bytes(uc.mem_read(address, size)))
+            self.hit = f"watch {point['num']} write of {size} bytes at {address:#x} = {value & ((1 << (8 * size)) - 1):#x}"
+        else:
+            self.hit = f"watch {point['num']} read of {size} bytes at {address:#x}"
+        uc.emu_stop()
+    # Report ###################################################################
+    def info(self):
+        if not self.points:
+            print("No breakpoints or watchpoints")
+            return
+        for point in self.points.values():
+            if point["kind"] == "break":
+                cond = f" if {point['expr']}" if point["expr"] else ""
+                print(f"{cInfo}{point['num']:>3}{cEnd} break {point['addr']:#x}{cond}  ({point['hits']} hits)")
+            else:
+                print(f"{cInfo}{point['num']:>3}{cEnd} watch {point['addr']:#x} {point['size']} {point['access']}  ({point['hits']} hits)")
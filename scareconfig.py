@@ -2,11 +2,46 @@ sConfig = {
     "emu/baseaddr" : 0x400000,
     "emu/stackaddr": 0x401000,
     "emu/memsize":   0x800000,
+    "emu/checkpoints": 256, # How many runs scaremu.run can rewind to
+    "emu/timeout_us": 0, # Stop a run after this long, 0 = no limit
+    "emu/max_insns": 0, # Stop a run after this many instructions, 0 = no limit
+    "emu/stats": False, # Count instructions for the run stats, it hooks every block so it's off by default
+    "emu/sparse": False, # Map pages outside baseaddr..baseaddr+memsize when they're first read or written
+    "emu/sparse_pages": 0x10000, # Most pages sparse mode will map (0x10000 = 256MB)
     "emu/arch" : "NoArch",
     "emu/cpu": "",
-    "x86/xmm": 0,
-    "x86/ymm": 0,
-    "arm64/neon": 0,
+    "x86/xmm": False,
+    "x86/ymm": False,
+    "arm64/neon": False,
+    "undo/size": 0, # Bytes of undo log kept for /stepback and /back, the oldest instructions go first, 0 = don't record (it hooks every block)
+    "hex/squeeze": False, # Show runs of all zero rows in hex dumps as a single *, like xxd -a
+    "hex/pager": True, # Send hex dumps taller than the terminal through $PAGER
+    "dis/cache": 0x40000, # Instructions of /dis output kept to show again while the memory is unchanged, 0 = don't keep
+    "io/chunk": 0x100000, # Bytes moved at a time between a file and emulator memory by /write and /read
+    "fuzz/max_insns": 0x100000, # Instruction budget for each --fuzz run, runs don't use emu/timeout_us
+    "sys/linux": True, # Handle Linux syscalls: write, read, exit, brk, mmap...
+    "sys/buffer": 0x10000, # Bytes of guest stdout/stderr held before they're written, it's all written when a run ends
+    "serve/workers": 0, # Worker processes for --serve, sessions are spread over them, 0 = number of cores
+    "serve/sessions": 256, # Most sessions --serve keeps open at once
+    "serve/idle_s": 600, # --serve closes a session after this many seconds without a request, 0 = never
+    "trace/size": 0x400000, # Words of trace kept in memory by /trace, older ones are dropped
+    "regs/changed": False, # After each line only print the registers that changed
+}
+
+# sConfigTypes - What the options hold, the ones not here are ints
+# bool options take 1/0, on/off, true/false or yes/no, see configParse
+sConfigTypes = {
+    "emu/arch": str,
+    "emu/cpu": str,
+    "emu/stats": bool,
+    "emu/sparse": bool,
+    "x86/xmm": bool,
+    "x86/ymm": bool,
+    "arm64/neon": bool,
+    "hex/squeeze": bool,
+    "hex/pager": bool,
+    "sys/linux": bool,
+    "regs/changed": bool,
 }
 
 cEnd  = ""
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# scarefuzz - Run one snippet over many inputs
+# The code is assembled and mapped once per worker process. Every run starts
+# from the same saved cpu context with the pages the last run wrote put back,
+# then the inputs are written, the code runs and the outputs are read.
+from __future__ import print_function
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from scarelib import *
+from scarebatch import batchCmd, batchInit
+
+fuzzChunk = 4096 # Most runs handed to a worker at a time
+fuzzSeedRuns = 256 # Random inputs are reseeded every this many runs, so they don't depend on -j
+
+# fuzzSpec - Parse an --in or --out NAME, a register or ADDR:SIZE for memory
+# ADDR can be $register, it's read from the starting context
+def fuzzSpec(name):
+    if ":" in name:
+        addr, size = name.rsplit(":", 1)
+        return {"name": name, "reg": None, "addr": addr if addr.startswith("$") else int(addr, 0), "size": int(size, 0)}
+    return {"name": name, "reg": name, "addr": None, "size": None}
+
+# fuzzInput - Parse an --in NAME=VALUE
+# VALUE is a number, LO-HI for every value in the range, rand for any value
+# or rand:LO-HI for a random value in the range
+# Ranges of every value are combined, so two of 256 values make 65536 runs
+def fuzzInput(spec):
+    name, value = spec.split("=", 1)
+    inp = fuzzSpec(name)
+    if value == "rand":
+        inp.update({"kind": "rand", "lo": 0, "hi": None})
+    elif value.startswith("rand:"):
+        lo, hi = value[5:].split("-", 1)
+        inp.update({"kind": "rand", "lo": int(lo, 0), "hi": int(hi, 0)})
+    elif "-" in value.lstrip("-"):
+        lo, hi = value.split("-", 1)
+        inp.update({"kind": "enum", "lo": int(lo, 0), "hi": int(hi, 0)})
+    else:
+        inp.update({"kind": "const", "lo": int(value, 0), "hi": int(value, 0)})
+    return inp
+
+# fuzzRuns - How many runs make up a fuzz, n if it's given, else every
+# combination of the enumerated inputs, or 10000 if there are random ones
+# Runs past the last combination start over from the first
+def fuzzRuns(inputs, n=None):
+    if n:
+        return n
+    if any(inp["kind"] == "rand" for inp in inputs):
+        return 10000
+    combos = 1
+    for inp in inputs:
+        if inp["kind"] == "enum":
+            combos *= inp["hi"] - inp["lo"] + 1
+    return combos
+
+fuzzState = {} # The worker's emulator and everything runs share, see fuzzInit
+
+# fuzzInit - Assemble and map the code and save the starting context, once per process
+def fuzzInit(config, asmCode, inputs, outputs, check, entry):
+    batchInit(config)
+    smu = scaremu(sConfig["emu/arch"], sConfig["emu/cpu"])
+    if smu.asm(asmCode) != 0:
+        raise ValueError("the code doesn't assemble")
+    uc = smu.mu_ctx
+    begin = smu.base_addr
+    if entry:
+        lineMap = listingMap(smu, asmCode)
+        if not 1 <= entry <= len(lineMap):
+            raise ValueError(f"line {entry} isn't in the file")
+        begin += lineMap[entry - 1][1]
+    smu.memWrite(smu.base_addr, smu.machine_code)
+    uc.reg_write(smu.stack_reg, smu.stack_addr)
+    uc.reg_write(smu.ip_reg, begin)
+    bits = regLayouts[archez[smu.arch_name]["funcs"]["reg_sets"](sConfig)[0]]["size"]
+    for spec in inputs + outputs:
+        if spec["reg"] is not None:
+            if spec["reg"] not in rNames[smu.arch_name]:
+                raise ValueError(f"{spec['reg']} isn't a {smu.arch_name} register")
+            spec["id"] = smu.getReg(spec["reg"])
+            spec["bits"] = bits
+        else:
+            if isinstance(spec["addr"], str):
+                spec["addr"] = smu.readReg(spec["addr"].lstrip("$"))
+            spec["bits"] = spec["size"] * 8
+    # The mapped code is the starting memory, from here run_pages has the
+    # pages a run wrote as they were before it
+    smu.run_pages = {}
+    for inp in inputs:
+        if inp["reg"] is None:
+            for page in range(inp["addr"] & ~(pageSize-1), inp["addr"] + inp["size"], pageSize):
+                smu.savePage(page)
+    regIns = [inp for inp in inputs if inp["reg"] is not None]
+    regOuts = [out for out in outputs if out["reg"] is not None]
+    size = max(8, bits // 8)
+    fuzzState.update({
+        "smu": smu,
+        "reg_ins": regIns,
+        "mem_ins": [inp for inp in inputs if inp["reg"] is None],
+        "reg_outs": regOuts,
+        "mem_outs": [out for out in outputs if out["reg"] is None],
+        # One batched call each way, the pc comes first in the outputs
+        "in_regs": regreader(tuple(inp["id"] for inp in regIns), [size] * len(regIns)),
+        "out_regs": regreader((smu.ip_reg,) + tuple(out["id"] for out in regOuts), [size] * (len(regOuts) + 1)),
+        "ctx": uc.context_save(),
+        "begin": begin,
+        "until": smu.base_addr + len(smu.machine_code),
+        "inputs": inputs,
+        "outputs": outputs,
+        "check": compile(check, "--check", "eval") if check else None,
+    })
+
+# fuzzValues - The input values of run i
+def fuzzValues(inputs, i, rng):
+    vals = {}
+    for inp in inputs:
+        if inp["kind"] == "enum":
+            span = inp["hi"] - inp["lo"] + 1
+            vals[inp["name"]] = inp["lo"] + i % span
+            i //= span
+        elif inp["kind"] == "rand":
+            hi = (1 << inp["bits"]) - 1 if inp["hi"] is None else inp["hi"]
+            vals[inp["name"]] = rng.randint(inp["lo"], hi)
+        else:
+            vals[inp["name"]] = inp["lo"]
+    return vals
+
+# fuzzTask - Do runs start..start+count in this worker
+# Returns the counts of each status and a record for every run that failed
+# the check, or for every run if there isn't one
+def fuzzTask(task):
+    start, count, seed = task
+    st = fuzzState
+    smu = st["smu"]
+    uc = smu.mu_ctx
+    ctx, begin, until, check = st["ctx"], st["begin"], st["until"], st["check"]
+    inputs, regIns, memIns, regOuts, memOuts = st["inputs"], st["reg_ins"], st["mem_ins"], st["reg_outs"], st["mem_outs"]
+    inRegs, outRegs = st["in_regs"], st["out_regs"]
+    # emu/timeout_us would start a timer thread for every run, the
+    # instruction budget stops runaway loops for much less
+    maxInsns = sConfig["fuzz/max_insns"]
+    rng = None
+    res = {"runs": count, "ok": 0, "error": 0, "budget": 0, "failed": 0, "time": 0.0, "records": []}
+    tStart = time.perf_counter()
+    for i in range(start, start + count):
+        if i % fuzzSeedRuns == 0:
+            rng = random.Random(f"{seed}:{i}")
+        for page, data in smu.run_pages.items():
+            uc.mem_write(page, data)
+        uc.context_restore(ctx)
+        vals = fuzzValues(inputs, i, rng)
+        if regIns:
+            inRegs.write(uc, [vals[inp["name"]] for inp in regIns])
+        for inp in memIns:
+            uc.mem_write(inp["addr"], (vals[inp["name"]] & ((1 << inp["bits"]) - 1)).to_bytes(inp["size"], "little"))
+        error = None
+        try:
+            uc.emu_start(begin, until, count=maxInsns)
+        except UcError as e:
+            error = f"{e}"
+        regVals = outRegs.read(uc)
+        status = "error" if error else "ok" if regVals[0] == until else "budget"
+        res[status] += 1
+        outs = {out["name"]: v for out, v in zip(regOuts, regVals[1:])}
+        for out in memOuts:
+            outs[out["name"]] = bytes(uc.mem_read(out["addr"], out["size"]))
+        if check is not None:
+            try:
+                passed = status == "ok" and bool(eval(check, {"inp": vals, "out": outs, **outs}))
+            except Exception as e:
+                passed, error = False, f"{e}"
+            if passed:
+                continue
+            res["failed"] += 1
+        rec = {"run": i, "status": status, "in": {k: hex(v) for k, v in vals.items()},
+               "out": {k: v.hex() if isinstance(v, bytes) else hex(v) for k, v in outs.items()}}
+        if error:
+            rec["error"] = error
+        res["records"].append(rec)
+    res["time"] = time.perf_counter() - tStart
+    return res
+
+# fuzzRun - Do n runs of the code in asmFile over a worker pool
+# inputs/outputs = lists of --in/--out specs, check = Python expression a run
+# must make true, it sees the outputs by name, inp and out
+# entry = line to start running from, 1 is the first line
+# Writes one JSON record per failed run (every run without a check) to
+# outFile and a summary with the executions per second to stderr.
+# Returns the number of runs that failed
+def fuzzRun(asmFile, inputs=[], outputs=[], check=None, n=None, outFile=None, jobs=None, seed=0, entry=None):
+    inputs = [fuzzInput(s) for s in inputs]
+    outputs = [fuzzSpec(s) for s in outputs]
+    skipped = []
+    with contextlib.redirect_stdout(sys.stderr): # Keep stdout for the records
+        asmCode = loadAsm(asmFile, lambda c: batchCmd(c, skipped))
+    total = fuzzRuns(inputs, n)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, total))
+    chunk = max(1, min(fuzzChunk, total // (jobs * 4)))
+    chunk = -(-chunk // fuzzSeedRuns) * fuzzSeedRuns # Tasks start where the seed changes
+    tasks = [(s, min(chunk, total - s), seed) for s in range(0, total, chunk)]
+    initArgs = (dict(sConfig), asmCode, inputs, outputs, check, entry)
+    # Set up here first, so a bad register or line shows up once instead of
+    # in every worker
+    try:
+        fuzzInit(*initArgs)
+    except Exception as e:
+        sys.stderr.write(f"[[: fuzz Error :]]\n{e}\n")
+        return 1
+    res = {"runs": 0, "ok": 0, "error": 0, "budget": 0, "failed": 0, "time": 0.0}
+    out = open(outFile, "w") if outFile else sys.stdout
+    tStart = time.perf_counter()
+    if jobs == 1:
+        pool = None
+        results = map(fuzzTask, tasks)
+    else:
+        pool = multiprocessing.Pool(jobs, initializer=fuzzInit, initargs=initArgs)
+        results = pool.imap_unordered(fuzzTask, tasks)
+    try:
+        for r in results:
+            for k in res:
+                res[k] += r[k]
+            out.write("".join(json.dumps(rec) + "\n" for rec in r["records"]))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if outFile:
+            out.close()
+    wall = time.perf_counter() - tStart
+    bad = res["failed"] if check else res["error"] + res["budget"]
+    sys.stderr.write(f"[[: fuzz :]] {res['runs']} runs in {wall:.3f} s, {res['runs']/wall:.0f} exec/s "
+                     f"({res['runs']/max(res['time'], 1e-9):.0f} per process, {jobs} processes)\n"
+                     f"ok {res['ok']}  error {res['error']}  budget {res['budget']}  failed {res['failed']}\n")
+    if skipped:
+        sys.stderr.write(f"Skipped: {skipped}\n")
+    return bad
@@ -1,13 +1,22 @@
 #!/usr/bin/python
 from __future__ import print_function
 from unicorn import *
-from unicorn.x86_const import *
-from unicorn.arm64_const import *
-from unicorn.arm_const import *
-from keystone import *
-import capstone
 from scareconfig import *
+import array
+import collections
+import ctypes
+import gzip
+import hashlib
+import importlib
+import itertools
+import json
+import mmap
+import os
 import random
+import re
+import struct
+import sys
+import time
 
 def printSplash():
     print("""\
@@ -26,30 +35,55 @@ scare Help
 /x /exit /q /quit                      -- Quit the program
 
 /back n                                -- Go back n number of lines
-/dis {0xaddress|$register} NUM         -- Disassemble NUM bytes from 0xaddress or $register
+/break [{0xaddress|$register|label} [if EXPR]]
+                                       -- Stop runs before the instruction there when EXPR is true (ex: rax == 0x10 && [rsp] > 3,
+                                          [ADDR] is the pointer sized word at ADDR), or list the breakpoints and watchpoints
+/continue                              -- Carry on a run that stopped at a breakpoint or watchpoint
+/delete [N]                            -- Delete breakpoint or watchpoint N, or all of them
+/dis {0xaddress|$register} NUM [FILE]  -- Disassemble NUM bytes from 0xaddress or $register, or write it to FILE
 /export FILETYPE FILENAME              -- Export machine code as FILETYPE to the FILENAME
                                           FILETYPE:
                                           - bin
                                           - elf64
                                           - pe32
 /info                                  -- Info about the emulator state
-/l /list [TYPE]                        -- List the current program
+/l /list [TYPE] [FILE]                 -- List the current program, or write it to FILE
                                           TYPE:
                                           - plan9
 /load file.asm                         -- Load listing from file.asm (overwrites current program)
-/read {0xaddress|$register} NUM [FILE] -- Read NUM bytes from 0xaddress or $register
+/loadelf FILE                          -- Load a static ELF (or a raw binary at emu/baseaddr) and run it from its entry point
+/read {0xaddress|$register} NUM [FILE [OFFSET]]
+                                       -- Read NUM bytes from 0xaddress or $register, or save them to FILE
+                                          at OFFSET (FILE is truncated unless OFFSET is given)
+/watch {0xaddress|$register|label} LEN [r|w|rw]
+                                       -- Stop runs before an instruction that reads or writes (default: w) LEN bytes there
 /write {0xaddress|$register} hexdata   -- Write bytes to 0xaddress or $register
-/write {0xaddress|$register} ./file    -- Write file data to 0xaddress or $register
+/write {0xaddress|$register} ./file [OFFSET [LENGTH]]
+                                       -- Write file data (LENGTH bytes from OFFSET) to 0xaddress or $register
                                           Note: path *has* to start with a dot
 /regs                                  -- Print register state
 /get register [register... ]           -- Print register state
 /set register value                    -- Set a register
 /reset                                 -- Reset the emulator to a clean state
-/run                                   -- Run the current program
+/run                                   -- Run the current program again from a clean state
 /save file.asm                         -- Save assembly output to file.asm
+/snapshot save|load FILE               -- Save the registers, memory, program and options to FILE, or go back to them
+/stdin [TEXT]                          -- Queue a line of TEXT for the program to read from fd 0, or show what's queued
+/matrix [CPU...]                       -- Run the program on every cpu model of the arch (or the CPUs given)
+                                          and show the registers, faults and memory that differ
+/profile [N]                           -- Run the program from a clean state and show its N hottest lines
+                                          and loops, counted per block (default: 20)
+/stepback [N]                          -- Undo the last N instructions that ran (default: 1), needs undo/size
+/trace on [regs] [FILE]                -- Record executed instructions (and register changes with regs)
+                                          from now on, keeping the whole trace in FILE if given
+/trace off|clear|info                  -- Stop recording, drop the trace, or show its size
+/trace last [N]                        -- Show the last N instructions executed
+/trace first ADDR                      -- Show the first time the pc was ADDR
+/trace reg REG VALUE                   -- Show where REG was set to VALUE (needs regs)
 
 [[: Config Commands :]] (Use /c or /config)
-NOTE: Run /reset if you are changing emu/* options, otherwise the emulator may not start!
+NOTE: On/off options take 1/0, on/off, true/false or yes/no. Changes apply to the running
+      emulator, only emu/baseaddr rebuilds it and runs the program again.
 
 /c               -- Print all config options
 /c emu/arch      -- Print Arch Value
@@ -57,12 +91,70 @@ NOTE: Run /reset if you are changing emu/* options, otherwise the emulator may n
 /c x86/xmm 1     -- Enable x86/xmm
 /c x86/ymm 1     -- Enable x86/ymm
 /c arm64/neon 1  -- Enable arm64/neon
+/c emu/timeout_us 1000000 -- Stop a run after 1 second (0 = no limit)
+/c emu/max_insns 100000   -- Stop a run after 100000 instructions (0 = no limit)
+/c emu/stats 1            -- Count the instructions each run executes for the run stats
+/c emu/sparse 1           -- Map memory outside emu/memsize on first access
+/c emu/memsize 0x1000000  -- Grow (or shrink) the memory region, keeping what's in it
+/c emu/stackaddr 0x500000 -- Point the stack register somewhere else
+/c emu/sparse_pages 4096  -- Map at most 4096 pages in sparse mode
+/c hex/squeeze 1          -- Show repeated all zero rows in /read dumps as a single *
+/c hex/pager 0            -- Don't send /read dumps taller than the terminal through $PAGER
+/c undo/size 0x1000000   -- Keep 16MB of undo log for /stepback, without one /back reruns the program
+/c regs/changed 1         -- Only print registers that changed after each line (/regs prints all)
+/c dis/cache 0            -- Don't keep disassembly for repeated /dis of unchanged memory
+/c sys/linux 0            -- Don't handle Linux syscalls (syscall, int 0x80, svc 0)
 """
 
 
+### Lazy Tables ################################################################
+# Only the per-arch constants, keystone and capstone that are actually used get
+# imported, so starting scare for one arch doesn't pay for all of them.
+loadedConsts = set()
+
+# importConsts - Import a module's names into this module the first time it's needed
+# modName = e.g. "unicorn.x86_const" or "keystone"
+def importConsts(modName):
+    if modName in loadedConsts:
+        return
+    mod = importlib.import_module(modName)
+    names = getattr(mod, "__all__", None) or [n for n in dir(mod) if not n.startswith("_")]
+    g = globals()
+    for n in names:
+        g.setdefault(n, getattr(mod, n))
+    loadedConsts.add(modName)
+
+# lazyTable - dict whose entries are built by a loader on first access
+# loaders = {key: function returning the entry}
+class lazyTable(dict):
+    def __init__(self, loaders):
+        super().__init__()
+        self.loaders = loaders
+    def __missing__(self, key):
+        if key not in self.loaders:
+            raise KeyError(key)
+        val = self.loaders[key]()
+        self[key] = val
+        return val
+    def __contains__(self, key):
+        return key in self.loaders
+    def __iter__(self):
+        return iter(self.loaders)
+    def __len__(self):
+        return len(self.loaders)
+    def keys(self):
+        return self.loaders.keys()
+    def items(self):
+        return [(k, self[k]) for k in self.loaders]
+    def values(self):
+        return [self[k] for k in self.loaders]
+    def get(self, key, default=None):
+        return self[key] if key in self.loaders else default
+
 ### Register Output Stuff ######################################################
-rNames = {
-    "arm32" : {
+def regTable_arm32():
+    importConsts("unicorn.arm_const")
+    return {
         "r0" : UC_ARM_REG_R0,
         "r1" : UC_ARM_REG_R1,
         "r2" : UC_ARM_REG_R2,
@@ -80,8 +172,12 @@ rNames = {
         "lr":  UC_ARM_REG_LR,
         "pc":  UC_ARM_REG_PC,
         "cpsr":  UC_ARM_REG_CPSR,
-    },
-    "arm64" : {
+    }
+
+def regTable_arm64():
+    importConsts("unicorn.arm64_const")
+    importConsts("unicorn.arm_const")
+    return {
         "x0" : UC_ARM64_REG_X0,
         "x1" : UC_ARM64_REG_X1,
         "x2" : UC_ARM64_REG_X2,
@@ -116,8 +212,11 @@ rNames = {
         "sp":  UC_ARM64_REG_SP,
         "pc":  UC_ARM64_REG_PC,
         "cpsr":  UC_ARM_REG_CPSR,
-    },
-    "neon": {
+    }
+
+def regTable_neon():
+    importConsts("unicorn.arm64_const")
+    return {
         "v0" : UC_ARM64_REG_V0,
         "v1" : UC_ARM64_REG_V1,
         "v2" : UC_ARM64_REG_V2,
@@ -150,8 +249,11 @@ rNames = {
         "v29": UC_ARM64_REG_V29,
         "v30": UC_ARM64_REG_V30,
         "v31": UC_ARM64_REG_V31,
-    },
-    "x86": {
+    }
+
+def regTable_x86():
+    importConsts("unicorn.x86_const")
+    return {
         "eax": UC_X86_REG_EAX,
         "ebx": UC_X86_REG_EBX,
         "ecx": UC_X86_REG_ECX,
@@ -162,8 +264,11 @@ rNames = {
         "esp": UC_X86_REG_ESP,
         "ebp": UC_X86_REG_EBP,
         "eflags": UC_X86_REG_EFLAGS,
-    },
-    "x64": {
+    }
+
+def regTable_x64():
+    importConsts("unicorn.x86_const")
+    return {
         "rax": UC_X86_REG_RAX,
         "rbx": UC_X86_REG_RBX,
         "rcx": UC_X86_REG_RCX,
@@ -182,8 +287,11 @@ rNames = {
         "r14": UC_X86_REG_R14,
         "r15": UC_X86_REG_R15,
         "rflags": UC_X86_REG_EFLAGS,
-    },
-    "xmm": {
+    }
+
+def regTable_xmm():
+    importConsts("unicorn.x86_const")
+    return {
         "xmm0":  UC_X86_REG_XMM0,
         "xmm1":  UC_X86_REG_XMM1,
         "xmm2":  UC_X86_REG_XMM2,
@@ -216,8 +324,11 @@ rNames = {
         "xmm29": UC_X86_REG_XMM29,
         "xmm30": UC_X86_REG_XMM30,
         "xmm31": UC_X86_REG_XMM31,
-    },
-    "ymm": {
+    }
+
+def regTable_ymm():
+    importConsts("unicorn.x86_const")
+    return {
         "ymm0":  UC_X86_REG_YMM0,
         "ymm1":  UC_X86_REG_YMM1,
         "ymm2":  UC_X86_REG_YMM2,
@@ -250,136 +361,198 @@ rNames = {
         "ymm29": UC_X86_REG_YMM29,
         "ymm30": UC_X86_REG_YMM30,
         "ymm31": UC_X86_REG_YMM31,
-    },
-}
+    }
 
-# regFmt - Format register for output
-# mu = Emulator Object
+rNames = lazyTable({
+    "arm32": regTable_arm32,
+    "arm64": regTable_arm64,
+    "neon": regTable_neon,
+    "x86": regTable_x86,
+    "x64": regTable_x64,
+    "xmm": regTable_xmm,
+    "ymm": regTable_ymm,
+})
+
+# regLayouts - How each register set is laid out on screen
+# size = register size in bits
+# rows = lines of (label, rNames name, regType) cells
 # regType = Type of register for custom styling
 #     0 - General Purpose
 #     1 - Instruction Pointer
 #     2 - Stack Pointer
-# regSize = The size of the register in bits
-# regName = The emulator specific constant, resolved using rNames dict
-def regFmt(mu, regType, regSize, regName):
-    outRegVal = mu.reg_read(regName)
-    if regType == 0:
-        outRegColor = cGReg if outRegVal > 0 else cZero
-    elif regType == 1:
-        outRegColor = cIP
-    elif regType == 2:
-        outRegColor = cSPtr
-    else:
-        print(f"Unknown Register Type {regType}")
-        return
-    if regSize == 8:
-        outRegValFmt = f"{outRegVal:02x}"
-    elif regSize == 16:
-        outRegValFmt = f"{outRegVal:04x}"
-    elif regSize == 32:
-        outRegValFmt = f"{outRegVal:08x}"
-    elif regSize == 64:
-        outRegValFmt = f"{outRegVal:016x}"
-    elif regSize == 128:
-        outRegValFmt = f"{outRegVal:032x}"
-    elif regSize == 256:
-        outRegValFmt = f"{outRegVal:064x}"
-    else:
-        print("Unknown Register Size!")
-        return
-    outRegText = f"{outRegColor}{outRegValFmt}{cEnd}"
-    return outRegText
-
-def printRegs_arm32(mu, sConfig):
-    print(f"{cRegN}  r0: {regFmt(mu,0,32,rNames['arm32']['r0' ])} {cRegN} r1: {regFmt(mu,0,32,rNames['arm32']['r1' ])} {cRegN} r2: {regFmt(mu,0,32,rNames['arm32']['r2' ])} {cRegN} r3: {regFmt(mu,0,32,rNames['arm32']['r3' ])}")
-    print(f"{cRegN}  r4: {regFmt(mu,0,32,rNames['arm32']['r4' ])} {cRegN} r5: {regFmt(mu,0,32,rNames['arm32']['r5' ])} {cRegN} r6: {regFmt(mu,0,32,rNames['arm32']['r6' ])} {cRegN} r7: {regFmt(mu,0,32,rNames['arm32']['r7' ])} ")
-    print(f"{cRegN}  r8: {regFmt(mu,0,32,rNames['arm32']['r8' ])} {cRegN} r9: {regFmt(mu,0,32,rNames['arm32']['r9' ])} {cRegN}r10: {regFmt(mu,0,32,rNames['arm32']['r10'])} {cRegN}r11: {regFmt(mu,0,32,rNames['arm32']['r11'])}")
-    print(f"{cRegN} r12: {regFmt(mu,0,32,rNames['arm32']['r12'])} {cRegN} sp: {regFmt(mu,2,32,rNames['arm32']['sp' ])} {cRegN} lr: {regFmt(mu,0,32,rNames['arm32']['lr' ])} {cRegN} pc: {regFmt(mu,1,32,rNames['arm32']['pc' ])} ")
-    print(f"{cRegN}cpsr: {regFmt(mu,0,32,rNames['arm32']['cpsr'] )} ")
-    print(cEnd,end="")
-
-def printRegs_arm64(mu, sConfig):
-    print(f"{cRegN} x0: {regFmt(mu,0,64,rNames['arm64']['x0' ])} {cRegN}  x1: {regFmt(mu,0,64,rNames['arm64']['x1' ])} {cRegN}  x2: {regFmt(mu,0,64,rNames['arm64']['x2' ])} {cRegN}  x3: {regFmt(mu,0,64,rNames['arm64']['x3' ])}")
-    print(f"{cRegN} x4: {regFmt(mu,0,64,rNames['arm64']['x4' ])} {cRegN}  x5: {regFmt(mu,0,64,rNames['arm64']['x5' ])} {cRegN}  x6: {regFmt(mu,0,64,rNames['arm64']['x6' ])} {cRegN}  x7: {regFmt(mu,0,64,rNames['arm64']['x7' ])}")
-    print(f"{cRegN} x8: {regFmt(mu,0,64,rNames['arm64']['x8' ])} {cRegN}  x9: {regFmt(mu,0,64,rNames['arm64']['x9' ])} {cRegN} x10: {regFmt(mu,0,64,rNames['arm64']['x10'])} {cRegN} x11: {regFmt(mu,0,64,rNames['arm64']['x11'])}")
-    print(f"{cRegN}x12: {regFmt(mu,0,64,rNames['arm64']['x12'])} {cRegN} x13: {regFmt(mu,0,64,rNames['arm64']['x13'])} {cRegN} x14: {regFmt(mu,0,64,rNames['arm64']['x14'])} {cRegN} x15: {regFmt(mu,0,64,rNames['arm64']['x15'])}")
-    print(f"{cRegN}x16: {regFmt(mu,0,64,rNames['arm64']['x16'])} {cRegN} x17: {regFmt(mu,0,64,rNames['arm64']['x17'])} {cRegN} x18: {regFmt(mu,0,64,rNames['arm64']['x18'])} {cRegN} x19: {regFmt(mu,0,64,rNames['arm64']['x19'])}")
-    print(f"{cRegN}x20: {regFmt(mu,0,64,rNames['arm64']['x20'])} {cRegN} x21: {regFmt(mu,0,64,rNames['arm64']['x21'])} {cRegN} x22: {regFmt(mu,0,64,rNames['arm64']['x22'])} {cRegN} x23: {regFmt(mu,0,64,rNames['arm64']['x23'])}")
-    print(f"{cRegN}x24: {regFmt(mu,0,64,rNames['arm64']['x24'])} {cRegN} x25: {regFmt(mu,0,64,rNames['arm64']['x25'])} {cRegN} x26: {regFmt(mu,0,64,rNames['arm64']['x26'])} {cRegN} x27: {regFmt(mu,0,64,rNames['arm64']['x27'])}")
-    print(f"{cRegN}x28: {regFmt(mu,0,64,rNames['arm64']['x28'])} {cRegN} x29: {regFmt(mu,0,64,rNames['arm64']['x29'])} {cRegN} x30: {regFmt(mu,0,64,rNames['arm64']['x30'])} {cRegN}  sp: {regFmt(mu,2,64,rNames['arm64']['sp'] )}")
-    print(f"{cRegN} pc: {regFmt(mu,1,64,rNames['arm64']['pc'] )} {cRegN}cpsr: {regFmt(mu,0,64,rNames['arm64']['cpsr'])}")
-    print(cEnd,end="")
-    if sConfig["arm64/neon"]:
-        printRegs_NEON(mu, sConfig)
-
-def printRegs_NEON(mu, sConfig):
-    print(f"{cRegN} v0: {regFmt(mu,0,128,rNames['neon']['v0'] )} {cRegN}v16: {regFmt(mu,0,128,rNames['neon']['v16'])}")
-    print(f"{cRegN} v1: {regFmt(mu,0,128,rNames['neon']['v1'] )} {cRegN}v17: {regFmt(mu,0,128,rNames['neon']['v17'])}")
-    print(f"{cRegN} v2: {regFmt(mu,0,128,rNames['neon']['v2'] )} {cRegN}v18: {regFmt(mu,0,128,rNames['neon']['v18'])}")
-    print(f"{cRegN} v3: {regFmt(mu,0,128,rNames['neon']['v3'] )} {cRegN}v19: {regFmt(mu,0,128,rNames['neon']['v19'])}")
-    print(f"{cRegN} v4: {regFmt(mu,0,128,rNames['neon']['v4'] )} {cRegN}v20: {regFmt(mu,0,128,rNames['neon']['v20'])}")
-    print(f"{cRegN} v5: {regFmt(mu,0,128,rNames['neon']['v5'] )} {cRegN}v21: {regFmt(mu,0,128,rNames['neon']['v21'])}")
-    print(f"{cRegN} v6: {regFmt(mu,0,128,rNames['neon']['v6'] )} {cRegN}v22: {regFmt(mu,0,128,rNames['neon']['v22'])}")
-    print(f"{cRegN} v7: {regFmt(mu,0,128,rNames['neon']['v7'] )} {cRegN}v23: {regFmt(mu,0,128,rNames['neon']['v23'])}")
-    print(f"{cRegN} v8: {regFmt(mu,0,128,rNames['neon']['v8'] )} {cRegN}v24: {regFmt(mu,0,128,rNames['neon']['v24'])}")
-    print(f"{cRegN} v9: {regFmt(mu,0,128,rNames['neon']['v9'] )} {cRegN}v25: {regFmt(mu,0,128,rNames['neon']['v25'])}")
-    print(f"{cRegN}v10: {regFmt(mu,0,128,rNames['neon']['v10'])} {cRegN}v26: {regFmt(mu,0,128,rNames['neon']['v26'])}")
-    print(f"{cRegN}v11: {regFmt(mu,0,128,rNames['neon']['v11'])} {cRegN}v27: {regFmt(mu,0,128,rNames['neon']['v27'])}")
-    print(f"{cRegN}v12: {regFmt(mu,0,128,rNames['neon']['v12'])} {cRegN}v28: {regFmt(mu,0,128,rNames['neon']['v28'])}")
-    print(f"{cRegN}v13: {regFmt(mu,0,128,rNames['neon']['v13'])} {cRegN}v29: {regFmt(mu,0,128,rNames['neon']['v29'])}")
-    print(f"{cRegN}v14: {regFmt(mu,0,128,rNames['neon']['v14'])} {cRegN}v30: {regFmt(mu,0,128,rNames['neon']['v30'])}")
-    print(f"{cRegN}v15: {regFmt(mu,0,128,rNames['neon']['v15'])} {cRegN}v31: {regFmt(mu,0,128,rNames['neon']['v31'])}")
-
-def printRegs_x86(mu, sConfig):
-    print(f"{cRegN}eax: {regFmt(mu,0,32,rNames['x86']['eax'])}")
-    print(f"{cRegN}ecx: {regFmt(mu,0,32,rNames['x86']['ecx'])}")
-    print(f"{cRegN}edx: {regFmt(mu,0,32,rNames['x86']['edx'])}")
-    print(f"{cRegN}ebx: {regFmt(mu,0,32,rNames['x86']['ebx'])}")
-    print(f"{cRegN}esp: {regFmt(mu,2,32,rNames['x86']['esp'])}")
-    print(f"{cRegN}ebp: {regFmt(mu,0,32,rNames['x86']['ebp'])}")
-    print(f"{cRegN}esi: {regFmt(mu,0,32,rNames['x86']['esi'])}")
-    print(f"{cRegN}edi: {regFmt(mu,0,32,rNames['x86']['edi'])}")
-    print(f"{cRegN}eip: {regFmt(mu,1,32,rNames['x86']['eip'])}")
-    print(f"{cRegN}efl: {regFmt(mu,0,32,rNames['x86']['eflags'])}")
-    print(cEnd,end="")
-    if sConfig["x86/xmm"]:
-        printRegs_XMM(mu, sConfig)
-
-def printRegs_XMM(mu, sConfig):
-    print(f"{cRegN} xmm0: {regFmt(mu,0,128,rNames['xmm']['xmm0'] )} {cRegN} xmm8: {regFmt(mu,0,128,rNames['xmm']['xmm8'] )}")
-    print(f"{cRegN} xmm1: {regFmt(mu,0,128,rNames['xmm']['xmm1'] )} {cRegN} xmm9: {regFmt(mu,0,128,rNames['xmm']['xmm9'])}")
-    print(f"{cRegN} xmm2: {regFmt(mu,0,128,rNames['xmm']['xmm2'] )} {cRegN}xmm10: {regFmt(mu,0,128,rNames['xmm']['xmm10'])}")
-    print(f"{cRegN} xmm3: {regFmt(mu,0,128,rNames['xmm']['xmm3'] )} {cRegN}xmm11: {regFmt(mu,0,128,rNames['xmm']['xmm11'])}")
-    print(f"{cRegN} xmm4: {regFmt(mu,0,128,rNames['xmm']['xmm4'] )} {cRegN}xmm12: {regFmt(mu,0,128,rNames['xmm']['xmm12'])}")
-    print(f"{cRegN} xmm5: {regFmt(mu,0,128,rNames['xmm']['xmm5'] )} {cRegN}xmm13: {regFmt(mu,0,128,rNames['xmm']['xmm13'])}")
-    print(f"{cRegN} xmm6: {regFmt(mu,0,128,rNames['xmm']['xmm6'] )} {cRegN}xmm14: {regFmt(mu,0,128,rNames['xmm']['xmm14'])}")
-    print(f"{cRegN} xmm7: {regFmt(mu,0,128,rNames['xmm']['xmm7'] )} {cRegN}xmm15: {regFmt(mu,0,128,rNames['xmm']['xmm15'])}")
-
-def printRegs_YMM(mu, sConfig):
-    print(f"{cRegN} ymm0: {regFmt(mu,0,256,rNames['ymm']['ymm0'] )} {cRegN} ymm8: {regFmt(mu,0,256,rNames['ymm']['ymm8'] )}")
-    print(f"{cRegN} ymm1: {regFmt(mu,0,256,rNames['ymm']['ymm1'] )} {cRegN} ymm9: {regFmt(mu,0,256,rNames['ymm']['ymm9'])}")
-    print(f"{cRegN} ymm2: {regFmt(mu,0,256,rNames['ymm']['ymm2'] )} {cRegN}ymm10: {regFmt(mu,0,256,rNames['ymm']['ymm10'])}")
-    print(f"{cRegN} ymm3: {regFmt(mu,0,256,rNames['ymm']['ymm3'] )} {cRegN}ymm11: {regFmt(mu,0,256,rNames['ymm']['ymm11'])}")
-    print(f"{cRegN} ymm4: {regFmt(mu,0,256,rNames['ymm']['ymm4'] )} {cRegN}ymm12: {regFmt(mu,0,256,rNames['ymm']['ymm12'])}")
-    print(f"{cRegN} ymm5: {regFmt(mu,0,256,rNames['ymm']['ymm5'] )} {cRegN}ymm13: {regFmt(mu,0,256,rNames['ymm']['ymm13'])}")
-    print(f"{cRegN} ymm6: {regFmt(mu,0,256,rNames['ymm']['ymm6'] )} {cRegN}ymm14: {regFmt(mu,0,256,rNames['ymm']['ymm14'])}")
-    print(f"{cRegN} ymm7: {regFmt(mu,0,256,rNames['ymm']['ymm7'] )} {cRegN}ymm15: {regFmt(mu,0,256,rNames['ymm']['ymm15'])}")
-
-def printRegs_x64(mu, sConfig):
-    print(f"{cRegN}rax: {regFmt(mu,0,64,rNames['x64']['rax'])} {cRegN}rip: {regFmt(mu,1,64,rNames['x64']['rip'])} {cRegN}r11: {regFmt(mu,0,64,rNames['x64']['r11'])}")
-    print(f"{cRegN}rbx: {regFmt(mu,0,64,rNames['x64']['rbx'])} {cRegN}rsp: {regFmt(mu,2,64,rNames['x64']['rsp'])} {cRegN}r12: {regFmt(mu,0,64,rNames['x64']['r12'])}")
-    print(f"{cRegN}rcx: {regFmt(mu,0,64,rNames['x64']['rcx'])} {cRegN}rbp: {regFmt(mu,0,64,rNames['x64']['rbp'])} {cRegN}r13: {regFmt(mu,0,64,rNames['x64']['r13'])}")
-    print(f"{cRegN}rdx: {regFmt(mu,0,64,rNames['x64']['rdx'])} {cRegN} r8: {regFmt(mu,0,64,rNames['x64']['r8'] )} {cRegN}r14: {regFmt(mu,0,64,rNames['x64']['r14'])}")
-    print(f"{cRegN}rsi: {regFmt(mu,0,64,rNames['x64']['rsi'])} {cRegN} r9: {regFmt(mu,0,64,rNames['x64']['r9'] )} {cRegN}r15: {regFmt(mu,0,64,rNames['x64']['r15'])}")
-    print(f"{cRegN}rdi: {regFmt(mu,0,64,rNames['x64']['rdi'])} {cRegN}r10: {regFmt(mu,0,64,rNames['x64']['r10'])} {cRegN}rfl: {regFmt(mu,0,64,rNames['x64']['rflags'])}")
-    print(cEnd,end="")
+regLayouts = {
+    "arm32": {
+        "size": 32,
+        "rows": [
+            [("  r0", "r0", 0), (" r1", "r1", 0), (" r2", "r2", 0), (" r3", "r3", 0)],
+            [("  r4", "r4", 0), (" r5", "r5", 0), (" r6", "r6", 0), (" r7", "r7", 0)],
+            [("  r8", "r8", 0), (" r9", "r9", 0), ("r10", "r10", 0), ("r11", "r11", 0)],
+            [(" r12", "r12", 0), (" sp", "sp", 2), (" lr", "lr", 0), (" pc", "pc", 1)],
+            [("cpsr", "cpsr", 0)],
+        ],
+    },
+    "arm64": {
+        "size": 64,
+        "rows": [
+            [(" x0", "x0", 0), ("  x1", "x1", 0), ("  x2", "x2", 0), ("  x3", "x3", 0)],
+            [(" x4", "x4", 0), ("  x5", "x5", 0), ("  x6", "x6", 0), ("  x7", "x7", 0)],
+            [(" x8", "x8", 0), ("  x9", "x9", 0), (" x10", "x10", 0), (" x11", "x11", 0)],
+            [("x12", "x12", 0), (" x13", "x13", 0), (" x14", "x14", 0), (" x15", "x15", 0)],
+            [("x16", "x16", 0), (" x17", "x17", 0), (" x18", "x18", 0), (" x19", "x19", 0)],
+            [("x20", "x20", 0), (" x21", "x21", 0), (" x22", "x22", 0), (" x23", "x23", 0)],
+            [("x24", "x24", 0), (" x25", "x25", 0), (" x26", "x26", 0), (" x27", "x27", 0)],
+            [("x28", "x28", 0), (" x29", "x29", 0), (" x30", "x30", 0), ("  sp", "sp", 2)],
+            [(" pc", "pc", 1), ("cpsr", "cpsr", 0)],
+        ],
+    },
+    "neon": {
+        "size": 128,
+        "rows": [
+            [(" v0", "v0", 0), ("v16", "v16", 0)],
+            [(" v1", "v1", 0), ("v17", "v17", 0)],
+            [(" v2", "v2", 0), ("v18", "v18", 0)],
+            [(" v3", "v3", 0), ("v19", "v19", 0)],
+            [(" v4", "v4", 0), ("v20", "v20", 0)],
+            [(" v5", "v5", 0), ("v21", "v21", 0)],
+            [(" v6", "v6", 0), ("v22", "v22", 0)],
+            [(" v7", "v7", 0), ("v23", "v23", 0)],
+            [(" v8", "v8", 0), ("v24", "v24", 0)],
+            [(" v9", "v9", 0), ("v25", "v25", 0)],
+            [("v10", "v10", 0), ("v26", "v26", 0)],
+            [("v11", "v11", 0), ("v27", "v27", 0)],
+            [("v12", "v12", 0), ("v28", "v28", 0)],
+            [("v13", "v13", 0), ("v29", "v29", 0)],
+            [("v14", "v14", 0), ("v30", "v30", 0)],
+            [("v15", "v15", 0), ("v31", "v31", 0)],
+        ],
+    },
+    "x86": {
+        "size": 32,
+        "rows": [
+            [("eax", "eax", 0)],
+            [("ecx", "ecx", 0)],
+            [("edx", "edx", 0)],
+            [("ebx", "ebx", 0)],
+            [("esp", "esp", 2)],
+            [("ebp", "ebp", 0)],
+            [("esi", "esi", 0)],
+            [("edi", "edi", 0)],
+            [("eip", "eip", 1)],
+            [("efl", "eflags", 0)],
+        ],
+    },
+    "xmm": {
+        "size": 128,
+        "rows": [
+            [(" xmm0", "xmm0", 0), (" xmm8", "xmm8", 0)],
+            [(" xmm1", "xmm1", 0), (" xmm9", "xmm9", 0)],
+            [(" xmm2", "xmm2", 0), ("xmm10", "xmm10", 0)],
+            [(" xmm3", "xmm3", 0), ("xmm11", "xmm11", 0)],
+            [(" xmm4", "xmm4", 0), ("xmm12", "xmm12", 0)],
+            [(" xmm5", "xmm5", 0), ("xmm13", "xmm13", 0)],
+            [(" xmm6", "xmm6", 0), ("xmm14", "xmm14", 0)],
+            [(" xmm7", "xmm7", 0), ("xmm15", "xmm15", 0)],
+        ],
+    },
+    "ymm": {
+        "size": 256,
+        "rows": [
+            [(" ymm0", "ymm0", 0), (" ymm8", "ymm8", 0)],
+            [(" ymm1", "ymm1", 0), (" ymm9", "ymm9", 0)],
+            [(" ymm2", "ymm2", 0), ("ymm10", "ymm10", 0)],
+            [(" ymm3", "ymm3", 0), ("ymm11", "ymm11", 0)],
+            [(" ymm4", "ymm4", 0), ("ymm12", "ymm12", 0)],
+            [(" ymm5", "ymm5", 0), ("ymm13", "ymm13", 0)],
+            [(" ymm6", "ymm6", 0), ("ymm14", "ymm14", 0)],
+            [(" ymm7", "ymm7", 0), ("ymm15", "ymm15", 0)],
+        ],
+    },
+    "x64": {
+        "size": 64,
+        "rows": [
+            [("rax", "rax", 0), ("rip", "rip", 1), ("r11", "r11", 0)],
+            [("rbx", "rbx", 0), ("rsp", "rsp", 2), ("r12", "r12", 0)],
+            [("rcx", "rcx", 0), ("rbp", "rbp", 0), ("r13", "r13", 0)],
+            [("rdx", "rdx", 0), (" r8", "r8", 0), ("r14", "r14", 0)],
+            [("rsi", "rsi", 0), (" r9", "r9", 0), ("r15", "r15", 0)],
+            [("rdi", "rdi", 0), ("r10", "r10", 0), ("rfl", "rflags", 0)],
+        ],
+    },
+}
+
+# regSets_* - Register sets shown for an arch with the current config
+def regSets_arm32(sConfig):
+    return ("arm32",)
+
+def regSets_arm64(sConfig):
+    return ("arm64", "neon") if sConfig["arm64/neon"] else ("arm64",)
+
+def regSets_x86(sConfig):
+    return ("x86", "xmm") if sConfig["x86/xmm"] else ("x86",)
+
+def regSets_x64(sConfig):
+    sets = ("x64",)
     if sConfig["x86/xmm"]:
-        printRegs_XMM(mu, sConfig)
+        sets += ("xmm",)
     if sConfig["x86/ymm"]:
-        printRegs_YMM(mu, sConfig)
+        sets += ("ymm",)
+    return sets
 
-archez = {
-    "x64": {
+# regreader - Reads a fixed list of registers with one reg_read_batch call
+# The ids and the masks for writing are made once, so a snapshot is one call
+# into the bindings instead of a reg_read per register.
+class regreader:
+    def __init__(self, ids, sizes):
+        self.ids = ids
+        self.masks = [(1 << (8 * size)) - 1 for size in sizes]
+    def read(self, mu):
+        return tuple(mu.reg_read_batch(self.ids))
+    # write - Set the registers to vals, given in the same order as the ids
+    def write(self, mu, vals):
+        mu.reg_write_batch([(i, v & m) for i, v, m in zip(self.ids, vals, self.masks)])
+
+regReaders = {} # Tuple of register sets -> regreader
+
+# regReader - The regreader for a tuple of register sets, values come out in display order
+def regReader(sets):
+    reader = regReaders.get(sets)
+    if reader is None:
+        cells = [(rNames[rs][name], max(8, regLayouts[rs]["size"] // 8)) for rs in sets for row in regLayouts[rs]["rows"] for label, name, regType in row]
+        reader = regreader(tuple(i for i, size in cells), [size for i, size in cells])
+        regReaders[sets] = reader
+    return reader
+
+# regSnapshot - Read every register of the given sets with one batched call
+# Returns a tuple of values in display order
+def regSnapshot(mu, sets):
+    return regReader(sets).read(mu)
+
+# regRender - Format a register snapshot as one string
+# prev = an older snapshot of the same sets, only registers that differ from it are shown
+def regRender(sets, vals, prev=None):
+    regColors = (None, cIP, cSPtr)
+    lines = []
+    n = 0
+    for rs in sets:
+        layout = regLayouts[rs]
+        width = layout["size"] // 4
+        for row in layout["rows"]:
+            cells = []
+            for label, name, regType in row:
+                val = vals[n]
+                if prev is None or prev[n] != val:
+                    color = regColors[regType] or (cGReg if val > 0 else cZero)
+                    cells.append(f"{cRegN}{label}: {color}{val:0{width}x}{cEnd}")
+                n += 1
+            if cells:
+                lines.append(" ".join(cells))
+    if not lines:
+        return ""
+    return "\n".join(lines) + "\n" + cEnd
+
+def archTable_x64():
+    importConsts("unicorn.x86_const")
+    return {
         "emu": {
             "unicorn": {
                 "arch": UC_ARCH_X86,
@@ -390,18 +563,20 @@ archez = {
         },
         "asm": {
             "keystone": {
-                "arch": KS_ARCH_X86,
-                "mode": KS_MODE_64,
+                "arch": "KS_ARCH_X86",
+                "mode": "KS_MODE_64",
+                "ptr_dir": ".quad", # Directive that emits one address
+                "ptr_size": 8,
             },
         },
         "dis": {
             "capstone": {
-                "arch": capstone.CS_ARCH_X86,
-                "mode": capstone.CS_MODE_64,
+                "arch": "CS_ARCH_X86",
+                "mode": "CS_MODE_64",
             },
         },
         "funcs": {
-            "reg_state": printRegs_x64,
+            "reg_sets": regSets_x64,
         },
         "cpus": {
             "": None,
@@ -444,8 +619,11 @@ archez = {
             "dhyana": UC_CPU_X86_DHYANA,
             "epyc_rome": UC_CPU_X86_EPYC_ROME,
         },
-    },
-    "x86": {
+    }
+
+def archTable_x86():
+    importConsts("unicorn.x86_const")
+    return {
         "emu": {
             "unicorn": {
                 "arch": UC_ARCH_X86,
@@ -456,21 +634,27 @@ archez = {
         },
         "asm": {
             "keystone": {
-                "arch": KS_ARCH_X86,
-                "mode": KS_MODE_32,
+                "arch": "KS_ARCH_X86",
+                "mode": "KS_MODE_32",
+                "ptr_dir": ".long",
+                "ptr_size": 4,
             },
         },
         "dis": {
             "capstone": {
-                "arch": capstone.CS_ARCH_X86,
-                "mode": capstone.CS_MODE_32,
+                "arch": "CS_ARCH_X86",
+                "mode": "CS_MODE_32",
             },
         },
         "funcs": {
-            "reg_state": printRegs_x86,
+            "reg_sets": regSets_x86,
         },
-    },
-    "arm64": {
+        "cpus": archez["x64"]["cpus"],
+    }
+
+def archTable_arm64():
+    importConsts("unicorn.arm64_const")
+    return {
         "emu": {
             "unicorn": {
                 "arch": UC_ARCH_ARM64,
@@ -481,18 +665,20 @@ archez = {
         },
         "asm": {
             "keystone": {
-                "arch": KS_ARCH_ARM64,
-                "mode": KS_MODE_LITTLE_ENDIAN,
+                "arch": "KS_ARCH_ARM64",
+                "mode": "KS_MODE_LITTLE_ENDIAN",
+                "ptr_dir": ".quad",
+                "ptr_size": 8,
             },
         },
         "dis": {
             "capstone": {
-                "arch": capstone.CS_ARCH_ARM64,
-                "mode": capstone.CS_MODE_ARM,
+                "arch": "CS_ARCH_ARM64",
+                "mode": "CS_MODE_ARM",
             },
         },
         "funcs": {
-            "reg_state": printRegs_arm64,
+            "reg_sets": regSets_arm64,
         },
         "cpus": {
             "": None,
@@ -501,8 +687,11 @@ archez = {
             "a72": UC_CPU_ARM64_A72,
             "max": UC_CPU_ARM64_MAX,
         },
-    },
-    "arm32": {
+    }
+
+def archTable_arm32():
+    importConsts("unicorn.arm_const")
+    return {
         "emu": {
             "unicorn": {
                 "arch": UC_ARCH_ARM,
@@ -513,18 +702,20 @@ archez = {
         },
         "asm": {
             "keystone": {
-                "arch": KS_ARCH_ARM,
-                "mode": KS_MODE_ARM,
+                "arch": "KS_ARCH_ARM",
+                "mode": "KS_MODE_ARM",
+                "ptr_dir": ".long",
+                "ptr_size": 4,
             },
         },
         "dis": {
             "capstone": {
-                "arch": capstone.CS_ARCH_ARM,
-                "mode": capstone.CS_MODE_ARM,
+                "arch": "CS_ARCH_ARM",
+                "mode": "CS_MODE_ARM",
             },
         },
         "funcs": {
-            "reg_state": printRegs_arm32,
+            "reg_sets": regSets_arm32,
         },
         "cpus": {
             "": None,
@@ -563,11 +754,20 @@ archez = {
             "pxa270c5": UC_CPU_ARM_PXA270C5,
             "max": UC_CPU_ARM_MAX,
         },
-    },
-}
+    }
+
+archez = lazyTable({
+    "x64": archTable_x64,
+    "x86": archTable_x86,
+    "arm64": archTable_arm64,
+    "arm32": archTable_arm32,
+    "amd64": lambda: archez["x64"],
+})
+archAliases = {"amd64": "x64"} # Other names for an arch, the tables keyed by arch only have the main one
 
-archez["amd64"] = archez["x64"]
-archez["x86"]["cpus"] = archez["x64"]["cpus"]
+pageSize = 0x1000
+zeroPage = bytes(pageSize)
+disMaxInsn = 16 # Longest instruction of any arch, x86's
 
 ### Helper Functions ###########################################################
 def configPrint(sConfig):
@@ -575,21 +775,105 @@ def configPrint(sConfig):
     for cK, cV in sConfig.items():
         print(f"{cK} = {cV}")
 
+# parseInt - Parse a number or an expression
+# Plain numbers skip numexpr, which is only imported for real expressions
+def parseInt(x):
+    try:
+        return int(x, 0)
+    except ValueError:
+        import numexpr
+        return int(numexpr.evaluate(x).item())
+
+configBools = {"1": True, "on": True, "true": True, "yes": True, "0": False, "off": False, "false": False, "no": False}
+
+# configParse - Turn the text of an option's value into its type, see sConfigTypes
+def configParse(name, text):
+    kind = sConfigTypes.get(name, int)
+    if kind is bool:
+        if text.lower() not in configBools:
+            raise ValueError(f"{name} is on or off, not {text}")
+        return configBools[text.lower()]
+    if name == "emu/cpu":
+        cpus = archez[sConfig["emu/arch"]]["cpus"] if sConfig["emu/arch"] in archez else {}
+        if text not in cpus:
+            raise ValueError(f"not a {sConfig['emu/arch']} cpu, supported cpus: {', '.join(c for c in cpus if c)}")
+    if kind is str:
+        return text
+    return parseInt(text)
+
+# Printable ASCII stays as is in the text column of a hex dump, the rest becomes "."
+hexAscii = bytes(b if 0x20 <= b < 0x7f else 0x2e for b in range(256))
+
+# dHexLines - Hex dump lines, 16 bytes per row
+# squeeze = replace runs of all zero rows after the first one with a single "*"
+#           like xxd -a, the last row is always shown
+def dHexLines(inBytes, baseAddr, squeeze=False):
+    data = memoryview(inBytes).cast("B")
+    zeros = bytes(16)
+    skipping = False
+    last = len(data) - 16
+    for offs in range(0, len(data), 16):
+        row = data[offs:offs+16]
+        if squeeze and row == zeros and offs < last:
+            if skipping:
+                continue
+            skipping = offs > 0 and data[offs-16:offs] == zeros
+            if skipping:
+                yield "*"
+                continue
+        else:
+            skipping = False
+        yield f"{baseAddr + offs:08x}: {row.hex(' '):<47}  {bytes(row).translate(hexAscii).decode()}"
+
 # dHex - Dump Hex
 # inBytes = byte array to dump
 # baseAddr = the base address
 def dHex(inBytes,baseAddr):
-    offs = 0
-    while offs < len(inBytes):
-        bHex = ""
-        bAsc = ""
-        bChunk = inBytes[offs:offs+16]
-        for b in bChunk:
-            bAsc += chr(b) if chr(b).isprintable() and b < 0x7f else '.'
-            bHex += "{:02x} ".format(b)
-        sp = " "*(48-len(bHex))
-        print("{:08x}: {}{} {}".format(baseAddr + offs, bHex, sp, bAsc))
-        offs = offs + 16
+    pageOut(dHexLines(inBytes, baseAddr, sConfig["hex/squeeze"]))
+
+# pageOut - Write lines to stdout in big chunks
+# If hex/pager is on and stdout is a terminal, output taller than the
+# terminal goes through $PAGER (default: less) instead
+def pageOut(lines):
+    lines = iter(lines)
+    chunk = []
+    if sConfig["hex/pager"] and sys.stdout.isatty():
+        import shutil
+        height = shutil.get_terminal_size().lines - 1
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) > height:
+                return pagerOut(chunk, lines)
+    writeLines(itertools.chain(chunk, lines), sys.stdout)
+
+# writeLines - Write lines to a file 4096 at a time
+def writeLines(lines, f):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= 4096:
+            f.write("\n".join(chunk) + "\n")
+            chunk = []
+    if chunk:
+        f.write("\n".join(chunk) + "\n")
+
+# pagerOut - Stream lines to $PAGER, first = lines already taken from lines
+def pagerOut(first, lines):
+    import os, subprocess
+    sys.stdout.flush()
+    pager = subprocess.Popen(os.environ.get("PAGER") or "less -R", shell=True, stdin=subprocess.PIPE)
+    try:
+        chunk = first
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= 4096:
+                pager.stdin.write(("\n".join(chunk) + "\n").encode())
+                chunk = []
+        pager.stdin.write(("\n".join(chunk) + "\n").encode() if chunk else b"")
+        pager.stdin.close()
+    except (BrokenPipeError, OSError):
+        pass # Quit the pager early
+    pager.wait()
 
 # loadAsm - Load assembly listing from a file
 def loadAsm(fname, cmdf):
@@ -664,9 +948,83 @@ def exportBin(inCode, fileType, fArch, fname):
         f.close()
     print(f"Exported code to {fname}")
 
+### Binary Loading #############################################################
+elfMachines = {3: "x86", 62: "x64", 40: "arm32", 183: "arm64"} # e_machine -> arch
+elfStackTop  = 0x7fff0000 # Loaded binaries get their own stack below here
+elfStackSize = 0x20000
+
+# elfParse - Read the header and PT_LOAD program headers of an ELF file
+# Returns None if it isn't an ELF, else a dict with the arch, entry point,
+# whether it needs an interpreter and the segments as
+# (file offset, address, file size, memory size)
+def elfParse(fname):
+    with open(fname, "rb") as f:
+        ident = f.read(16)
+        if ident[:4] != b"\x7fELF":
+            return None
+        if ident[5] != 1:
+            raise ValueError("only little endian ELF files are supported")
+        is64 = ident[4] == 2
+        hdr = f.read(48 if is64 else 36)
+        if is64:
+            eType, eMachine, eVersion, eEntry, ePhoff, eShoff, eFlags, eEhsize, ePhentsize, ePhnum = struct.unpack("<HHIQQQIHHH", hdr[:42])
+        else:
+            eType, eMachine, eVersion, eEntry, ePhoff, eShoff, eFlags, eEhsize, ePhentsize, ePhnum = struct.unpack("<HHIIIIIHHH", hdr[:30])
+        elf = {"arch": elfMachines.get(eMachine), "machine": eMachine, "entry": eEntry, "interp": False, "segments": []}
+        f.seek(ePhoff)
+        phdrs = f.read(ePhentsize * ePhnum)
+    for n in range(ePhnum):
+        ph = phdrs[n*ePhentsize:(n+1)*ePhentsize]
+        if is64:
+            pType, pFlags, pOffset, pVaddr, pPaddr, pFilesz, pMemsz = struct.unpack("<IIQQQQQ", ph[:48])
+        else:
+            pType, pOffset, pVaddr, pPaddr, pFilesz, pMemsz = struct.unpack("<IIIIII", ph[:24])
+        if pType == 1: # PT_LOAD
+            elf["segments"].append((pOffset, pVaddr, pFilesz, pMemsz))
+        elif pType == 3: # PT_INTERP
+            elf["interp"] = True
+    return elf
+
+### Engine Cache ###############################################################
+# Keystone and capstone handles don't keep anything between calls, so one of
+# each is made per arch/mode and reused. The cache belongs to the arch and cpu
+# of the last scaremu created: making a scaremu for a different emu/arch or
+# emu/cpu (a switch or /reset with new options) empties it.
+engineCache = {
+    "owner": None, # (arch name, cpu) the cached engines were made for
+    "ks": {},      # (ks_arch, ks_mode) -> Ks
+    "cs": {},      # (cs_arch, cs_mode) -> Cs
+}
+
+# engineOwner - Hand the engine cache to an arch/cpu, dropping it if that changed
+def engineOwner(archName, cpu):
+    if engineCache["owner"] != (archName, cpu):
+        engineCache["owner"] = (archName, cpu)
+        engineCache["ks"] = {}
+        engineCache["cs"] = {}
+
+# getKs - Cached keystone handle, ks_arch/ks_mode are constant names like "KS_ARCH_X86"
+def getKs(ks_arch, ks_mode):
+    ks = engineCache["ks"].get((ks_arch, ks_mode))
+    if ks is None:
+        importConsts("keystone")
+        ks = Ks(globals()[ks_arch], globals()[ks_mode])
+        engineCache["ks"][(ks_arch, ks_mode)] = ks
+    return ks
+
+# getCs - Cached capstone handle, cs_arch/cs_mode are constant names like "CS_ARCH_X86"
+# Capstone's detail mode stays off, disIter only needs what disasm_lite gives
+def getCs(cs_arch, cs_mode):
+    cs = engineCache["cs"].get((cs_arch, cs_mode))
+    if cs is None:
+        capstone = importlib.import_module("capstone")
+        cs = capstone.Cs(getattr(capstone, cs_arch), getattr(capstone, cs_mode)) # detail stays off
+        engineCache["cs"][(cs_arch, cs_mode)] = cs
+    return cs
+
 def ksAssemble(ks_arch, ks_mode, CODE):
     try:
-        ks = Ks(ks_arch, ks_mode)
+        ks = getKs(ks_arch, ks_mode)
         mc, num = ks.asm(CODE)
         return bytes(mc)
     except KsError as e:
@@ -677,52 +1035,657 @@ def ksAssemble(ks_arch, ks_mode, CODE):
             print("ERROR: %s" %e)
             return
 
-def printListing(mu, asmInstructions, plan9=False):
-    addr = sConfig["emu/baseaddr"]
-    if len(asmInstructions) == 0:
-        print("No instructions!")
+### Incremental Assembler ######################################################
+# Data directives encode the same wherever they land, everything else that
+# starts with a dot (.align, .org, .code32, ...) depends on the whole stream
+asmDataDirectives = [".byte", ".short", ".hword", ".word", ".int", ".long", ".quad",
+                     ".ascii", ".asciz", ".string", ".fill", ".zero", ".space"]
+asmLabelDef = re.compile(r"^([A-Za-z_.$][\w.$@]*)\s*:")
+asmSymbol   = re.compile(r"[A-Za-z_.$][\w.$@]*")
+asmMarker   = "__scare_ln" # Prefix for the per-line labels used by ksLayout
+
+# asmLineInfo - Look at a line of assembly without assembling it
+# Returns (labels defined, symbols used, safe)
+# safe is False if the line can't be encoded on its own at a given address
+def asmLineInfo(line):
+    defs = []
+    syms = set()
+    safe = "=" not in line # Literal pools and symbol assignments
+    for stmt in line.split(";"):
+        stmt = stmt.strip()
+        m = asmLabelDef.match(stmt)
+        while m:
+            defs.append(m.group(1))
+            stmt = stmt[m.end():].strip()
+            m = asmLabelDef.match(stmt)
+        if stmt == "":
+            continue
+        tokens = asmSymbol.findall(stmt)
+        if not tokens:
+            continue # No mnemonic, ex: a bare number, keystone reports it
+        if tokens[0].startswith(".") and tokens[0].lower() not in asmDataDirectives:
+            safe = False
+        syms.update(tokens[1:])
+    return defs, syms, safe
+
+# ksLayout - Assemble a program once and find where each line ended up
+# Every line gets a marker label and a table of the marker addresses is appended
+# to the code, so one keystone pass gives both the bytes and the line offsets.
+# Returns (machine_code, offsets) or None if the table doesn't make sense.
+def ksLayout(ks, asmInstructions, baseAddr, ptrDir, ptrSize):
+    nLines = len(asmInstructions)
+    marked = [f"{asmMarker}{n}: {l}" for n, l in enumerate(asmInstructions)]
+    marked.append(f"{asmMarker}{nLines}:")
+    marked.append(f"{ptrDir} " + ", ".join(f"{asmMarker}{n}" for n in range(nLines+1)))
+    mc, num = ks.asm("; ".join(marked), baseAddr)
+    mc = bytes(mc or b"")
+    tableSize = (nLines+1)*ptrSize
+    readOffs = lambda o: int.from_bytes(mc[o:o+ptrSize], "little") - baseAddr
+    # The table is the last thing in the output unless an arm literal pool got
+    # emitted after it, so walk back until the first and last entries fit
+    tableOffs = len(mc) - tableSize
+    while tableOffs >= 0 and (readOffs(tableOffs) != 0 or readOffs(tableOffs+tableSize-ptrSize) != tableOffs):
+        tableOffs -= 1
+    if tableOffs < 0:
+        return
+    offsets = [readOffs(tableOffs+n*ptrSize) for n in range(nLines+1)]
+    if offsets != sorted(offsets):
         return
-    asmString = "; ".join(asmInstructions)
-    lineMax = 0
+    if tableOffs + tableSize == len(mc):
+        code = mc[:tableOffs]
+    else:
+        # Something (an arm literal pool) landed after the table and the code
+        # that points at it moved, so get the real bytes from a plain pass
+        mc, num = ks.asm("; ".join(asmInstructions), baseAddr)
+        code = bytes(mc or b"")
+        if len(code) < tableOffs:
+            return
+    return code, offsets
+
+# scareasm - Incremental assembler
+# Keeps the address and bytes of every line. A line is only encoded again if
+# its address or a label it uses moved. Appended lines that don't touch labels
+# are encoded on their own, anything else gets one full keystone pass through
+# ksLayout so the output always matches assembling the whole program.
+class scareasm:
+    def __init__(self, ks_arch, ks_mode, origin, ptr_dir, ptr_size):
+        self.ks_arch = ks_arch
+        self.ks_mode = ks_mode
+        self.origin = origin
+        self.ptr_dir = ptr_dir
+        self.ptr_size = ptr_size
+        self.src   = [] # Cached lines
+        self.addrs = [] # Address of each cached line
+        self.code  = [] # Bytes of each cached line
+        self.end   = origin # Address after the last cached line
+        self.defs  = {} # Label -> index of the cached line defining it
+        self.uses  = {} # Symbol -> index of the first cached line using it
+        self.infos = {} # asmLineInfo results by line text
+    @property
+    def ks(self):
+        return getKs(self.ks_arch, self.ks_mode) # keystone is loaded on first use
+    def lineInfo(self, line):
+        info = self.infos.get(line)
+        if info is None:
+            info = asmLineInfo(line)
+            self.infos[line] = info
+        return info
+    def cacheLine(self, line, addr, mc):
+        n = len(self.src)
+        defs, syms, safe = self.lineInfo(line)
+        for d in defs:
+            self.defs[d] = n
+        for sym in syms:
+            self.uses.setdefault(sym, n)
+        self.src.append(line)
+        self.addrs.append(addr)
+        self.code.append(mc)
+        self.end = addr + len(mc)
+    def truncate(self, n):
+        if n >= len(self.src):
+            return
+        del self.src[n:]
+        del self.addrs[n:]
+        del self.code[n:]
+        self.end = self.addrs[-1] + len(self.code[-1]) if n > 0 else self.origin
+        self.defs = {k: v for k, v in self.defs.items() if v < n}
+        self.uses = {k: v for k, v in self.uses.items() if v < n}
+    def fullPass(self, asm_code):
+        layout = None
+        if all(self.lineInfo(l)[2] for l in asm_code):
+            try:
+                layout = ksLayout(self.ks, asm_code, self.origin, self.ptr_dir, self.ptr_size)
+            except KsError:
+                layout = None # Let the plain pass report the error
+        self.truncate(0)
+        if layout is None:
+            # Can't split this program into lines, so don't cache anything
+            mc, num = self.ks.asm("; ".join(asm_code), self.origin)
+            return bytes(mc or b"")
+        code, offsets = layout
+        for n, line in enumerate(asm_code):
+            self.cacheLine(line, self.origin + offsets[n], code[offsets[n]:offsets[n+1]])
+        return code
+    def assemble(self, asm_code):
+        # Find how much of the cache is still the same program
+        keep = len(self.src)
+        if asm_code[:keep] != self.src:
+            keep = 0
+            while keep < len(self.src) and keep < len(asm_code) and self.src[keep] == asm_code[keep]:
+                keep += 1
+        # Lines using a label from the part that changed may have to move
+        moved = True
+        while moved:
+            moved = False
+            for label, n in self.defs.items():
+                firstUse = self.uses.get(label, keep)
+                if n >= keep and firstUse < keep:
+                    keep = firstUse
+                    moved = True
+        self.truncate(keep)
+        for line in asm_code[keep:]:
+            defs, syms, safe = self.lineInfo(line)
+            if defs or not safe or any(sym in self.defs for sym in syms):
+                return self.fullPass(asm_code)
+        for line in asm_code[keep:]:
+            mc, num = self.ks.asm(line, self.end)
+            self.cacheLine(line, self.end, bytes(mc or b""))
+        return b"".join(self.code)
+    def lineMap(self):
+        return list(zip(self.src, self.addrs, self.code))
+
+# listingMap - Find the address and bytes of every line in a program
+# Returns a list of (line, offset from the start of the code, bytes)
+def listingMap(mu, asmInstructions):
+    asmCache = mu.asm_cache
+    if asmInstructions == asmCache.src:
+        return asmCache.lineMap() # Already laid out by scaremu.asm
+    try:
+        layout = ksLayout(asmCache.ks, asmInstructions, asmCache.origin, asmCache.ptr_dir, asmCache.ptr_size)
+    except KsError as e:
+        print("ERROR: %s" %e)
+        return
+    if layout is not None:
+        code, offsets = layout
+        return [(l, offsets[n], code[offsets[n]:offsets[n+1]]) for n, l in enumerate(asmInstructions)]
+    # Couldn't mark the lines, so fall back to encoding each line on its own
+    lines = []
+    offs = asmCache.origin
     for l in asmInstructions:
-        lineMax = len(l) if len(l) > lineMax else lineMax
-    asmAssembled = ksAssemble(mu.asm_arch, mu.asm_mode, "; ".join(asmInstructions))
-    codeOffs = 0
-    lineNum = 1
+        try:
+            mc, num = asmCache.ks.asm(l, offs)
+            mc = bytes(mc or b"")
+        except KsError:
+            mc = b""
+        lines.append((l, offs, mc))
+        offs += len(mc)
+    return lines
+
+# listingLines - Format a listing, one output line at a time
+def listingLines(lineMap, baseAddr, plan9=False, color=True):
+    cNum, cPipe, cAsm, cCmt, cByt, cE = (cLnNum, cLnPipe, cAsmList, cComment, cBytes, cEnd) if color else ("",)*6
+    lineMax = max(len(l) for l, offs, asmBytes in lineMap)
     empty = True
-    # Predicting that in longer code with short jumps, this append trick will result in incorrect assembly if outside the range of a short jump
-    for i in asmInstructions:
-        asmStringLen = len(asmAssembled)
-        tempAsmString = asmString +" ; " + i
-        assembledAsm = ksAssemble(mu.asm_arch, mu.asm_mode, tempAsmString)
-        if assembledAsm is not None:
-            assembledAsmLen = len(assembledAsm) - asmStringLen # Disgusting hack to get the full length
-        else:
-            assembledAsmLen = 0
-        asmBytes = asmAssembled[codeOffs:codeOffs+assembledAsmLen]
-        spacing = " "*(lineMax - len(i))
+    for lineNum, (i, offs, asmBytes) in enumerate(lineMap, 1):
         if plan9:
             if len(i) > 0:
                 if len(asmBytes) > 0:
-                    print(f"\tWORD $0x{asmBytes[::-1].hex()} // {i}")
+                    yield f"\tWORD $0x{asmBytes[::-1].hex()} // {i}"
                 else:
-                    print(f"{i}")
+                    yield f"{i}"
                 empty = False
             else:
                 if not empty:
-                    print("")
+                    yield ""
                 empty = True
         else:
-            print(f"{cLnNum}{lineNum:03d}{cEnd}{cLnPipe}│{cEnd} {cAsmList}{i}{cEnd} {spacing}{cComment}; {addr:04X}: {cBytes}{asmBytes.hex()}{cEnd}")
-        addr = addr+assembledAsmLen
-        codeOffs = codeOffs+assembledAsmLen
-        lineNum = lineNum + 1
+            spacing = " "*(lineMax - len(i))
+            yield f"{cNum}{lineNum:03d}{cE}{cPipe}│{cE} {cAsm}{i}{cE} {spacing}{cCmt}; {baseAddr+offs:04X}: {cByt}{asmBytes.hex()}{cE}"
+
+# disLines - Format disassembly from scaremu.disIter like a listing, one output line at a time
+# Lines are padded to a fixed width, the longest one isn't known until the end
+def disLines(insns, color=True):
+    cNum, cPipe, cAsm, cCmt, cByt, cE = (cLnNum, cLnPipe, cAsmList, cComment, cBytes, cEnd) if color else ("",)*6
+    for lineNum, (addr, asmBytes, text) in enumerate(insns, 1):
+        yield f"{cNum}{lineNum:03d}{cE}{cPipe}│{cE} {cAsm}{text:<32}{cE} {cCmt}; {addr:04X}: {cByt}{asmBytes.hex()}{cE}"
+
+# printDis - Print the disassembly of size bytes at addr as it's decoded, or write it to outFile
+def printDis(mu, addr, size, outFile=None):
+    if outFile:
+        with open(outFile, "w") as f:
+            writeLines(disLines(mu.disIter(addr, size), color=False), f)
+        print(f"Wrote disassembly to {outFile}")
+    else:
+        writeLines(disLines(mu.disIter(addr, size)), sys.stdout)
+
+# printListing - Print a listing, or write it to outFile
+# The program is assembled at most once, see listingMap
+def printListing(mu, asmInstructions, plan9=False, outFile=None):
+    if len(asmInstructions) == 0:
+        print("No instructions!")
+        return
+    lineMap = listingMap(mu, asmInstructions)
+    if lineMap is None:
+        return
+    baseAddr = sConfig["emu/baseaddr"] - mu.asm_cache.origin
+    if outFile:
+        with open(outFile, "w") as f:
+            writeLines(listingLines(lineMap, baseAddr, plan9, color=False), f)
+        print(f"Wrote listing to {outFile}")
+    else:
+        sys.stdout.write("\n".join(listingLines(lineMap, baseAddr, plan9)) + "\n")
+
+##### Linux Syscalls
+# Calls handled by scaresys, by number, for each arch
+sysCalls = {
+    "x64": {0: "read", 1: "write", 9: "mmap", 10: "mprotect", 11: "munmap", 12: "brk", 20: "writev",
+            39: "getpid", 60: "exit", 102: "getuid", 104: "getgid", 107: "getuid", 108: "getgid", 158: "arch_prctl",
+            218: "getpid", 231: "exit"},
+    "x86": {1: "exit", 3: "read", 4: "write", 20: "getpid", 24: "getuid", 45: "brk", 47: "getgid", 90: "old_mmap",
+            91: "munmap", 125: "mprotect", 146: "writev", 192: "mmap2", 199: "getuid", 200: "getgid", 252: "exit",
+            258: "getpid"},
+    "arm32": {1: "exit", 3: "read", 4: "write", 20: "getpid", 24: "getuid", 45: "brk", 47: "getgid", 91: "munmap",
+              125: "mprotect", 146: "writev", 192: "mmap2", 199: "getuid", 200: "getgid", 248: "exit", 256: "getpid"},
+    "arm64": {63: "read", 64: "write", 66: "writev", 93: "exit", 94: "exit", 96: "getpid", 172: "getpid", 174: "getuid",
+              175: "getuid", 176: "getgid", 177: "getgid", 214: "brk", 215: "munmap", 222: "mmap", 226: "mprotect"},
+}
+# set_tid_address is getpid, there's one thread and its id is the pid
+# Registers holding the call number, the arguments and the result
+sysRegs = {
+    "x64":   ("rax", ("rdi", "rsi", "rdx", "r10", "r8", "r9"), "rax"),
+    "x86":   ("eax", ("ebx", "ecx", "edx", "esi", "edi", "ebp"), "eax"),
+    "arm32": ("r7", ("r0", "r1", "r2", "r3", "r4", "r5"), "r0"),
+    "arm64": ("x8", ("x0", "x1", "x2", "x3", "x4", "x5"), "x0"),
+}
+sysBrkBase  = 0x10000000 # Where the heap starts, brk maps pages from here up
+sysMmapBase = 0x40000000 # Where mmap puts mappings that don't ask for an address
+sysEBADF, sysENOMEM, sysEFAULT, sysENODEV, sysEINVAL, sysENOSYS = 9, 12, 14, 19, 22, 38
+
+# scaresys - Linux syscalls for a scaremu
+# syscall on x64, int 0x80 on x86 and svc on arm run the handler for the call
+# number in sysCalls. Guest output to stdout and stderr is buffered and written
+# when the run ends or sys/buffer bytes are waiting, not once per call.
+# Pages mapped by brk and mmap are kept with the sparse pages, so reset unmaps
+# them, but rewinds and /stepback don't take back brk, mmap or output.
+class scaresys:
+    def __init__(self, smu):
+        self.smu = smu
+        nrName, argNames, retName = sysRegs[smu.arch_name]
+        self.reader = regreader(tuple(smu.getReg(n) for n in (nrName,) + argNames), [8] * (len(argNames) + 1))
+        self.ret_reg = smu.getReg(retName)
+        self.word = archez[smu.arch_name]["asm"]["keystone"]["ptr_size"]
+        self.mask = (1 << (8 * self.word)) - 1
+        self.calls = {nr: getattr(self, "sys_" + name) for nr, name in sysCalls[smu.arch_name].items()}
+        self.stdin = bytearray() # Bytes guest reads of fd 0 get, see /stdin
+        self.quiet = False # Output is dropped, for undo log replays
+        self.clear()
+    def clear(self):
+        self.brk = self.brk_mapped = sysBrkBase
+        self.mmap_next = sysMmapBase
+        self.out = []        # (fd, bytes) waiting to be written
+        self.out_size = 0
+        self.exit_code = None # Set when the guest calls exit
+        self.unknown = {}    # Call number -> times an unhandled call was made
+    # start - Hooks for the syscall instruction of the arch, for one run
+    def start(self, quiet=False):
+        uc = self.smu.mu_ctx
+        self.quiet = quiet
+        self.exit_code = None
+        if self.smu.arch_name == "x64":
+            return [uc.hook_add(UC_HOOK_INSN, self.hookSyscall, None, 1, 0, UC_X86_INS_SYSCALL)]
+        return [uc.hook_add(UC_HOOK_INTR, self.hookIntr)]
+    def stop(self):
+        self.flush()
+        if self.unknown:
+            calls = ", ".join(f"{nr}" if n == 1 else f"{nr} ({n} times)" for nr, n in self.unknown.items())
+            self.smu.errPrint("syscall", f"Returned -ENOSYS for unhandled syscalls: {calls}")
+        self.unknown = {}
+    def hookIntr(self, uc, intno, user_data):
+        # int 0x80 on x86, svc (exception 2) on arm, anything else is a fault
+        if intno == (0x80 if self.smu.arch_name == "x86" else 2):
+            self.hookSyscall(uc, user_data)
+        else:
+            self.smu.errPrint("syscall", f"Unhandled interrupt {intno} at PC={uc.reg_read(self.smu.ip_reg):#x}")
+            uc.emu_stop()
+    def hookSyscall(self, uc, user_data):
+        regs = self.reader.read(uc)
+        nr = regs[0] & self.mask
+        call = self.calls.get(nr)
+        if call is None:
+            self.unknown[nr] = self.unknown.get(nr, 0) + 1
+            ret = -sysENOSYS
+        else:
+            ret = call(uc, *[r & self.mask for r in regs[1:]])
+        if ret is not None:
+            uc.reg_write(self.ret_reg, ret & self.mask)
+    # memRead - size bytes of guest memory, raises UcError if they aren't mapped
+    def memRead(self, uc, addr, size):
+        return bytes(uc.mem_read(addr, size))
+    # Output ###################################################################
+    def emit(self, fd, data):
+        if self.quiet:
+            return
+        self.out.append((fd, data))
+        self.out_size += len(data)
+        if self.out_size >= sConfig["sys/buffer"]:
+            self.flush()
+    # flush - Write the waiting output, joined into one write per run of the same fd
+    def flush(self):
+        out, self.out, self.out_size = self.out, [], 0
+        n = 0
+        while n < len(out):
+            fd = out[n][0]
+            end = n
+            while end < len(out) and out[end][0] == fd:
+                end += 1
+            data = b"".join(d for f, d in out[n:end])
+            f = sys.stdout if fd == 1 else sys.stderr
+            if hasattr(f, "buffer"):
+                f.flush()
+                f.buffer.write(data)
+                f.buffer.flush()
+            else:
+                f.write(data.decode("utf-8", "replace")) # Ex: captured in a batch run
+            n = end
+    # Calls ####################################################################
+    # Each one gets the argument registers and returns the result, negative for an errno
+    def sys_read(self, uc, fd, buf, count, *rest):
+        if fd != 0:
+            return -sysEBADF
+        data = bytes(self.stdin[:count])
+        try:
+            self.smu.memWrite(buf, data)
+        except UcError:
+            return -sysEFAULT
+        del self.stdin[:count]
+        return len(data)
+    def sys_write(self, uc, fd, buf, count, *rest):
+        if fd not in (1, 2):
+            return -sysEBADF
+        try:
+            self.emit(fd, self.memRead(uc, buf, count))
+        except UcError:
+            return -sysEFAULT
+        return count
+    def sys_writev(self, uc, fd, iov, iovcnt, *rest):
+        if fd not in (1, 2):
+            return -sysEBADF
+        w = self.word
+        total = 0
+        try:
+            vecs = self.memRead(uc, iov, iovcnt * 2 * w)
+            for n in range(iovcnt):
+                base = int.from_bytes(vecs[2*n*w:(2*n+1)*w], "little")
+                size = int.from_bytes(vecs[(2*n+1)*w:(2*n+2)*w], "little")
+                self.emit(fd, self.memRead(uc, base, size))
+                total += size
+        except UcError:
+            return total or -sysEFAULT
+        return total
+    def sys_exit(self, uc, code, *rest):
+        self.exit_code = code & 0xff
+        uc.emu_stop()
+        return None
+    def sys_arch_prctl(self, uc, code, addr, *rest):
+        if code == 0x1002: # ARCH_SET_FS, static binaries set up thread local storage with it
+            uc.reg_write(UC_X86_REG_FS_BASE, addr)
+            return 0
+        if code == 0x1003: # ARCH_GET_FS
+            try:
+                self.smu.memWrite(addr, uc.reg_read(UC_X86_REG_FS_BASE).to_bytes(8, "little"))
+            except UcError:
+                return -sysEFAULT
+            return 0
+        return -sysEINVAL
+    def sys_getpid(self, uc, *rest):
+        return 1000
+    def sys_getuid(self, uc, *rest):
+        return 1000
+    def sys_getgid(self, uc, *rest):
+        return 1000
+    # Memory ###################################################################
+    # mapPages - Map the pages in start..end that aren't mapped yet
+    # They're write protected like the rest of memory, see hookDirty
+    # zero = also zero the ones that were, like a new mapping
+    def mapPages(self, start, end, zero=True):
+        smu = self.smu
+        for p in range(start & ~(pageSize-1), end, pageSize):
+            if smu.isMapped(p):
+                if zero:
+                    smu.memWrite(p, zeroPage)
+                continue
+            smu.mu_ctx.mem_map(p, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+            smu.sparse_pages.add(p)
+    def sys_brk(self, uc, addr, *rest):
+        if addr <= self.brk:
+            if addr >= sysBrkBase:
+                self.brk = addr
+            return self.brk
+        end = (addr + pageSize - 1) & ~(pageSize-1)
+        if end > self.brk_mapped:
+            try:
+                self.mapPages(self.brk_mapped, end)
+            except UcError:
+                return self.brk # Linux returns the old break when it can't grow
+            self.brk_mapped = end
+        self.brk = addr
+        return addr
+    def sys_mmap(self, uc, addr, length, prot, flags, fd, offset):
+        if not flags & 0x20: # MAP_ANONYMOUS, there are no files to map
+            return -sysENODEV
+        if length == 0:
+            return -sysEINVAL
+        size = (length + pageSize - 1) & ~(pageSize-1)
+        if not flags & 0x10: # Not MAP_FIXED, the address is only a hint
+            addr = self.mmap_next
+            self.mmap_next += size
+        elif addr & (pageSize-1):
+            return -sysEINVAL
+        try:
+            self.mapPages(addr, addr + size)
+        except UcError:
+            return -sysENOMEM
+        return addr
+    def sys_mmap2(self, uc, addr, length, prot, flags, fd, pgoffset):
+        return self.sys_mmap(uc, addr, length, prot, flags, fd, pgoffset * pageSize)
+    def sys_old_mmap(self, uc, args, *rest):
+        # x86 mmap takes a pointer to its six arguments
+        try:
+            data = self.memRead(uc, args, 24)
+        except UcError:
+            return -sysEFAULT
+        return self.sys_mmap(uc, *[int.from_bytes(data[n:n+4], "little") for n in range(0, 24, 4)])
+    def sys_munmap(self, uc, *rest):
+        return 0 # Pages stay mapped until reset
+    def sys_mprotect(self, uc, *rest):
+        return 0 # Protection is left alone, it's used to track dirty pages
+
+##### Undo Log
+undoChunkWords = 0x10000 # Words per undo log chunk, the oldest chunk is dropped when undo/size is reached
+undoSegmentBlocks = 256  # Blocks per undo log record, more means fewer saved pages but longer replays
+pageWords = pageSize // 8
+
+# scareundo - Undo log for scaremu, see /stepback
+# A run is logged as records of 64 bit words, one per undoSegmentBlocks blocks:
+#   [address, until, insns, nblocks, npages, context id, (address, size) * nblocks, (page, contents...) * npages, record length]
+# with the blocks it ran and what the pages it wrote to looked like before.
+# The cpu context from the start of the record, every register and not just
+# the main ones, is kept in ctxs under the context id. Pages are saved on
+# their first write in a record by scaremu.hookDirty, so there is no per write
+# hook. Undoing puts a whole record back, then runs forward again to land on
+# the right instruction. The length at the end lets records be popped from the back.
+class scareundo:
+    def __init__(self, smu):
+        self.smu = smu
+        self.ctx_words = (smu.mu_ctx.context_save().size + 7) // 8 # What a context counts for against undo/size
+        self.recording = False
+        self.clear()
+    def clear(self):
+        self.chunks = collections.deque() # (instructions, words) of full chunks still kept
+        self.cur = array.array("Q")       # The chunk being filled
+        self.cur_steps = 0                # Instructions in cur
+        self.total = 0                    # Instructions logged minus instructions undone, the position in time
+        self.first = 0                    # Position of the oldest record still kept
+        self.ctxs = {}                    # Context id -> cpu context at the start of the record
+        self.next_ctx = 0
+    # Recording ################################################################
+    # start - Hook a run, count = also count the instructions for run_stats
+    def start(self, begin, until, count):
+        uc = self.smu.mu_ctx
+        self.count = count
+        self.until = until
+        self.last = None # (address, size, insns) of the last block
+        self.pages = dict.fromkeys(self.smu.mu_writable) # Protected again by openRecord
+        self.openRecord(uc, begin)
+        self.recording = True
+        return [uc.hook_add(UC_HOOK_BLOCK, self.hookBlock)]
+    def stop(self, pc, until):
+        self.recording = False
+        if self.last is not None and pc != until:
+            address, size, nInsns = self.last
+            if address <= pc < address + size:
+                # Stopped part way into the block
+                cs = getCs(self.smu.dis_arch, self.smu.dis_mode)
+                ran = sum(1 for i in cs.disasm_lite(bytes(self.smu.mu_ctx.mem_read(address, pc - address)), address))
+                self.rec_insns -= nInsns - ran
+                if self.count:
+                    self.smu.run_insns -= nInsns - ran
+        if self.rec_insns or self.pages:
+            self.addRecord()
+    # openRecord - Start a new record at address
+    # The pages the last record wrote get write protected again, so the new
+    # record sees their first write too
+    def openRecord(self, uc, address):
+        writable = self.smu.mu_writable
+        for page in self.pages:
+            if page in writable:
+                uc.mem_protect(page, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+                writable.discard(page)
+        self.pages = {}
+        self.rec_start = address
+        self.rec_ctx = uc.context_save()
+        self.rec_insns = 0
+        self.blocks = []
+    def hookBlock(self, uc, address, size, user_data):
+        if len(self.blocks) >= 2*undoSegmentBlocks:
+            self.addRecord()
+            self.openRecord(uc, address)
+        nInsns = self.smu.blockInsns(uc, address, size)
+        self.blocks += (address, size)
+        self.rec_insns += nInsns
+        self.last = (address, size, nInsns)
+        if self.count:
+            self.smu.run_insns += nInsns
+    # savePage - Keep what a page looked like before the record wrote to it, see scaremu.hookDirty
+    def savePage(self, uc, page):
+        if page not in self.pages:
+            self.pages[page] = bytes(uc.mem_read(page, pageSize))
+    # addRecord - Log the open record
+    def addRecord(self):
+        cur = self.cur
+        if len(cur) >= undoChunkWords:
+            self.chunks.append((self.cur_steps, cur))
+            self.cur = cur = array.array("Q")
+            self.cur_steps = 0
+            while self.words() * 8 > sConfig["undo/size"] and self.chunks:
+                steps, words = self.chunks.popleft()
+                self.first += steps
+                i = 0
+                while i < len(words): # The contexts of its records go with it
+                    self.ctxs.pop(words[i+5], None)
+                    i += words[i + 6 + 2*words[i+3] + (1 + pageWords)*words[i+4]]
+        start = len(cur)
+        cur.extend([self.rec_start, self.until, self.rec_insns, len(self.blocks) // 2, len(self.pages), self.next_ctx, *self.blocks])
+        self.ctxs[self.next_ctx] = self.rec_ctx
+        self.next_ctx += 1
+        for page, data in self.pages.items():
+            cur.append(page)
+            cur.frombytes(data)
+        cur.append(len(cur) - start + 1)
+        self.cur_steps += self.rec_insns
+        self.total += self.rec_insns
+    # Undoing ##################################################################
+    # popRecord - Take the newest record off the log, None if it's empty
+    def popRecord(self):
+        if not self.cur:
+            if not self.chunks:
+                return None
+            self.cur_steps, self.cur = self.chunks.pop()
+        cur = self.cur
+        start = len(cur) - cur[-1]
+        rec = cur[start:-1]
+        del cur[start:]
+        self.cur_steps -= rec[2]
+        self.total -= rec[2]
+        return rec
+    # undoRecord - Put back the registers and memory from the start of a record
+    def undoRecord(self, rec):
+        uc = self.smu.mu_ctx
+        pages = 6 + 2*rec[3]
+        for i in range(pages, pages + rec[4]*(1 + pageWords), 1 + pageWords):
+            uc.mem_write(rec[i], rec[i+1:i+1+pageWords].tobytes())
+        uc.context_restore(self.ctxs.pop(rec[5]))
+        uc.reg_write(self.smu.ip_reg, rec[0])
+    # replay - Run again from begin, it's logged as a new record
+    def replay(self, begin, until, count=0):
+        uc = self.smu.mu_ctx
+        hooks = self.start(begin, until, False)
+        sysOn = sConfig["sys/linux"]
+        if sysOn:
+            hooks += self.smu.sys.start(quiet=True) # Syscalls run again, but the output was already shown
+        try:
+            uc.emu_start(begin, until, count=count)
+        finally:
+            for h in hooks:
+                uc.hook_del(h)
+            self.stop(uc.reg_read(self.smu.ip_reg), until)
+            if sysOn:
+                self.smu.sys.stop()
+    # undo - Undo the newest n instructions, returns how many were undone
+    def undo(self, n):
+        done = 0
+        rec = None
+        while done < n:
+            rec = self.popRecord()
+            if rec is None:
+                break
+            self.undoRecord(rec)
+            done += rec[2]
+        if done > n:
+            # Went back too far, run the part of the record that stays done
+            self.replay(rec[0], rec[1], done - n)
+            done = n
+        return done
+    # truncate - Drop the records after position pos without undoing them
+    def truncate(self, pos):
+        if pos < self.first:
+            self.clear()
+            self.total = self.first = pos
+            return
+        while self.total > pos:
+            self.ctxs.pop(self.popRecord()[5], None)
+    # recordBlocks - (address, size) of the blocks each record after position pos ran, oldest record first
+    def recordBlocks(self, pos):
+        out = []
+        for steps, words in list(self.chunks) + [(self.cur_steps, self.cur)]:
+            i = 0
+            while i < len(words):
+                b = i + 6
+                out.append((words[i+2], [(words[j], words[j+1]) for j in range(b, b + 2*words[i+3], 2)]))
+                i += words[b + 2*words[i+3] + (1 + pageWords)*words[i+4]]
+        n, steps = len(out), self.total
+        while n > 0 and steps > pos:
+            n -= 1
+            steps -= out[n][0]
+        return [blocks for steps, blocks in out[n:]]
+    def words(self):
+        return sum(len(w) for s, w in self.chunks) + len(self.cur) + len(self.ctxs) * self.ctx_words
 
 ##### Main Class 
 class scaremu:
     def __init__(self, inArch, cpu):
         if inArch in archez.keys() and cpu in archez[inArch]["cpus"].keys():
-            self.arch_name = inArch.lower()
+            self.arch_name = archAliases.get(inArch.lower(), inArch.lower())
             self.cpu       = cpu
             self.mu_arch   = archez[inArch]["emu"]["unicorn"]["arch"]
             self.mu_mode   = archez[inArch]["emu"]["unicorn"]["mode"]
@@ -736,25 +1699,425 @@ class scaremu:
             self.base_addr = sConfig["emu/baseaddr"]
             self.stack_addr = sConfig["emu/stackaddr"]
             self.mu_memsize = sConfig["emu/memsize"]
+            engineOwner(self.arch_name, self.cpu)
             self.asm_code = [] # Holds the source code
             self.machine_code = b"" # The machine code
-            self.mu_ctx = Uc(self.mu_arch, self.mu_mode, self.mu_cpu) # This is the emulator object
-            self.mu_ctx.mem_map(self.base_addr, self.mu_memsize)
-            self.mu_ctx.reg_write(self.stack_reg, self.stack_addr) # Initialize Stack
+            # Code is assembled at address 0 like a plain ks.asm() call would
+            self.asm_cache = scareasm(self.asm_arch, self.asm_mode, 0,
+                                      archez[inArch]["asm"]["keystone"]["ptr_dir"],
+                                      archez[inArch]["asm"]["keystone"]["ptr_size"])
+            self.initEmu()
+            self.block_insns = {} # (address, size) -> instructions in the block
+            self.dis_cache = {} # (address, size, io/chunk) -> (instructions, chunks), see disIter
+            self.dis_cached = 0 # Instructions held in dis_cache
+            self.trace = None # scaretrace recording the runs, see /trace
+            self.profile = None # scareprofile for the next run, see /profile
+            self.breaks = None # scarebreak stopping the runs, see /break
+            self.run_until = self.base_addr # Where the last run was going, see cont
+            self.undo = scareundo(self) # Undo log of the runs, see /stepback
+            self.sys = scaresys(self) # Linux syscalls, see sys/linux
+            self.run_stats = {"reason": "end", "insns": 0, "time": 0.0, "pc": self.base_addr}
             self.mu_state = "RUN" # The states are INIT, RUN, ERR
         else:
             print("Unsupported arch/cpu")
             return
+    def initEmu(self):
+        self.mu_ctx = Uc(self.mu_arch, self.mu_mode, self.mu_cpu) # This is the emulator object
+        # Memory starts write protected so the first write to a page in a run
+        # can save what the page looked like before, see hookDirty
+        self.mu_ctx.mem_map(self.base_addr, self.mu_memsize, UC_PROT_READ|UC_PROT_EXEC)
+        self.mu_ctx.hook_add(UC_HOOK_MEM_WRITE_PROT, self.hookDirty)
+        self.sparse = None
+        self.sparse_hook = None
+        self.setSparse()
+        self.mu_ctx.reg_write(self.stack_reg, self.stack_addr) # Initialize Stack
+        self.file_maps = [] # (address, size, mmap, ctypes view) mapped straight from a file, see loadBin
+        # One checkpoint per run of new code, the first one is the clean state
+        # code_len = how much of run_code had been executed
+        # ctx      = cpu context at the end of the run
+        # pages    = contents of the pages the run dirtied, from before it ran
+        # ok       = the run reached the end of the code and can be continued
+        # undo     = position of the undo log at the end of the run
+        self.checkpoints = [{"code_len": 0, "ctx": self.mu_ctx.context_save(), "pages": {}, "ok": True, "undo": 0}]
+        self.clearRunState()
+    def clearRunState(self):
+        self.mu_writable = set() # Pages written since the last run started
+        self.run_pages = {} # Page -> contents before the current run touched it
+        self.clean_pages = {} # Page -> contents at the last reset, see reset
+        self.sparse_pages = set() # Pages mapped on demand since the last reset
+        self.run_code = b"" # The machine code the checkpoints were made with
+        self.reg_prev = (None, None) # (register sets, values) from the last printRegs
+        self.undo_mid = False # A /stepback left the state part way into the last run
+    # reset - Put the emulator back to its clean state without making a new Uc
+    # Only the pages written since the last reset get restored
+    def reset(self):
+        self.mu_ctx.emu_stop()
+        for page, data in self.clean_pages.items():
+            if page not in self.sparse_pages:
+                self.mu_ctx.mem_write(page, data)
+        for page in self.mu_writable:
+            if page not in self.sparse_pages:
+                self.mu_ctx.mem_protect(page, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+        for page in self.sparse_pages:
+            self.mu_ctx.mem_unmap(page, pageSize)
+        while self.file_maps:
+            address, size, mm, view = self.file_maps.pop()
+            for p in range(address, address + size, pageSize):
+                self.mu_ctx.mem_unmap(p, pageSize)
+            del view # The mmap can't be closed while it's exported
+            mm.close()
+        self.mu_ctx.context_restore(self.checkpoints[0]["ctx"])
+        del self.checkpoints[1:]
+        self.clearRunState()
+        self.undo.clear()
+        self.sys.clear()
+        self.mu_state = "RUN"
+    # sameConfig - Check the emu/* options this emulator was made with still apply
+    def sameConfig(self):
+        return (self.base_addr == sConfig["emu/baseaddr"] and
+                self.stack_addr == sConfig["emu/stackaddr"] and
+                self.mu_memsize == sConfig["emu/memsize"] and
+                self.sparse == sConfig["emu/sparse"])
+    # setConfig - Apply a changed sConfig option to this emulator
+    # Only the options in configHandlers need anything done, the rest are read
+    # when they're used. Raises ValueError for a value that can't be used.
+    # Returns True if the emulator had to be rebuilt, then the program has to
+    # run again from the clean state.
+    def setConfig(self, name):
+        handler = self.configHandlers.get(name)
+        return bool(handler and handler(self))
+    # checkLayout - Check the memory options describe whole pages
+    def checkLayout(self):
+        if sConfig["emu/memsize"] <= 0 or (sConfig["emu/memsize"] | sConfig["emu/baseaddr"]) & (pageSize-1):
+            raise ValueError(f"emu/baseaddr and emu/memsize have to be multiples of {pageSize:#x}")
+    # rebuild - Make a new Uc with the emu/* options, the program is kept
+    def rebuild(self):
+        self.checkLayout()
+        self.reset() # Closes the file mappings
+        self.base_addr = sConfig["emu/baseaddr"]
+        self.stack_addr = sConfig["emu/stackaddr"]
+        self.mu_memsize = sConfig["emu/memsize"]
+        self.initEmu()
+        self.block_insns = {}
+        self.dis_cache = {}
+        self.dis_cached = 0
+        self.run_until = self.base_addr
+        return True
+    # setMemsize - Grow or shrink the memory region in place, keeping what's in it
+    # Pages mapped by sparse mode or brk/mmap where it grows become part of it,
+    # written pages where it shrinks stay mapped like sparse pages until a reset.
+    def setMemsize(self):
+        self.checkLayout()
+        uc = self.mu_ctx
+        oldEnd = self.base_addr + self.mu_memsize
+        newEnd = self.base_addr + sConfig["emu/memsize"]
+        if newEnd > oldEnd:
+            if any(address < newEnd and oldEnd < address + size for address, size, mm, view in self.file_maps):
+                return self.rebuild() # Mapped from a file, it can't be copied into the region
+            kept = {p: bytes(uc.mem_read(p, pageSize)) for p in self.sparse_pages if oldEnd <= p < newEnd}
+            for p in kept:
+                uc.mem_unmap(p, pageSize)
+                self.sparse_pages.discard(p)
+                self.mu_writable.discard(p)
+            uc.mem_map(oldEnd, newEnd - oldEnd, UC_PROT_READ|UC_PROT_EXEC)
+            for p, data in kept.items():
+                if data != zeroPage:
+                    uc.mem_write(p, data)
+        elif newEnd < oldEnd:
+            # Only written pages can hold anything, and only they can be put back by rewind or undo
+            kept = {p: bytes(uc.mem_read(p, pageSize)) for p in self.clean_pages if newEnd <= p < oldEnd}
+            uc.mem_unmap(newEnd, oldEnd - newEnd)
+            for p, data in kept.items():
+                uc.mem_map(p, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+                uc.mem_write(p, data)
+                self.sparse_pages.add(p)
+                self.mu_writable.discard(p)
+        self.mu_memsize = newEnd - self.base_addr
+        self.dis_cache = {}
+        self.dis_cached = 0
+    # setStackAddr - Point the stack register at emu/stackaddr, now and after a reset
+    def setStackAddr(self):
+        self.stack_addr = sConfig["emu/stackaddr"]
+        self.mu_ctx.reg_write(self.stack_reg, self.stack_addr)
+        self.checkpoints[0]["ctx"].reg_write(self.stack_reg, self.stack_addr)
+    # setSparse - Add or remove the hook that maps pages on first access
+    # Pages it already mapped stay mapped until a reset
+    def setSparse(self):
+        self.sparse = sConfig["emu/sparse"]
+        if self.sparse and self.sparse_hook is None:
+            # Only data accesses map pages, jumping to an unmapped address stays an error
+            self.sparse_hook = self.mu_ctx.hook_add(UC_HOOK_MEM_READ_UNMAPPED|UC_HOOK_MEM_WRITE_UNMAPPED, self.hookUnmapped)
+        elif not self.sparse and self.sparse_hook is not None:
+            self.mu_ctx.hook_del(self.sparse_hook)
+            self.sparse_hook = None
+    # showRegs - Print the registers again for an option that changes which are shown
+    def showRegs(self):
+        self.printRegs()
+    # savePage - Keep what a page looked like before it gets written
+    def savePage(self, page):
+        if page not in self.run_pages:
+            data = bytes(self.mu_ctx.mem_read(page, pageSize))
+            if data == zeroPage:
+                data = zeroPage # Share one copy for untouched pages, so big writes don't hold a copy of them all
+            self.run_pages[page] = data
+            self.clean_pages.setdefault(page, data)
+    # isMapped - Check a page is mapped, in the memory region, by sparse mode or from a file
+    def isMapped(self, page):
+        if self.base_addr <= page < self.base_addr + self.mu_memsize or page in self.sparse_pages:
+            return True
+        return any(address <= page < address + size for address, size, mm, view in self.file_maps)
+    # mapSparse - Map the pages in address..address+size that aren't mapped yet
+    # Returns False if sparse mode is off or emu/sparse_pages would be exceeded
+    def mapSparse(self, address, size):
+        if not self.sparse:
+            return False
+        memEnd = self.base_addr + self.mu_memsize
+        pages = [p for p in range(address & ~(pageSize-1), address + size, pageSize)
+                 if not (self.base_addr <= p < memEnd) and p not in self.sparse_pages]
+        if len(self.sparse_pages) + len(pages) > sConfig["emu/sparse_pages"]:
+            self.errPrint("mapSparse", f"emu/sparse_pages ({sConfig['emu/sparse_pages']}) reached mapping {address:#x}")
+            return False
+        for p in pages:
+            self.mu_ctx.mem_map(p, pageSize, UC_PROT_READ|UC_PROT_EXEC) # Write protected like the rest, see hookDirty
+            self.sparse_pages.add(p)
+        return True
+    def hookUnmapped(self, uc, access, address, size, value, user_data):
+        return self.mapSparse(address, size)
+    # memWrite - Write to emulator memory so rewind and reset can undo it
+    def memWrite(self, addr, data):
+        if self.sparse:
+            self.mapSparse(addr, len(data))
+        for page in range(addr & ~(pageSize-1), addr + len(data), pageSize):
+            self.savePage(page)
+        self.mu_ctx.mem_write(addr, data)
+    # memWriteFile - Write length bytes from offset in a host file to emulator memory
+    # The file is mmapped and written one io/chunk at a time, so only one chunk
+    # of it is copied at once. Returns the number of bytes written
+    def memWriteFile(self, addr, fname, offset=0, length=None):
+        with open(fname, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = size if length is None else min(size, offset + length)
+            if offset >= end:
+                return 0
+            chunk = sConfig["io/chunk"]
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for pos in range(offset, end, chunk):
+                    self.memWrite(addr + pos - offset, mm[pos:min(pos + chunk, end)])
+        return end - offset
+    # memReadFile - Save size bytes of emulator memory to a host file, one io/chunk at a time
+    # offset = where in the file to put them, the file is kept instead of truncated
+    def memReadFile(self, addr, size, fname, offset=None):
+        chunk = sConfig["io/chunk"]
+        with open(fname, "r+b" if offset is not None and os.path.exists(fname) else "wb") as f:
+            if offset is not None:
+                f.seek(offset)
+            for pos in range(0, size, chunk):
+                f.write(self.mu_ctx.mem_read(addr + pos, min(chunk, size - pos)))
+        return size
+    # loadBin - Load an ELF or a raw binary into a clean emulator, returns the entry point
+    # It replaces the program. ELF PT_LOAD segments go to their addresses and
+    # get a Linux style stack, see initStack. Anything else is raw code put at
+    # baseaddr, like a bin from /export.
+    def loadBin(self, fname):
+        elf = elfParse(fname)
+        if elf is not None:
+            if elf["arch"] != self.arch_name:
+                raise ValueError(f"{fname} is for {elf['arch'] or 'e_machine ' + str(elf['machine'])}, not {self.arch_name}")
+            if elf["interp"]:
+                raise ValueError(f"{fname} is dynamically linked, only static binaries can be loaded")
+        self.reset()
+        self.asm_code = []
+        self.machine_code = b""
+        if elf is None:
+            self.memWriteFile(self.base_addr, fname)
+            return self.base_addr
+        fileSize = os.path.getsize(fname)
+        for offset, vaddr, fileSz, memSz in elf["segments"]:
+            self.loadSegment(fname, fileSize, offset, vaddr, fileSz, memSz)
+        # The heap starts right after the image like on Linux, so brk can't map over it
+        end = max((vaddr + memSz for offset, vaddr, fileSz, memSz in elf["segments"]), default=sysBrkBase)
+        self.sys.brk = self.sys.brk_mapped = (end + pageSize - 1) & ~(pageSize-1)
+        self.initStack(fname, elf["entry"])
+        return elf["entry"]
+    # loadSegment - Map one PT_LOAD segment
+    # The whole pages of it that are in the file and not mapped yet are mapped
+    # straight from a private mmap of the file, without copying them. The
+    # rest, ex: segments in baseaddr..baseaddr+memsize, is copied like /write.
+    def loadSegment(self, fname, fileSize, offset, vaddr, fileSz, memSz):
+        inPage = vaddr & (pageSize-1)
+        start = vaddr - inPage
+        end = (vaddr + memSz + pageSize - 1) & ~(pageSize-1)
+        fileEnd = min(offset + fileSz, fileSize)
+        direct = 0
+        if offset & (pageSize-1) == inPage and fileEnd > offset:
+            direct = (fileEnd - (offset - inPage)) & ~(pageSize-1)
+            if any(self.isMapped(p) for p in range(start, start + direct, pageSize)):
+                direct = 0
+        if direct:
+            with open(fname, "rb") as f:
+                mm = mmap.mmap(f.fileno(), direct, access=mmap.ACCESS_COPY, offset=offset - inPage)
+            view = (ctypes.c_char * direct).from_buffer(mm)
+            # One region per page: hookDirty's mem_protect of a page inside a
+            # bigger mem_map_ptr region makes unicorn split it, which crashes
+            for p in range(0, direct, pageSize):
+                self.mu_ctx.mem_map_ptr(start + p, pageSize, UC_PROT_READ|UC_PROT_EXEC, ctypes.addressof(view) + p)
+            self.file_maps.append((start, direct, mm, view))
+        self.sys.mapPages(start + direct, end, zero=False)
+        copyAt = max(vaddr, start + direct)
+        if fileEnd > offset + (copyAt - vaddr):
+            self.memWriteFile(copyAt, fname, offset + (copyAt - vaddr), fileEnd - offset - (copyAt - vaddr))
+    # initStack - Map a stack for a loaded ELF and lay out argc, argv, envp and auxv on it
+    def initStack(self, fname, entry):
+        w = archez[self.arch_name]["asm"]["keystone"]["ptr_size"]
+        self.sys.mapPages(elfStackTop - elfStackSize, elfStackTop, zero=False)
+        argv0 = os.path.basename(fname).encode() + b"\0"
+        strAt = (elfStackTop - len(argv0) - 16) & ~15
+        randomAt = strAt - 16 # 16 bytes for the stack protector canary
+        auxv = [6, pageSize, 9, entry, 25, randomAt, 0, 0] # AT_PAGESZ, AT_ENTRY, AT_RANDOM, AT_NULL
+        words = [1, strAt, 0, 0] + auxv # argc, argv[0], NULL, no envp
+        sp = (randomAt - len(words) * w) & ~15
+        self.memWrite(strAt, argv0)
+        self.memWrite(randomAt, os.urandom(16))
+        self.memWrite(sp, b"".join(v.to_bytes(w, "little") for v in words))
+        self.mu_ctx.reg_write(self.stack_reg, sp)
+    # runBin - Run a binary from loadBin until it exits or stops
+    # Returns (pc, status) like run
+    def runBin(self, entry):
+        noEnd = (1 << (8 * archez[self.arch_name]["asm"]["keystone"]["ptr_size"])) - 1 # An address it can't get to
+        runStatus = 1
+        try:
+            try:
+                reason = self.emuStart(entry, noEnd)
+            finally:
+                self.checkpoint(0, False) # Typing code after it starts a new program from the clean state
+            runStatus = 2 if reason in ["timeout", "max_insns"] else 0
+            if runStatus == 2:
+                self.errPrint("run", f"Budget exhausted at PC={self.run_stats['pc']:#x} ({reason})")
+        except UcError as e:
+            self.errPrint("run", e)
+        self.mu_state = "RUN"
+        return self.mu_ctx.reg_read(self.ip_reg), runStatus
+    def hookDirty(self, uc, access, address, size, value, user_data):
+        # Save the pages before the write lands on them. Unicorn drops a write
+        # that hit a protected page, so it gets done here once they're writable.
+        for page in range(address & ~(pageSize-1), address + size, pageSize):
+            if page not in self.mu_writable:
+                self.savePage(page)
+                if self.undo.recording:
+                    self.undo.savePage(uc, page)
+                uc.mem_protect(page, pageSize, UC_PROT_ALL)
+                self.mu_writable.add(page)
+        uc.mem_write(address, (value & ((1 << (size*8)) - 1)).to_bytes(size, "little"))
+        return True
+    def rewind(self, n):
+        # Undo every run after checkpoint n, and any writes made since the last run
+        # A /stepback part way into a run goes back to the checkpoint before it too
+        back = n < len(self.checkpoints) - 1 or self.undo_mid
+        if back:
+            for page, data in self.run_pages.items():
+                self.mu_ctx.mem_write(page, data)
+            self.run_pages = {}
+        for cp in reversed(self.checkpoints[n+1:]):
+            for page, data in cp["pages"].items():
+                self.mu_ctx.mem_write(page, data)
+        if back:
+            self.mu_ctx.context_restore(self.checkpoints[n]["ctx"])
+            del self.checkpoints[n+1:]
+            self.undo.truncate(self.checkpoints[n]["undo"])
+            self.undo_mid = False
+    # undoTo - Cut the last run back to the end of code[:codeLen] with the undo log
+    # The run is undone from the first time it got to the new end of the code,
+    # which is where running only code[:codeLen] would have stopped. Returns
+    # False if the log can't show that, then rewind has to undo the whole run.
+    def undoTo(self, codeLen):
+        if len(self.checkpoints) < 2 or self.undo_mid:
+            return False
+        last, before = self.checkpoints[-1], self.checkpoints[-2]
+        if not last["ok"] or not (before["code_len"] < codeLen < last["code_len"]) or before["undo"] < self.undo.first:
+            return False
+        until = self.base_addr + codeLen
+        oldEnd = self.base_addr + last["code_len"]
+        records = self.undo.recordBlocks(before["undo"])
+        hit = None
+        for k, blocks in enumerate(records):
+            for address, size in blocks:
+                if address <= until < address + size:
+                    hit = k
+                    break
+                if until < address < oldEnd:
+                    return False # Ran the removed code without going through its start
+            if hit is not None:
+                break
+        else:
+            return False
+        for page, data in self.run_pages.items():
+            self.mu_ctx.mem_write(page, data)
+        self.run_pages = {}
+        # Back to the start of the record that got there, then on to until
+        for k in range(len(records) - hit):
+            rec = self.undo.popRecord()
+            self.undo.undoRecord(rec)
+        if rec[0] != until:
+            self.undo.replay(rec[0], until, rec[2])
+            if self.mu_ctx.reg_read(self.ip_reg) != until:
+                return False # rewind puts back the whole run
+            self.run_pages = {} # Only has pages the run wrote, last already has them from before it
+        # The removed code goes back to what was there before the run
+        for page in range(until & ~(pageSize-1), oldEnd, pageSize):
+            data = last["pages"].get(page)
+            if data is not None:
+                lo, hi = max(page, until), min(page + pageSize, oldEnd)
+                self.mu_ctx.mem_write(lo, data[lo-page:hi-page])
+        last.update({"code_len": codeLen, "ctx": self.mu_ctx.context_save(), "ok": True, "undo": self.undo.total})
+        return True
+    # stepBack - Undo the last n instructions with the undo log
+    # Runs that get undone lose their checkpoints. Unless this lands right at
+    # the end of a run, the next run goes back to the checkpoint before first.
+    # Returns how many instructions were undone
+    def stepBack(self, n):
+        self.mu_ctx.emu_stop()
+        done = self.undo.undo(n)
+        pos = self.undo.total
+        while len(self.checkpoints) > 1 and self.checkpoints[-1]["undo"] > pos:
+            cp = self.checkpoints.pop()
+            self.run_pages = {**self.run_pages, **cp["pages"]} # Keep the oldest contents
+        self.undo_mid = True
+        if pos == self.checkpoints[-1]["undo"]:
+            self.rewind(len(self.checkpoints) - 1) # Right at the end of a run, this also puts back the code the undone runs wrote
+        return done
+    def resumePoint(self, code):
+        # Find the last checkpoint made with the same code as the start of this code
+        oldCode = self.run_code
+        if code.startswith(oldCode):
+            same = len(oldCode)
+        else:
+            lo, hi = 0, min(len(code), len(oldCode))
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if code[:mid] == oldCode[:mid]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            same = lo
+        for n in range(len(self.checkpoints) - 1, -1, -1):
+            cp = self.checkpoints[n]
+            if cp["ok"] and cp["code_len"] <= same:
+                return n
+        return 0
+    def checkpoint(self, codeLen, ok):
+        self.checkpoints.append({"code_len": codeLen, "ctx": self.mu_ctx.context_save(), "pages": self.run_pages, "ok": ok, "undo": self.undo.total})
+        self.run_pages = {}
+        if len(self.checkpoints) > sConfig["emu/checkpoints"] and len(self.checkpoints) > 2:
+            # Fold the oldest run into the next one, keeping the older page contents
+            old = self.checkpoints.pop(1)
+            self.checkpoints[1]["pages"] = {**self.checkpoints[1]["pages"], **old["pages"]}
     def errPrint(self, eFunc, eMsg):
         print(f"{cErr}[[: {eFunc} Error :]]{cEnd}\n{eMsg}")
     def asm(self, asm_code):
         try:
             if self.arch_name in archez.keys():
-                ks = Ks(self.asm_arch, self.asm_mode)
                 self.asm_code = asm_code
-                asmJoined = "; ".join(self.asm_code)
-                mc, num = ks.asm(asmJoined)
-                self.machine_code = bytes(mc)
+                self.machine_code = self.asm_cache.assemble(self.asm_code)
                 return 0
             else:
                 print("Invalid Arch!")
@@ -764,42 +2127,238 @@ class scaremu:
             return 1
     def dis(self, memaddr, size):
         try:
-            instructionList = []
-            if self.arch_name in archez.keys():
-                csArch = self.dis_arch
-                csMode = self.dis_mode
-            else:
-                print("Invalid arch!")
-                return instructionList
-            scareDis = capstone.Cs(csArch, csMode)
-            memout = self.mu_ctx.mem_read(memaddr, size)
-            for insn in scareDis.disasm(memout, memaddr):
-                instructionList.append(f"{insn.mnemonic} {insn.op_str}")
-            return instructionList
+            return [text for addr, asmBytes, text in self.disIter(memaddr, size)]
         except Exception as e:
             self.errPrint("dis",e)
-            return instructionList
-    def run(self):
+            return []
+    # disIter - Disassemble size bytes at memaddr, one (address, bytes, text) per instruction
+    # Memory is read and decoded io/chunk bytes at a time with capstone's lite
+    # mode, so nothing is built for the whole range. It stops at the first
+    # instruction that doesn't decode, like capstone does. With dis/cache on,
+    # each chunk is hashed as it's read and a chunk that's unchanged since the
+    # range was last disassembled, with none changed before it, comes from
+    # dis_cache instead of capstone.
+    def disIter(self, memaddr, size):
+        uc = self.mu_ctx
+        chunk = max(sConfig["io/chunk"], 0x1000)
+        key = (memaddr, size, chunk) # Where the chunks split changes what each one holds
+        budget = sConfig["dis/cache"]
+        old = self.dis_cache.get(key, (0, ()))[1] if budget else ()
+        keep = [] if budget else None # (chunk hash, its instructions, bytes decoded, stopped) per chunk
+        kept = 0
+        cs = getCs(self.dis_arch, self.dis_mode)
+        tail = b""
+        for c, pos in enumerate(range(0, size, chunk)):
+            data = uc.mem_read(memaddr + pos, min(chunk, size - pos))
+            digest = None if keep is None else hashlib.blake2b(data, digest_size=16).digest()
+            buf = tail + bytes(data)
+            if c < len(old) and old[c][0] == digest:
+                digest, insns, offs, stopped = old[c]
+                yield from insns
+            else:
+                old = () # Later chunks decode from different bytes before them
+                start = memaddr + pos - len(tail)
+                # Only take instructions that had all the bytes they could need,
+                # so where the chunks split doesn't change what's decoded
+                limit = len(buf) if pos + chunk >= size else len(buf) - disMaxInsn
+                insns = [] if keep is not None else None
+                offs = 0
+                for addr, n, mnemonic, opStr in cs.disasm_lite(buf, start):
+                    if offs >= limit:
+                        break
+                    insn = (addr, buf[offs:offs+n], f"{mnemonic} {opStr}")
+                    offs += n
+                    if insns is not None:
+                        insns.append(insn)
+                    yield insn
+                stopped = offs < limit # On bytes that don't decode
+            if keep is not None:
+                keep.append((digest, insns, offs, stopped))
+                kept += len(insns)
+                if kept > budget:
+                    keep = None
+            if stopped:
+                break
+            tail = buf[offs:]
+        if keep is not None:
+            self.disCache(key, kept, keep)
+    # disCache - Keep a disassembled range, dropping the oldest ones past dis/cache instructions
+    def disCache(self, key, count, chunks):
+        old = self.dis_cache.pop(key, None)
+        if old is not None:
+            self.dis_cached -= old[0]
+        self.dis_cache[key] = (count, chunks)
+        self.dis_cached += count
+        while self.dis_cached > sConfig["dis/cache"]:
+            count, chunks = self.dis_cache.pop(next(iter(self.dis_cache)))
+            self.dis_cached -= count
+    # blockInsns - Number of instructions in a block, cached until the code changes
+    def blockInsns(self, uc, address, size):
+        nInsns = self.block_insns.get((address, size))
+        if nInsns is None:
+            countCs = getCs(self.dis_arch, self.dis_mode)
+            nInsns = sum(1 for i in countCs.disasm_lite(bytes(uc.mem_read(address, size)), address))
+            self.block_insns[(address, size)] = nInsns
+        return nInsns
+    def hookCount(self, uc, address, size, user_data):
+        # Count whole blocks, the number of instructions in each one is cached
+        self.run_insns += self.blockInsns(uc, address, size)
+        self.count_block = (address, size)
+    # emuStart - emu_start with the emu/timeout_us and emu/max_insns budgets
+    # Fills in run_stats with why the run stopped, the emulation time and, if
+    # emu/stats is on, the number of instructions executed
+    # Stop reasons: end, exit (the exit syscall), timeout, max_insns, stopped (ex: hlt), error
+    def emuStart(self, begin, until):
+        maxInsns = sConfig["emu/max_insns"]
+        self.run_stats = {"reason": "error", "insns": None, "time": 0.0, "pc": begin}
+        self.run_insns = 0
+        self.run_until = until
+        self.count_block = None # The last block hookCount counted
+        # A profile or trace records the run and counts instructions too,
+        # the trace isn't recorded while profiling. So does the undo log if
+        # neither of them is on.
+        recorder = self.profile
+        if recorder is None and self.trace is not None and self.trace.active:
+            recorder = self.trace
+        undo = self.undo if sConfig["undo/size"] else None
+        if recorder is not None:
+            hooks = recorder.start(self, begin, until)
+        elif sConfig["emu/stats"] and undo is None:
+            hooks = [self.mu_ctx.hook_add(UC_HOOK_BLOCK, self.hookCount)]
+        else:
+            hooks = []
+        if undo is not None:
+            hooks += undo.start(begin, until, recorder is None)
+        counted = bool(hooks)
+        sysOn = sConfig["sys/linux"]
+        if sysOn:
+            hooks += self.sys.start()
+        if self.breaks is not None:
+            hooks += self.breaks.start(self) # Empty without any points, with the defaults a run adds no hooks at all
+        tStart = time.perf_counter()
+        try:
+            self.mu_ctx.emu_start(begin, until, timeout=sConfig["emu/timeout_us"], count=maxInsns)
+        finally:
+            self.run_stats["time"] = time.perf_counter() - tStart
+            self.run_stats["pc"] = self.mu_ctx.reg_read(self.ip_reg)
+            for h in hooks:
+                self.mu_ctx.hook_del(h)
+            if self.breaks is not None:
+                self.breaks.stop(self)
+            if recorder is not None:
+                recorder.stop(self, self.run_stats["pc"], until)
+            if undo is not None:
+                undo.stop(self.run_stats["pc"], until)
+            if sysOn:
+                self.sys.stop()
+            if counted:
+                self.run_stats["insns"] = self.run_insns
+        if sysOn and self.sys.exit_code is not None:
+            self.run_stats["reason"] = "exit"
+            self.run_stats["exit"] = self.sys.exit_code
+        elif self.breaks is not None and self.breaks.hit is not None:
+            self.run_stats["reason"] = self.breaks.hit.split()[0] # break or watch
+            self.run_stats["hit"] = self.breaks.hit
+            if self.count_block is not None:
+                # Stopped part way into the block, take back the rest of it
+                address, size = self.count_block
+                pc = self.run_stats["pc"]
+                if address <= pc < address + size:
+                    self.run_insns -= self.blockInsns(self.mu_ctx, pc, address + size - pc)
+                    self.run_stats["insns"] = self.run_insns
+        elif self.run_stats["pc"] == until:
+            self.run_stats["reason"] = "end"
+        elif self.mu_ctx.query(UC_QUERY_TIMEOUT):
+            self.run_stats["reason"] = "timeout"
+        elif maxInsns and (self.run_insns >= maxInsns or not counted):
+            self.run_stats["reason"] = "max_insns"
+            self.run_stats["insns"] = maxInsns
+        else:
+            self.run_stats["reason"] = "stopped"
+        return self.run_stats["reason"]
+    # run - Run the machine code
+    # Picks up from the last checkpoint that still matches the code, so adding
+    # a line only runs that line. Earlier runs are undone if the code before the
+    # new part changed, full=True always starts again from the clean state.
+    # Returns (pc, status), status is 0 if ok, 1 on error, 2 if a budget ran out
+    def run(self, full=False):
         runStatus = 1
         try:
             self.mu_ctx.emu_stop()
-            if self.mu_state == "INIT":
-                self.mu_ctx = Uc(self.mu_arch, self.mu_mode)
-                self.mu_ctx.mem_map(self.base_addr, self.mu_memsize)
-            self.mu_ctx.mem_write(self.base_addr, self.machine_code) # map the code
-            self.mu_ctx.reg_write(self.stack_reg, self.stack_addr) # Initialize Stack
-            eStart = self.mu_ctx.emu_start(self.base_addr, self.base_addr + len(self.machine_code)) # start emulator
+            if self.mu_state == "INIT" or full:
+                self.reset()
+            code = self.machine_code
+            cpNum = self.resumePoint(code)
+            if cpNum < len(self.checkpoints) - 1 and self.run_code.startswith(code) and self.undoTo(len(code)):
+                cpNum = len(self.checkpoints) - 1 # Lines were taken off the end, see undoTo
+            self.rewind(cpNum)
+            start = self.checkpoints[cpNum]["code_len"]
+            if not code.startswith(self.run_code):
+                self.block_insns = {} # Blocks at the same address may hold other code now
+            self.run_code = code
+            for page in self.mu_writable:
+                self.mu_ctx.mem_protect(page, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+            self.mu_writable = set()
+            if start == 0:
+                self.mu_ctx.reg_write(self.stack_reg, self.stack_addr) # Initialize Stack
+            self.run_stats = {"reason": "end", "insns": 0, "time": 0.0, "pc": self.mu_ctx.reg_read(self.ip_reg)}
+            runStatus = 0
+            if start < len(code):
+                self.memWrite(self.base_addr + start, code[start:]) # map the new code
+                try:
+                    reason = self.emuStart(self.base_addr + start, self.base_addr + len(code)) # start emulator
+                except UcError:
+                    self.checkpoint(len(code), False)
+                    raise
+                self.checkpoint(len(code), reason == "end")
+                if reason == "timeout" or reason == "max_insns":
+                    self.errPrint("run", f"Budget exhausted at PC={self.run_stats['pc']:#x} ({reason})")
+                    runStatus = 2
             self.mu_state = "RUN"
-            return self.mu_ctx.reg_read(self.ip_reg), 0
+            return self.mu_ctx.reg_read(self.ip_reg), runStatus
         except UcError as e:
             self.errPrint("run",e)
             return self.mu_ctx.reg_read(self.ip_reg), 1
+    # cont - Carry on from a breakpoint or watchpoint to where the stopped run was going
+    # Points at the pc don't stop it the first time. Returns (pc, status) like run, or
+    # None if the last run didn't stop at one
+    def cont(self):
+        cp = self.checkpoints[-1]
+        if self.run_stats["reason"] not in ("break", "watch") or self.undo_mid or cp["ok"]:
+            return None
+        uc = self.mu_ctx
+        begin = uc.reg_read(self.ip_reg)
+        self.breaks.skip = begin
+        runStatus = 0
+        try:
+            reason = self.emuStart(begin, self.run_until)
+            if reason == "timeout" or reason == "max_insns":
+                self.errPrint("run", f"Budget exhausted at PC={self.run_stats['pc']:#x} ({reason})")
+                runStatus = 2
+        except UcError as e:
+            self.errPrint("run", e)
+            reason, runStatus = "error", 1
+        # The run goes on in the same checkpoint, pages it already wrote have their old contents there
+        cp.update({"ctx": uc.context_save(), "pages": {**self.run_pages, **cp["pages"]}, "ok": reason == "end", "undo": self.undo.total})
+        self.run_pages = {}
+        return uc.reg_read(self.ip_reg), runStatus
+    def printRunStats(self):
+        rs = self.run_stats
+        insns = "" if rs["insns"] is None else f"{rs['insns']} instructions " # Only counted with emu/stats
+        reason = f"exit {rs['exit']}" if rs["reason"] == "exit" else rs.get("hit", rs["reason"])
+        print(f"{cInfo}[[: {reason} :]]{cEnd} {insns}in {rs['time']*1000:.3f} ms")
     def stop(self):
         self.mu_ctx.emu_stop()
         self.mu_state = "INIT" # Switch back to initialized
-    def printRegs(self):
+    # printRegs - Print the register state in one write
+    # changed = only print registers that changed since the last printRegs
+    def printRegs(self, changed=False):
         try:
-            archez[self.arch_name]["funcs"]["reg_state"](self.mu_ctx, sConfig)
+            sets = archez[self.arch_name]["funcs"]["reg_sets"](sConfig)
+            vals = regSnapshot(self.mu_ctx, sets)
+            prevSets, prevVals = self.reg_prev
+            sys.stdout.write(regRender(sets, vals, prevVals if changed and prevSets == sets else None))
+            self.reg_prev = (sets, vals)
         except Exception as e:
             self.errPrint("printRegs",e)
         return
@@ -833,6 +2392,150 @@ class scaremu:
         print(f"│ {cInfo}   base_addr:{cEnd} {self.base_addr:08x}")
         print(f"│ {cInfo}  stack_addr:{cEnd} {self.stack_addr:08x}")
         print(f"│ {cInfo}    mem_size:{cEnd} {self.mu_memsize:08x}")
+        if self.sparse:
+            print(f"│ {cInfo}sparse_pages:{cEnd} {len(self.sparse_pages)}/{sConfig['emu/sparse_pages']}")
+        print(f"│ {cInfo}        undo:{cEnd} {self.undo.total - self.undo.first} instructions, {self.undo.words()*8}/{sConfig['undo/size']} bytes")
         print(f"│ {cInfo}    asm_code:{cEnd} {self.asm_code}")
         print(f"│ {cInfo}machine_code:{cEnd} {self.machine_code.hex()}")
         print(f"└ {cInfo}    mu_state:{cEnd} {self.mu_state}")
+    # Options that need something done to a running emulator, see setConfig
+    configHandlers = {
+        "emu/baseaddr": rebuild, # The code and everything it wrote would have to move
+        "emu/memsize": setMemsize,
+        "emu/stackaddr": setStackAddr,
+        "emu/sparse": setSparse,
+        "x86/xmm": showRegs,
+        "x86/ymm": showRegs,
+        "arm64/neon": showRegs,
+    }
+
+emuCache = {} # (arch, cpu) -> the last scaremu made for them
+
+# getEmu - Get a clean scaremu for an arch/cpu
+# The last one made for the same arch/cpu is reset and reused, unless one of
+# the emu/* options it was made with changed
+def getEmu(inArch, cpu):
+    smu = emuCache.get((inArch, cpu))
+    if smu is not None and smu.sameConfig():
+        engineOwner(smu.arch_name, smu.cpu)
+        smu.reset()
+        smu.asm_code = []
+        smu.machine_code = b""
+        return smu
+    smu = scaremu(inArch, cpu)
+    if hasattr(smu, "mu_ctx"):
+        emuCache[(inArch, cpu)] = smu
+    return smu
+
+### Snapshots ##################################################################
+# A snapshot is a gzip stream of:
+#   snapMagic, then a 4 byte length and the JSON header with the registers
+#   runs of non-zero pages, each an 8 byte address, 4 byte page count and the
+#   pages, ending with a run of 0 pages
+# Only pages that can hold anything but zeros are looked at, the ones written
+# since the reset and the ones mapped outside the memory region, so loading
+# one costs the size of what the program touched, not emu/memsize.
+snapMagic = b"SCARESNAP2\n"
+snapLevel = 1 # gzip level, the pages are mostly code, zeros and small numbers so more buys little
+
+snapRegSets = {"x64": ("x64", "ymm"), "x86": ("x86", "ymm"), "arm64": ("arm64", "neon"), "arm32": ("arm32",)}
+
+# snapRegs - The names of the registers a snapshot keeps for an arch, and a regreader for them
+# The main registers and all of the vector ones, whatever the config shows.
+# ymm has xmm in its low half, 32 bit x86 only has the first 8 of them.
+def snapRegs(arch):
+    cells = [(rs, name) for rs in snapRegSets[arch] for row in regLayouts[rs]["rows"] for label, name, regType in row]
+    if arch == "x86":
+        cells = [(rs, name) for rs, name in cells if rs != "ymm" or int(name[3:]) < 8]
+    reader = regreader(tuple(rNames[rs][name] for rs, name in cells), [regLayouts[rs]["size"] // 8 for rs, name in cells])
+    return [name for rs, name in cells], reader
+
+# snapPageRuns - Group sorted pages into (first page, count) runs
+def snapPageRuns(pages):
+    runs = []
+    for page in pages:
+        if runs and runs[-1][0] + runs[-1][1] * pageSize == page:
+            runs[-1][1] += 1
+        else:
+            runs.append([page, 1])
+    return runs
+
+# snapshotSave - Write the state of smu to fname
+# Returns the number of pages saved
+def snapshotSave(smu, fname):
+    uc = smu.mu_ctx
+    fileMapped = {p for address, size, mm, view in smu.file_maps for p in range(address, address + size, pageSize)}
+    cp = smu.checkpoints[-1]
+    regNames, regs = snapRegs(smu.arch_name)
+    header = {
+        "arch": smu.arch_name,
+        "cpu": smu.cpu,
+        "config": dict(sConfig),
+        "asm_code": smu.asm_code,
+        "machine_code": smu.machine_code.hex(),
+        "run_code": smu.run_code.hex(),
+        "code_len": cp["code_len"],
+        "ok": cp["ok"] and not smu.undo_mid,
+        "mapped": snapPageRuns(sorted(smu.sparse_pages | fileMapped)), # Pages outside the memory region
+        "sys": {"brk": smu.sys.brk, "brk_mapped": smu.sys.brk_mapped, "mmap_next": smu.sys.mmap_next, "stdin": smu.sys.stdin.hex()},
+        "regs": dict(zip(regNames, regs.read(uc))), # Through the register API, unicorn's contexts only load in the process that saved them
+    }
+    saved = 0
+    with gzip.open(fname, "wb", compresslevel=snapLevel) as f:
+        head = json.dumps(header).encode()
+        f.write(snapMagic + len(head).to_bytes(4, "little") + head)
+        for page, count in snapPageRuns(sorted(set(smu.clean_pages) | smu.sparse_pages | fileMapped)):
+            data = uc.mem_read(page, count * pageSize)
+            # Split the run where its pages are zero, they're left out
+            start = None
+            for n in range(count + 1):
+                zero = n == count or data[n*pageSize:(n+1)*pageSize] == zeroPage
+                if not zero and start is None:
+                    start = n
+                elif zero and start is not None:
+                    f.write((page + start * pageSize).to_bytes(8, "little") + (n - start).to_bytes(4, "little"))
+                    f.write(data[start*pageSize:n*pageSize])
+                    saved += n - start
+                    start = None
+        f.write(bytes(12))
+    return saved
+
+# snapshotLoad - Load a snapshot into a clean scaremu for its arch/cpu
+# sConfig gets the options it was saved with. The state is a checkpoint, so
+# lines typed after the load run on from it.
+# Returns the scaremu, it's in emuCache like one from getEmu
+def snapshotLoad(fname):
+    with gzip.open(fname, "rb") as f:
+        magic = f.read(len(snapMagic))
+        if magic != snapMagic:
+            raise ValueError(f"{fname} is from another version of scare" if magic.startswith(b"SCARESNAP") else f"{fname} isn't a snapshot")
+        header = json.loads(f.read(int.from_bytes(f.read(4), "little")))
+        for name, value in header["config"].items():
+            if name in sConfig: # Options that don't exist any more are dropped
+                sConfig[name] = value
+        sConfig["emu/arch"], sConfig["emu/cpu"] = header["arch"], header["cpu"] # The scaremu's own names, not an alias
+        smu = getEmu(header["arch"], header["cpu"])
+        if not hasattr(smu, "mu_ctx"):
+            raise ValueError(f"{fname} is for {header['arch']}/{header['cpu']}, which isn't supported")
+        uc = smu.mu_ctx
+        for page, count in header["mapped"]:
+            for p in range(page, page + count * pageSize, pageSize):
+                if not smu.isMapped(p):
+                    uc.mem_map(p, pageSize, UC_PROT_READ|UC_PROT_EXEC)
+                    smu.sparse_pages.add(p)
+        while True:
+            run = f.read(12)
+            count = int.from_bytes(run[8:], "little")
+            if len(run) < 12 or count == 0:
+                break
+            smu.memWrite(int.from_bytes(run[:8], "little"), f.read(count * pageSize))
+    regNames, regs = snapRegs(smu.arch_name)
+    regs.write(uc, [header["regs"][name] for name in regNames])
+    sysState = header["sys"]
+    smu.sys.brk, smu.sys.brk_mapped, smu.sys.mmap_next = sysState["brk"], sysState["brk_mapped"], sysState["mmap_next"]
+    smu.sys.stdin = bytearray.fromhex(sysState["stdin"])
+    smu.asm_code = header["asm_code"]
+    smu.machine_code = bytes.fromhex(header["machine_code"])
+    smu.run_code = bytes.fromhex(header["run_code"])
+    smu.checkpoint(header["code_len"], header["ok"])
+    return smu
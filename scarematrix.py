@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# scarematrix - Run the same machine code on every cpu model of an arch
+# Each model runs in a fresh scaremu inside a worker process. The results are
+# grouped by what they ended with, and only the registers, faults and memory
+# that differ between the groups are shown.
+from __future__ import print_function
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+from scarelib import *
+from scarebatch import batchCmd, batchInit, batchRegs
+
+matrixShow = 16 # Most bytes of a differing memory range shown per group
+
+# matrixCpus - The cpu models to run, all of the arch's named models if none are given
+def matrixCpus(arch, names=None):
+    cpus = archez[arch]["cpus"]
+    if not names:
+        return [c for c in cpus.keys() if c]
+    bad = [c for c in names if c not in cpus]
+    if bad:
+        raise ValueError(f"not {arch} cpus: {', '.join(bad)}\nSupported cpus: {', '.join(c for c in cpus.keys() if c)}")
+    return list(names)
+
+# matrixCpu - Run code on one cpu model, returns its result as a dict
+# mem has the contents of every page the run wrote or mapped
+def matrixCpu(job):
+    arch, cpu, code = job
+    rec = {"cpu": cpu}
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            smu = scaremu(arch, cpu)
+            smu.machine_code = code
+            pc, runStatus = smu.run(full=True)
+            rec["status"] = ["ok", "error", "budget"][runStatus]
+            rec["reason"] = smu.run_stats["reason"]
+            if "exit" in smu.run_stats:
+                rec["exit_code"] = smu.run_stats["exit"]
+            rec["pc"] = hex(pc)
+            rec["insns"] = smu.run_stats["insns"]
+            rec["regs"] = batchRegs(smu)
+            pages = sorted(smu.mu_writable | smu.sparse_pages)
+            rec["mem"] = {f"{page:#x}": bytes(smu.mu_ctx.mem_read(page, pageSize)).hex() for page in pages}
+    except Exception as e:
+        rec["status"] = "error"
+        rec["error"] = f"{e}"
+    out = output.getvalue().strip()
+    if out:
+        rec["output"] = out
+        if rec["status"] == "error" and "error" not in rec:
+            rec["error"] = out.splitlines()[-1] # The fault, after the [[: run Error :]] line
+    return rec
+
+# matrixRun - Run code on each cpu in a worker pool, returns the results in cpu order
+def matrixRun(arch, code, cpus, jobs=None):
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(cpus)))
+    with multiprocessing.Pool(jobs, initializer=batchInit, initargs=(dict(sConfig),)) as pool:
+        return pool.map(matrixCpu, [(arch, cpu, code) for cpu in cpus])
+
+# matrixLabel - Short name of result group n
+def matrixLabel(n):
+    return chr(ord("A") + n) if n < 26 else f"G{n}"
+
+# matrixMemDiff - Byte ranges of a page that differ between the groups
+# pages = the page's contents in each group, None where the group didn't touch it
+# Returns [(offset, length)...]
+def matrixMemDiff(pages):
+    touched = [p for p in pages if p is not None]
+    if len(touched) < len(pages):
+        return [(0, pageSize)] # Only some groups wrote the page, so all of it differs
+    if touched.count(touched[0]) == len(touched):
+        return []
+    ranges = []
+    start = None
+    for offs in range(pageSize + 1):
+        same = offs < pageSize and all(p[offs] == touched[0][offs] for p in touched)
+        if not same and offs < pageSize:
+            if start is None:
+                start = offs
+        elif start is not None:
+            ranges.append((start, offs - start))
+            start = None
+    return ranges
+
+# matrixReport - Print the results grouped by outcome and what differs between the groups
+# Returns the number of groups
+def matrixReport(arch, results):
+    groups = {}
+    for rec in results:
+        key = json.dumps([rec.get(k) for k in ("status", "reason", "exit_code", "pc", "error", "regs", "mem")])
+        groups.setdefault(key, []).append(rec)
+    groups = list(groups.values())
+    out = [f"{cInfo}[[: matrix {arch} :]]{cEnd} {len(results)} cpus, {len(groups)} {'result' if len(groups) == 1 else 'different results'}"]
+    for n, recs in enumerate(groups):
+        rec = recs[0]
+        how = rec.get("error") or (f"exit {rec['exit_code']}" if "exit_code" in rec else rec.get("reason", ""))
+        pc = f" pc={rec['pc']}" if "pc" in rec else ""
+        out.append(f"{cInfo}{matrixLabel(n):>3}{cEnd} {rec['status']} {how}{pc}  {', '.join(r['cpu'] for r in recs)}")
+    if len(groups) > 1:
+        firsts = [recs[0] for recs in groups]
+        names = []
+        for rec in firsts:
+            names += [k for k in rec.get("regs", {}) if k not in names]
+        for name in names:
+            vals = [rec.get("regs", {}).get(name, "-") for rec in firsts]
+            if len(set(vals)) > 1:
+                out.append(f"{cRegN}{name:>8}{cEnd}  " + "  ".join(f"{matrixLabel(n)}={v}" for n, v in enumerate(vals)))
+        pageKeys = sorted({p for rec in firsts for p in rec.get("mem", {})}, key=lambda p: int(p, 16))
+        for key in pageKeys:
+            pages = [bytes.fromhex(rec["mem"][key]) if key in rec.get("mem", {}) else None for rec in firsts]
+            for offs, length in matrixMemDiff(pages):
+                addr = int(key, 16) + offs
+                shown = min(length, matrixShow)
+                vals = ["-" if p is None else p[offs:offs+shown].hex() + ("..." if shown < length else "") for p in pages]
+                out.append(f"{cIP}{addr:08x}{cEnd}+{length:#x}  " + "  ".join(f"{matrixLabel(n)}={v}" for n, v in enumerate(vals)))
+    sys.stdout.write("".join(line + "\n" for line in out))
+    return len(groups)
+
+# matrixFile - Assemble an .asm file and run it on the cpus, for --matrix
+# Writes one JSON record per cpu to outFile if it's given.
+# Returns the number of different results, 0 if the file doesn't assemble
+def matrixFile(fname, cpus=None, outFile=None, jobs=None):
+    skipped = []
+    asmCode = loadAsm(fname, lambda c: batchCmd(c, skipped))
+    arch = sConfig["emu/arch"]
+    smu = scaremu(arch, "")
+    if smu.asm(asmCode) != 0:
+        return 0
+    try:
+        cpus = matrixCpus(arch, cpus)
+    except ValueError as e:
+        print(e)
+        return 0
+    results = matrixRun(arch, smu.machine_code, cpus, jobs)
+    if outFile:
+        with open(outFile, "w") as f:
+            f.write("".join(json.dumps(rec) + "\n" for rec in results))
+    return matrixReport(arch, results)
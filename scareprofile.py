@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# scareprofile - Per line execution profile of a program
+# Only whole blocks are counted while the program runs. Each block that ran is
+# disassembled once afterwards and its count goes to the source lines its
+# instructions came from, see listingMap.
+from __future__ import print_function
+import bisect
+from scarelib import *
+
+# scareprofile - Block counts for one run, see /profile
+class scareprofile:
+    def __init__(self, smu, top=20):
+        self.top = top      # Hot lines to show in the report
+        self.counts = {}    # (address, size) -> times the block ran
+        self.last = None    # The last block that ran, it may have stopped part way
+        self.blocks = {}    # (address, size) -> disassembly lite tuples, filled in by stop
+        self.hits = {}      # Instruction address -> times it ran, filled in by stop
+        self.cs_args = (smu.dis_arch, smu.dis_mode)
+    # Recording ################################################################
+    def start(self, smu, begin, until):
+        return [smu.mu_ctx.hook_add(UC_HOOK_BLOCK, self.hookBlock)]
+    def hookBlock(self, uc, address, size, user_data):
+        self.last = key = (address, size)
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+    def stop(self, smu, pc, until):
+        cs = getCs(*self.cs_args)
+        hits = self.hits
+        for key, n in self.counts.items():
+            insns = tuple(cs.disasm_lite(bytes(smu.mu_ctx.mem_read(*key)), key[0]))
+            self.blocks[key] = insns
+            for i in insns:
+                hits[i[0]] = hits.get(i[0], 0) + n
+        if self.last is not None and pc != until:
+            # Take back the part of the last block after where it stopped
+            addrs = [i[0] for i in self.blocks[self.last]]
+            if pc in addrs:
+                for a in addrs[addrs.index(pc):]:
+                    hits[a] -= 1
+        smu.run_insns += sum(hits.values())
+    # Report ###################################################################
+    # lineHits - Instructions run and times run for each line of the listing
+    # Returns ([(line number, line, insns, runs)...], instructions outside the listing)
+    def lineHits(self, smu, lineMap):
+        starts = [smu.base_addr + offs for l, offs, asmBytes in lineMap]
+        rows = [[n, l, 0, 0] for n, (l, offs, asmBytes) in enumerate(lineMap, 1)]
+        outside = 0
+        for addr, n in self.hits.items():
+            # Lines without bytes share their offset with the next line, the
+            # rightmost line at an offset is the one that has the instruction
+            idx = bisect.bisect_right(starts, addr) - 1
+            if idx < 0 or addr >= starts[idx] + len(lineMap[idx][2]):
+                outside += n
+                continue
+            rows[idx][2] += n
+            if addr == starts[idx]:
+                rows[idx][3] = n
+        return [tuple(r) for r in rows if r[2]], outside
+    # loops - Backward branches inside the program as (first address, branch address, times the branch ran)
+    # A branch is the last instruction of a block with an address as its last
+    # operand, so this is a heuristic that needs no capstone detail mode
+    def loops(self, smu):
+        codeEnd = smu.base_addr + len(smu.machine_code)
+        found = {}
+        for insns in self.blocks.values():
+            if not insns:
+                continue
+            addr, size, mnemonic, opStr = insns[-1]
+            try:
+                target = int(opStr.split(",")[-1].strip().lstrip("#"), 0)
+            except ValueError:
+                continue
+            if smu.base_addr <= target <= addr < codeEnd:
+                found[(target, addr)] = self.hits.get(addr, 0)
+        return sorted(((t, a, n) for (t, a), n in found.items()), key=lambda x: x[0])
+    def report(self, smu):
+        lineMap = listingMap(smu, smu.asm_code) or []
+        rows, outside = self.lineHits(smu, lineMap)
+        total = sum(r[2] for r in rows) + outside
+        share = total or 1
+        rs = smu.run_stats
+        out = [f"{cInfo}[[: profile :]]{cEnd} {total} instructions in {len(self.counts)} blocks, {sum(self.counts.values())} block runs, {rs['time']*1000:.3f} ms ({rs['reason']})"]
+        out.append(f"{'line':>4}  {'runs':>10} {'insns':>10} {'share':>7}  source")
+        for lineNum, line, insns, runs in sorted(rows, key=lambda r: (-r[2], r[0]))[:self.top]:
+            out.append(f"{cLnNum}{lineNum:04d}{cEnd}{cLnPipe}│{cEnd} {runs:>10} {insns:>10} {100*insns/share:6.2f}%  {cAsmList}{line}{cEnd}")
+        if outside:
+            out.append(f"{'':>4}│ {'':>10} {outside:>10} {100*outside/share:6.2f}%  {cComment}(outside the listing){cEnd}")
+        loops = self.loops(smu)
+        if loops:
+            lineOf = {smu.base_addr + offs: n for n, (l, offs, asmBytes) in enumerate(lineMap, 1) if asmBytes}
+            out.append(f"{cInfo}[[: loops :]]{cEnd}")
+            for target, addr, n in loops:
+                span = f"{lineOf[target]:04d}-{lineOf[addr]:04d}" if target in lineOf and addr in lineOf else f"{target:08x}-{addr:08x}"
+                out.append(f"{span}  {n:>10} iterations")
+        sys.stdout.write("".join(l + "\n" for l in out))
@@ -0,0 +1,326 @@
+#!/usr/bin/python
+# scareserve - Drive scaremu sessions over a local Unix socket
+# Clients send one JSON request per line and get one JSON reply per line.
+# Sessions live in worker processes, each worker owns the sessions it made, so
+# a long run only holds up the sessions on its own worker. The asyncio side
+# just routes requests and closes sessions that sat idle for serve/idle_s.
+from __future__ import print_function
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import stat
+import sys
+import time
+from scarelib import *
+from scarebatch import batchRegs
+
+serveLineMax = 0x1000000 # Longest request line, asm code and write data come inline
+
+#### Worker side ###############################################################
+
+serveSessions = {} # Session id -> {"smu": scaremu, "config": sConfig it runs with}
+serveDefaults = {} # sConfig as the worker started, every new session starts from it
+
+# serveAddr - An address from a request, a number, a number string or "$register"
+def serveAddr(smu, v):
+    if isinstance(v, int):
+        return v
+    if v.startswith("$"):
+        value = smu.readReg(v[1:])
+        if value is None:
+            raise ValueError(f"{v[1:]} isn't a {smu.arch_name} register")
+        return value
+    return int(v, 0)
+
+def serveInt(v):
+    return v if isinstance(v, int) else int(v, 0)
+
+# serveConfig - The options for a new session, serveDefaults with the request's config on top
+# Values are JSON of the option's type or text like /c takes, ex: "0x1000" or "on"
+def serveConfig(req):
+    config = dict(serveDefaults)
+    for name, value in req.get("config", {}).items():
+        if name not in config:
+            raise ValueError(f"unknown config option {name}")
+        kind = sConfigTypes.get(name, int)
+        if isinstance(value, str) and kind is not str:
+            try:
+                value = configParse(name, value)
+            except Exception:
+                raise ValueError(f"{name} takes {kind.__name__} values, not {value!r}")
+        elif kind is bool and type(value) is int and value in (0, 1):
+            value = bool(value)
+        elif type(value) is not kind:
+            raise ValueError(f"{name} takes {kind.__name__} values, not {value!r}")
+        config[name] = value
+    config["emu/arch"] = req.get("arch", config["emu/arch"])
+    config["emu/cpu"] = req.get("cpu", req.get("config", {}).get("emu/cpu", "")) # The default cpu may not be one of this arch's
+    if config["emu/arch"] not in archez or config["emu/cpu"] not in archez[config["emu/arch"]]["cpus"]:
+        raise ValueError(f"unsupported arch/cpu {config['emu/arch']}/{config['emu/cpu']}, supported arches: {list(archez.keys())}")
+    return config
+
+def serveNew(req):
+    config = serveConfig(req) # Checked before sConfig changes, a bad request leaves it alone
+    sConfig.clear()
+    sConfig.update(config)
+    smu = scaremu(config["emu/arch"], config["emu/cpu"])
+    serveSessions[req["session"]] = {"smu": smu, "config": config}
+    return {"arch": smu.arch_name, "cpu": smu.cpu, "base": smu.base_addr, "stack": smu.stack_addr}
+
+# serveAsm - Assemble code, a string or a list of lines, appended to the program with append
+# A program that doesn't assemble leaves the last one in place
+def serveAsm(smu, req):
+    code = req.get("code", [])
+    lines = code.splitlines() if isinstance(code, str) else list(code)
+    prev = smu.asm_code
+    if req.get("append"):
+        lines = prev + lines
+    if smu.asm(lines) != 0:
+        smu.asm_code = prev
+        raise ValueError("the code doesn't assemble")
+    return {"size": len(smu.machine_code), "code": smu.machine_code.hex()}
+
+# serveRunOp - Run the program, only the new code unless full, like a REPL line
+def serveRunOp(smu, req):
+    pc, runStatus = smu.run(full=req.get("full", False))
+    rs = smu.run_stats
+    res = {"status": ["ok", "error", "budget"][runStatus], "pc": hex(pc), "reason": rs["reason"],
+           "insns": rs["insns"], "emu_time": rs["time"], "regs": batchRegs(smu)}
+    if "exit" in rs:
+        res["exit_code"] = rs["exit"]
+    return res
+
+def serveRegs(smu, req):
+    names = req.get("names")
+    if not names:
+        return {"regs": batchRegs(smu)}
+    return {"regs": {n: hex(smu.mu_ctx.reg_read(smu.getReg(n))) for n in names}}
+
+def serveSetRegs(smu, req):
+    for name, value in req.get("regs", {}).items():
+        smu.mu_ctx.reg_write(smu.getReg(name), serveInt(value))
+    return {}
+
+def serveRead(smu, req):
+    return {"data": bytes(smu.mu_ctx.mem_read(serveAddr(smu, req["addr"]), serveInt(req["size"]))).hex()}
+
+def serveWrite(smu, req):
+    data = bytes.fromhex(req["data"])
+    smu.memWrite(serveAddr(smu, req["addr"]), data)
+    return {"size": len(data)}
+
+def serveDis(smu, req):
+    return {"insns": smu.dis(serveAddr(smu, req["addr"]), serveInt(req["size"]))}
+
+def serveReset(smu, req):
+    smu.reset()
+    smu.asm_code = []
+    smu.machine_code = b""
+    return {}
+
+def serveClose(smu, req):
+    del serveSessions[req["session"]]
+    return {}
+
+serveOps = {
+    "asm": serveAsm,
+    "run": serveRunOp,
+    "regs": serveRegs,
+    "setregs": serveSetRegs,
+    "read": serveRead,
+    "write": serveWrite,
+    "dis": serveDis,
+    "reset": serveReset,
+    "close": serveClose,
+}
+
+# serveOp - Do one request in the worker, returns the reply without its id
+# Anything scaremu prints, its errors and guest output, comes back as output
+def serveOp(req):
+    out = io.StringIO()
+    res = {"ok": True}
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            if req["op"] == "new":
+                res.update(serveNew(req))
+            else:
+                sess = serveSessions[req["session"]]
+                sConfig.clear()
+                sConfig.update(sess["config"])
+                smu = sess["smu"]
+                engineOwner(smu.arch_name, smu.cpu) # Sessions in a worker share the engine cache
+                res.update(serveOps[req["op"]](smu, req))
+    except Exception as e:
+        res = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    if out.getvalue():
+        res["output"] = out.getvalue()
+    return res
+
+def serveWorker(conn, config):
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # The server stops its workers by closing the pipe
+    sConfig.update(config)
+    serveDefaults.update(sConfig)
+    while True:
+        try:
+            req = conn.recv()
+        except EOFError:
+            break
+        conn.send(serveOp(req))
+
+#### Server side ###############################################################
+
+# serveproc - One worker process, requests go to it one at a time
+class serveproc:
+    def __init__(self, config):
+        self.conn, child = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=serveWorker, args=(child, config), daemon=True)
+        self.proc.start()
+        child.close()
+        self.lock = None     # Made in the event loop, see scareserve.serve
+        self.sessions = 0    # Sessions living in this worker
+    def roundTrip(self, req):
+        self.conn.send(req)
+        return self.conn.recv()
+    async def call(self, req):
+        async with self.lock:
+            try:
+                # The pipe blocks, so wait for it in a thread
+                return await asyncio.get_running_loop().run_in_executor(None, self.roundTrip, req)
+            except (EOFError, OSError) as e:
+                return {"ok": False, "error": f"worker exited: {e}"}
+    def close(self):
+        self.conn.close()
+        self.proc.join(1)
+        if self.proc.is_alive():
+            self.proc.terminate()
+
+# scareserve - The socket server, see "Server mode" in the README for the protocol
+class scareserve:
+    def __init__(self, path, jobs=None):
+        self.path = path
+        # Workers are forked before the event loop and its threads exist
+        self.workers = [serveproc(dict(sConfig)) for i in range(jobs or sConfig["serve/workers"] or os.cpu_count() or 1)]
+        self.sessions = {} # Session id -> {"worker", "lock", "used"}
+        self.next_id = 1
+    # request - Handle one decoded request, returns the reply without its id
+    async def request(self, req):
+        op = req.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "sessions":
+            now = time.monotonic()
+            return {"ok": True, "sessions": {sid: {"worker": self.workers.index(s["worker"]), "idle": now - s["used"],
+                                                   "busy": s["lock"].locked()} for sid, s in self.sessions.items()}}
+        if op == "new":
+            if len(self.sessions) >= sConfig["serve/sessions"]:
+                return {"ok": False, "error": f"too many sessions ({sConfig['serve/sessions']})"}
+            sid = self.next_id
+            self.next_id += 1
+            worker = min(self.workers, key=lambda w: w.sessions)
+            worker.sessions += 1
+            res = await worker.call({**req, "session": sid})
+            if not res["ok"]:
+                worker.sessions -= 1
+                return res
+            self.sessions[sid] = {"worker": worker, "lock": asyncio.Lock(), "used": time.monotonic()}
+            return {**res, "session": sid}
+        if op not in serveOps:
+            return {"ok": False, "error": f"unknown op {op}, ops: {['new', 'sessions', 'ping'] + list(serveOps)}"}
+        sid = req.get("session")
+        sess = self.sessions.get(sid)
+        if sess is None:
+            return {"ok": False, "error": f"no session {sid}"}
+        # One request at a time per session, in the order they came
+        async with sess["lock"]:
+            if sid not in self.sessions:
+                return {"ok": False, "error": f"no session {sid}"} # Closed while this one waited
+            sess["used"] = time.monotonic()
+            res = await sess["worker"].call(req)
+            sess["used"] = time.monotonic()
+            if op == "close":
+                self.dropSession(sid)
+        return res
+    def dropSession(self, sid):
+        self.sessions.pop(sid)["worker"].sessions -= 1
+    # reply - Answer one request line, replies carry the request's id
+    async def reply(self, line, writer, wlock):
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as e:
+            res, req = {"ok": False, "error": f"bad request: {e}"}, {}
+        else:
+            res = await self.request(req)
+        if "id" in req:
+            res["id"] = req["id"]
+        async with wlock:
+            writer.write((json.dumps(res) + "\n").encode())
+            await writer.drain()
+    # client - One connection, its requests are handled as they come in and
+    # may be answered out of order unless they're for the same session
+    async def client(self, reader, writer):
+        wlock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # Longer than serveLineMax
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(self.reply(line, writer, wlock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+    # evict - Close sessions nobody used for serve/idle_s
+    async def evict(self):
+        idle = sConfig["serve/idle_s"]
+        while True:
+            await asyncio.sleep(max(1, idle / 4))
+            now = time.monotonic()
+            for sid, sess in list(self.sessions.items()):
+                if not sess["lock"].locked() and now - sess["used"] > idle:
+                    async with sess["lock"]:
+                        if sid in self.sessions:
+                            await sess["worker"].call({"op": "close", "session": sid})
+                            self.dropSession(sid)
+    async def serve(self):
+        for w in self.workers:
+            w.lock = asyncio.Lock()
+        if os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode):
+            os.unlink(self.path) # Left behind by a server that didn't exit cleanly
+        server = await asyncio.start_unix_server(self.client, self.path, limit=serveLineMax)
+        os.chmod(self.path, 0o600)
+        sys.stderr.write(f"[[: serve :]] {self.path}, {len(self.workers)} workers\n")
+        tasks = [asyncio.create_task(self.evict())] if sConfig["serve/idle_s"] else []
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+    def close(self):
+        for w in self.workers:
+            w.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+# serveRun - Serve on the Unix socket at path until interrupted
+def serveRun(path, jobs=None):
+    srv = scareserve(path, jobs)
+    try:
+        asyncio.run(srv.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.close()
+    return 0
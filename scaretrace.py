@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# scaretrace - Instruction trace recorder for scaremu
+# Records go into arrays of 64 bit words, kept as a ring of fixed size chunks
+# and optionally streamed to a binary file, so no Python object is kept per
+# executed instruction.
+from __future__ import print_function
+import array
+import collections
+from scarelib import *
+
+traceChunkWords = 0x10000 # Words per chunk, a chunk is dropped or written out as a whole
+traceMagic = 0x3145434152544353 # "SCTRACE1"
+
+# Frames in a trace file, each one is [kind, number of words, words...]
+traceFrameRecords = 0 # Records, see scaretrace
+traceFrameBlocks  = 1 # Block definitions: [block id, number of instructions, addresses...]
+
+# scaretrace - Instruction trace
+# mode "pc":   one word per executed block, the block id. Blocks are
+#              disassembled once into the addresses of their instructions.
+# mode "regs": one record per instruction: [n, address, (reg, value) * n]
+#              with the registers of the arch's main set the instruction changed
+class scaretrace:
+    def __init__(self, smu, mode="pc", fname=None):
+        self.mode = mode
+        self.fname = fname
+        self.chunks = collections.deque() # (first step, words) of full chunks still kept
+        self.cur = array.array("Q")       # The chunk being filled
+        self.cur_step = 0                 # Step number of the first record in cur
+        self.cur_insns = 0                # Records in cur, regs mode
+        self.steps = 0                    # Steps in the full chunks, kept and dropped
+        self.dropped = 0                  # Steps in chunks dropped from the ring
+        self.blocks = []                  # Block id -> tuple of instruction addresses
+        self.block_ids = {}               # (address, size) -> block id, for the current run
+        self.blocks_saved = 0             # Blocks already written to the file
+        self.reg_set = archez[smu.arch_name]["funcs"]["reg_sets"](sConfig)[0]
+        # The pc changes every time, so it's left out of the register deltas
+        self.reg_names = [name for row in regLayouts[self.reg_set]["rows"] for label, name, regType in row if regType != 1]
+        self.reg_range = range(len(self.reg_names))
+        self.reader = regreader(tuple(rNames[self.reg_set][name] for name in self.reg_names),
+                                [max(8, regLayouts[self.reg_set]["size"] // 8)] * len(self.reg_names))
+        self.cs_args = (smu.dis_arch, smu.dis_mode)
+        self.out = None
+        self.active = True # Record runs, cleared by close
+        if fname:
+            self.out = open(fname, "wb")
+            array.array("Q", [traceMagic, 1 if mode == "regs" else 0]).tofile(self.out)
+    # Recording ################################################################
+    def start(self, smu, begin, until):
+        uc = smu.mu_ctx
+        self.smu = smu
+        self.block_ids = {} # Code may have changed since the last run
+        if self.mode == "regs":
+            self.pending = None
+            self.prev = self.reader.read(uc)
+            return [uc.hook_add(UC_HOOK_CODE, self.hookCode)]
+        self.mark = (len(self.chunks), len(self.cur), self.steps)
+        return [uc.hook_add(UC_HOOK_BLOCK, self.hookBlock)]
+    def stop(self, smu, pc, until):
+        if self.mode == "regs":
+            if self.pending is not None and pc != self.pending:
+                self.addInsn(self.reader.read(smu.mu_ctx))
+            elif self.pending is not None:
+                smu.run_insns -= 1 # Stopped before it, ex: it faulted
+            return
+        if (len(self.chunks), len(self.cur), self.steps) == self.mark:
+            return # No blocks ran
+        # The last block may have stopped part way, cut it at the pc
+        addrs = self.blocks[self.cur[-1]]
+        if pc != until and pc in addrs:
+            ran = addrs.index(pc)
+            smu.run_insns -= len(addrs) - ran
+            if ran == 0:
+                self.cur.pop()
+            else:
+                self.blocks.append(addrs[:ran])
+                self.cur[-1] = len(self.blocks) - 1
+    def hookBlock(self, uc, address, size, user_data):
+        bid = self.block_ids.get((address, size))
+        if bid is None:
+            cs = getCs(*self.cs_args)
+            addrs = tuple(i[0] for i in cs.disasm_lite(bytes(uc.mem_read(address, size)), address))
+            self.blocks.append(addrs)
+            bid = len(self.blocks) - 1
+            self.block_ids[(address, size)] = bid
+        if len(self.cur) >= traceChunkWords:
+            self.flush()
+        self.cur.append(bid)
+        self.smu.run_insns += len(self.blocks[bid])
+    def hookCode(self, uc, address, size, user_data):
+        vals = self.reader.read(uc)
+        if self.pending is not None:
+            self.addInsn(vals)
+        self.pending = address
+        self.smu.run_insns += 1
+    # addInsn - Record the pending instruction with the registers it changed
+    def addInsn(self, vals):
+        cur = self.cur
+        if len(cur) >= traceChunkWords:
+            self.flush()
+            cur = self.cur
+        prev = self.prev
+        self.prev = vals
+        self.cur_insns += 1
+        if vals == prev:
+            cur.append(0)
+            cur.append(self.pending)
+            return
+        changed = [n for n in self.reg_range if vals[n] != prev[n]]
+        cur.append(len(changed))
+        cur.append(self.pending)
+        for n in changed:
+            cur.append(n)
+            cur.append(vals[n])
+    # flush - Move the current chunk into the ring, and the file if there is one
+    def flush(self):
+        if not self.cur:
+            return
+        if self.out:
+            if self.mode == "pc" and self.blocks_saved < len(self.blocks):
+                defs = array.array("Q")
+                for bid in range(self.blocks_saved, len(self.blocks)):
+                    defs.append(bid)
+                    defs.append(len(self.blocks[bid]))
+                    defs.extend(self.blocks[bid])
+                array.array("Q", [traceFrameBlocks, len(defs)]).tofile(self.out)
+                defs.tofile(self.out)
+                self.blocks_saved = len(self.blocks)
+            array.array("Q", [traceFrameRecords, len(self.cur)]).tofile(self.out)
+            self.cur.tofile(self.out)
+        nSteps = self.cur_insns if self.mode == "regs" else self.chunkSteps(self.cur)
+        self.cur_insns = 0
+        self.chunks.append((self.cur_step, self.cur))
+        self.steps += nSteps
+        self.cur_step += nSteps
+        self.cur = array.array("Q")
+        while len(self.chunks) * traceChunkWords > sConfig["trace/size"] and len(self.chunks) > 1:
+            self.chunks.popleft()
+            self.dropped = self.chunks[0][0]
+    # close - Stop recording, what was recorded can still be queried
+    def close(self):
+        self.active = False
+        if self.out:
+            self.flush()
+            self.out.close()
+            self.out = None
+    # Reading ##################################################################
+    def chunkSteps(self, words):
+        if self.mode == "pc":
+            return sum(map(len, map(self.blocks.__getitem__, words)))
+        return sum(1 for r in self.records(words))
+    # records - Split regs mode words into (address, [(reg, value)...]) records
+    def records(self, words):
+        i = 0
+        while i < len(words):
+            n = words[i]
+            yield words[i+1], [(words[j], words[j+1]) for j in range(i+2, i+2+2*n, 2)]
+            i += 2 + 2*n
+    # windowChunks - (first step, words) for every chunk kept in memory, oldest first
+    def windowChunks(self):
+        yield from self.chunks
+        if self.cur:
+            yield self.cur_step, self.cur
+    # fileChunks - (first step, words) for every chunk in the trace file, oldest first
+    # Block definitions are skipped, blocks already has them
+    def fileChunks(self):
+        if self.out:
+            self.flush()
+            self.out.flush()
+        step = 0
+        with open(self.fname, "rb") as f:
+            f.seek(16)
+            while True:
+                head = array.array("Q")
+                try:
+                    head.fromfile(f, 2)
+                except EOFError:
+                    break
+                words = array.array("Q")
+                words.fromfile(f, head[1])
+                if head[0] == traceFrameRecords:
+                    yield step, words
+                    step += self.chunkSteps(words)
+    # allChunks - Every chunk of the trace, from the file if there is one
+    def allChunks(self):
+        return self.fileChunks() if self.fname else self.windowChunks()
+    # chunkInsns - (step, address, changed registers) for each instruction in a chunk
+    def chunkInsns(self, step, words):
+        if self.mode == "pc":
+            for bid in words:
+                for addr in self.blocks[bid]:
+                    yield step, addr, None
+                    step += 1
+        else:
+            for addr, changed in self.records(words):
+                yield step, addr, changed
+                step += 1
+    # Queries ##################################################################
+    # last - The last n instructions as (step, address, changed registers)
+    def last(self, n):
+        out = collections.deque(maxlen=n)
+        chunks = list(self.windowChunks())
+        need = 0
+        for first, words in reversed(chunks):
+            need += 1
+            if self.chunkSteps(words) >= n:
+                break
+        for first, words in chunks[-need:]:
+            out.extend(self.chunkInsns(first, words))
+        return list(out)
+    # firstHit - Step number and changed registers of the first time pc was addr
+    def firstHit(self, addr):
+        if self.mode == "pc":
+            bids = {bid for bid, addrs in enumerate(self.blocks) if addr in addrs}
+            for first, words in self.allChunks():
+                hits = [pos for pos in (wordIndex(words, bid) for bid in bids) if pos is not None]
+                if hits:
+                    pos = min(hits)
+                    return first + self.chunkSteps(words[:pos]) + self.blocks[words[pos]].index(addr), None
+            return None
+        for first, words in self.allChunks():
+            for step, a, changed in self.chunkInsns(first, words):
+                if a == addr:
+                    return step, changed
+        return None
+    # regHits - (step, address) of the instructions that set reg to value, at most limit of them
+    def regHits(self, reg, value, limit=16):
+        if self.mode != "regs":
+            return None
+        n = self.reg_names.index(reg)
+        hits = []
+        for first, words in self.allChunks():
+            for step, addr, changed in self.chunkInsns(first, words):
+                if (n, value) in changed:
+                    hits.append((step, addr))
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+    def info(self):
+        stepsNow = self.cur_step + (self.cur_insns if self.mode == "regs" else self.chunkSteps(self.cur))
+        words = sum(len(w) for f, w in self.windowChunks())
+        print(f"┌ {cInfo}  mode:{cEnd} {self.mode}")
+        print(f"│ {cInfo} steps:{cEnd} {stepsNow} ({stepsNow - self.dropped} kept)")
+        print(f"│ {cInfo} words:{cEnd} {words} / {sConfig['trace/size']}")
+        print(f"│ {cInfo}blocks:{cEnd} {len(self.blocks)}")
+        print(f"└ {cInfo}  file:{cEnd} {self.fname or '-'}")
+    # fmtInsn - One line of trace output
+    def fmtInsn(self, step, addr, changed, lineAt):
+        regs = " ".join(f"{self.reg_names[n]}={v:#x}" for n, v in changed or [])
+        return f"{cLnNum}{step:>10}{cLnPipe}│{cEnd} {cIP}{addr:08x}{cEnd} {cAsmList}{lineAt.get(addr, '')}{cEnd} {cGReg}{regs}{cEnd}".rstrip()
+
+# wordIndex - Position of the first word equal to w, or None
+def wordIndex(words, w):
+    try:
+        return words.index(w)
+    except ValueError:
+        return None